@@ -27,6 +27,8 @@ from qtpy.QtCore import QObject
 from urllib.parse import urlparse
 import ssl
 from .util.models import DictTableModel, ListTableModel
+from .util.network import export_object, check_shared_memory
+from .util.network import remove_stale_shared_memory_files
 import rpyc
 from rpyc.utils.server import ThreadedServer
 rpyc.core.protocol.DEFAULT_CONFIG['allow_pickle'] = True
@@ -121,6 +123,26 @@ class RemoteObjectManager(QObject):
                     else:
                         logger.error('Client requested a module that is not shared.')
                         return None
+
+            def exposed_export_object(self, obj, shared_memory=False):
+                """ Serialize an object for the client (see core.util.network.netobtain).
+
+                  @param object obj: object to export (local object of this qudi instance)
+                  @param bool shared_memory: pass large arrays via shared memory
+
+                  @return tuple: exported object as returned by core.util.network.export_object
+                """
+                return export_object(obj, shared_memory=bool(shared_memory))
+
+            def exposed_check_shared_memory(self, path, token):
+                """ Check if the client runs on the same host (see core.util.network).
+
+                  @param str path: path of the file created by the client
+                  @param str token: expected content of the file
+
+                  @return bool: True if arrays can be passed via shared memory
+                """
+                return check_shared_memory(path, token)
         return RemoteModuleService
 
     def createServer(self, hostname, port, certfile=None, keyfile=None, cacertfile=None):
@@ -128,6 +150,8 @@ class RemoteObjectManager(QObject):
 
           @param int port: port where the server should be running
         """
+        # Arrays exported to clients that died before importing them are never removed otherwise
+        remove_stale_shared_memory_files()
         thread = self.tm.newThread('rpyc-server')
         if certfile is not None and keyfile is not None:
             self.server = RPyCServer(
@@ -19,14 +19,214 @@ Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
 top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
 """
 
+import os
+import time
+import uuid
+import pickle
+import logging
+import tempfile
+import weakref
+import numpy as np
 import rpyc.core.netref
 import rpyc.utils.classic
 
+logger = logging.getLogger(__name__)
+
+# numpy arrays of at least this size (in bytes) are transferred without pickling
+ARRAY_TRANSPORT_THRESHOLD = 64 * 1024
+# prefix of the files used to pass arrays via shared memory
+SHARED_MEMORY_PREFIX = 'qudi_array_'
+# shared memory files older than this (in seconds) are left over from failed transfers
+SHARED_MEMORY_STALE_AGE = 3600
+
+# Array transport used for each rpyc connection. Values are tuples of
+# (remote export_object function, shared memory flag) or None if the remote side does not
+# support it.
+_transports = weakref.WeakKeyDictionary()
+
 
 def netobtain(obj):
-    """
+    """ Returns a local copy of obj if it is a reference to an object of a remote qudi instance.
+
+    Large numpy arrays are passed via shared memory if the remote qudi instance runs on the same
+    host and as raw binary data otherwise. All other objects are pickled.
+
+    @param object obj: local object or rpyc reference to a remote object
+
+    @return object: local object
     """
     if isinstance(obj, rpyc.core.netref.BaseNetref):
-        return rpyc.utils.classic.obtain(obj)
+        transport = _get_transport(obj)
+        if transport is None:
+            return rpyc.utils.classic.obtain(obj)
+        export_function, shared_memory = transport
+        return import_object(export_function(obj, shared_memory))
     else:
         return obj
+
+
+def get_shared_memory_dir():
+    """ Directory for the files holding arrays shared between processes. /dev/shm is memory backed
+    on POSIX systems, on other systems the temporary directory is used instead.
+
+    @return str: directory path
+    """
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def is_shared_memory_path(path):
+    """ Checks if path is a file of the array transport, i.e. a file with SHARED_MEMORY_PREFIX
+    directly in the shared memory directory.
+
+    @param str path: file path
+
+    @return bool: True if path is a file name of the array transport
+    """
+    path = os.path.abspath(str(path))
+    return os.path.dirname(path) == os.path.abspath(get_shared_memory_dir()) and \
+        os.path.basename(path).startswith(SHARED_MEMORY_PREFIX)
+
+
+def remove_stale_shared_memory_files(max_age=SHARED_MEMORY_STALE_AGE):
+    """ Removes the files of the array transport that were left behind, e.g. by a client that
+    died between export and import of an array. Only files older than max_age are removed, so
+    transfers in progress are not affected.
+
+    @param float max_age: minimum age of the removed files in seconds
+
+    @return int: number of removed files
+    """
+    directory = get_shared_memory_dir()
+    removed = 0
+    try:
+        filenames = os.listdir(directory)
+    except OSError:
+        return removed
+    now = time.time()
+    for filename in filenames:
+        if not filename.startswith(SHARED_MEMORY_PREFIX):
+            continue
+        path = os.path.join(directory, filename)
+        try:
+            if os.path.isfile(path) and now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    if removed:
+        logger.debug('Removed {0:d} stale shared memory files.'.format(removed))
+    return removed
+
+
+def export_object(obj, shared_memory=False):
+    """ Serializes an object to be imported by import_object on the other side of a connection.
+
+    @param object obj: object to export
+    @param bool shared_memory: Pass large numpy arrays via a shared memory file. Only possible
+                               if both sides run on the same host.
+
+    @return tuple: ('shm', file path), ('raw', dtype string, shape, bytes) or ('pickle', bytes)
+    """
+    if isinstance(obj, np.ndarray) and obj.dtype.fields is None and not obj.dtype.hasobject \
+            and obj.nbytes >= ARRAY_TRANSPORT_THRESHOLD:
+        if shared_memory:
+            path = os.path.join(get_shared_memory_dir(),
+                                '{0}{1}.npy'.format(SHARED_MEMORY_PREFIX, uuid.uuid4().hex))
+            shared_array = np.lib.format.open_memmap(path, mode='w+', dtype=obj.dtype,
+                                                     shape=obj.shape)
+            shared_array[...] = obj
+            shared_array.flush()
+            del shared_array
+            return 'shm', path
+        obj = np.ascontiguousarray(obj)
+        return 'raw', obj.dtype.str, tuple(obj.shape), obj.tobytes()
+    return 'pickle', pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def import_object(exported):
+    """ Creates the local object from the output of export_object.
+
+    @param tuple exported: output of export_object
+
+    @return object: the exported object
+    """
+    kind = exported[0]
+    if kind == 'shm':
+        path = exported[1]
+        # Only load and remove files of the array transport, never arbitrary files
+        if not is_shared_memory_path(path):
+            raise ValueError('Invalid shared memory file "{0}" received from remote qudi instance.'
+                             ''.format(path))
+        try:
+            if os.name == 'nt':
+                # Files can not be removed on Windows as long as they are mapped
+                return np.load(path)
+            # The mapping stays valid after the file has been removed
+            return np.load(path, mmap_mode='c').view(np.ndarray)
+        finally:
+            os.remove(path)
+    elif kind == 'raw':
+        dtype, shape, data = exported[1:]
+        return np.frombuffer(bytearray(data), dtype=dtype).reshape(shape)
+    return pickle.loads(exported[1])
+
+
+def check_shared_memory(path, token):
+    """ Checks if a file created by the other side of a connection can be read, i.e. if both
+    sides run on the same host and can exchange arrays via shared memory.
+
+    @param str path: path of the file created by the other side
+    @param str token: expected content of the file
+
+    @return bool: True if the file exists and contains token
+    """
+    if not is_shared_memory_path(path):
+        return False
+    try:
+        with open(path, 'r') as file:
+            return file.read() == str(token)
+    except OSError:
+        return False
+
+
+def _get_transport(netref):
+    """ Returns the array transport of the connection a remote object reference belongs to.
+    The capabilities of the remote side are checked once per connection.
+    """
+    conn = object.__getattribute__(netref, '____conn__')
+    if not hasattr(conn, 'root'):
+        # weak reference in older rpyc versions
+        conn = conn()
+    try:
+        return _transports[conn]
+    except KeyError:
+        pass
+    except TypeError:
+        return None
+
+    try:
+        root = conn.root
+        export_function = root.export_object
+        token = uuid.uuid4().hex
+        path = os.path.join(get_shared_memory_dir(),
+                            '{0}check_{1}'.format(SHARED_MEMORY_PREFIX, token))
+        with open(path, 'w') as file:
+            file.write(token)
+        try:
+            shared_memory = bool(root.check_shared_memory(path, token))
+        finally:
+            os.remove(path)
+        transport = (export_function, shared_memory)
+        logger.debug('Array transport to remote qudi instance: {0}'.format(
+            'shared memory' if shared_memory else 'binary'))
+    except AttributeError:
+        # Remote side does not provide the array transport
+        transport = None
+    except Exception:
+        logger.exception('Unable to set up array transport to remote qudi instance. Falling '
+                         'back to pickling.')
+        transport = None
+    _transports[conn] = transport
+    return transport
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the Qudi helpers to determine the percentiles of (live) images for the
+colour scales of image plots.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import math
+import numpy as np
+
+
+def _valid_values(data, ignore_zeros):
+    """ Flat array of the finite (and non-zero) values of data """
+    values = np.asarray(data).ravel()
+    if ignore_zeros:
+        values = values[values != 0]
+    if values.dtype.kind in 'fc':
+        values = values[np.isfinite(values)]
+    return values
+
+
+def data_percentiles(data, percentiles, ignore_zeros=True):
+    """ Exact percentiles (as numpy.percentile) of the finite values of data.
+
+    @param numpy.ndarray data: image or other data array
+    @param percentiles: percentile or sequence of percentiles (0 to 100)
+    @param bool ignore_zeros: exclude zeros (typically pixels of an unfinished scan)
+
+    @return: percentile(s) of the data. NaN if there are no values.
+    """
+    values = _valid_values(data, ignore_zeros)
+    if values.size == 0:
+        return np.full(np.shape(percentiles), np.nan)[()]
+    return np.percentile(values, percentiles)
+
+
+class IncrementalPercentile:
+    """
+    Percentiles of an image that is updated line by line, e.g. to set the colour scale of a
+    live scan image.
+
+    The values of the image are counted in a histogram of number_of_bins bins. With every update
+    only the lines that changed are removed from and added to the histogram, the rest of the image
+    is not looked at again (apart from a fast comparison to find the changed lines, unless they
+    are given). While the image is incomplete, the percentiles are estimated from the histogram
+    with an error smaller than the bin width (see max_error). The range of the histogram grows
+    with the values (by merging bins), so the error grows with the range of the values.
+    Once the image is complete, the percentiles are exact (as numpy.percentile) and cached until
+    the image changes.
+
+    To remove changed lines from the histogram, a copy of the image is kept. Images of which all
+    lines change with every update (e.g. a window sliding over a growing number of lines) are
+    better passed to rebuild, which skips the comparison and the copy.
+    """
+
+    def __init__(self, number_of_bins=4096, ignore_zeros=True):
+        """
+        @param int number_of_bins: number of histogram bins, defines the error of the estimates
+        @param bool ignore_zeros: exclude zeros (typically pixels of an unfinished scan)
+        """
+        # Even number of bins, so merging pairs of bins keeps the range aligned
+        self.number_of_bins = max(2, int(number_of_bins) + int(number_of_bins) % 2)
+        self.ignore_zeros = bool(ignore_zeros)
+        self._counts = np.zeros(self.number_of_bins, dtype=np.int64)
+        self.reset()
+        return
+
+    def reset(self):
+        """ Forgets the image and empties the histogram """
+        self._image = None
+        self._owns_image = False
+        self._rebuilt_from = None
+        self._complete = False
+        self._exact_cache = dict()
+        self._clear_histogram()
+        return
+
+    @property
+    def count(self):
+        """ Number of (non-zero) finite values of the image """
+        return self._total
+
+    @property
+    def is_complete(self):
+        return self._complete
+
+    @property
+    def max_error(self):
+        """ Upper bound of the error of the returned percentiles """
+        if self._complete or self._total == 0:
+            return 0.0
+        return self._bin_width
+
+    def update(self, image, rows=None, complete=False):
+        """ Updates the histogram with the lines of image that changed since the last update.
+
+        @param numpy.ndarray image: the image, lines along the first axis
+        @param rows: optional, index, slice or list of the changed lines. If not given, the changed
+                     lines are found by comparison to the last image.
+        @param bool complete: True if the image is complete (e.g. the scan has finished), the
+                              percentiles are exact then.
+        """
+        image = self._as_lines(image)
+        self._complete = bool(complete)
+        if self._image is None or not self._owns_image or self._image.shape != image.shape or \
+                self._image.dtype != image.dtype:
+            self.reset()
+            self._complete = bool(complete)
+            self._image = np.array(image)
+            self._owns_image = True
+            self._add(self._image)
+            return
+
+        if rows is None:
+            changed = np.flatnonzero(np.any(image != self._image, axis=1))
+        else:
+            changed = np.atleast_1d(np.arange(image.shape[0])[rows])
+        if changed.size == 0:
+            return
+        self._exact_cache.clear()
+        if changed.size == image.shape[0]:
+            # Everything changed (e.g. another image or a new scan), start from scratch
+            self._image[...] = image
+            self._clear_histogram()
+            self._add(self._image)
+            return
+        self._remove(self._image[changed])
+        self._image[changed] = image[changed]
+        self._add(self._image[changed])
+        return
+
+    def rebuild(self, image, complete=False):
+        """ Builds the histogram from the whole image, without comparing it to the last image and
+        without keeping a copy. Use this if all lines of the image change with every update.
+        The image must not be changed in place as long as its percentiles are requested. Passing
+        the same array again only updates complete.
+
+        @param numpy.ndarray image: the image, lines along the first axis
+        @param bool complete: True if the image is complete (e.g. the scan has finished), the
+                              percentiles are exact then.
+        """
+        if image is not self._rebuilt_from:
+            self.reset()
+            self._rebuilt_from = image
+            self._image = self._as_lines(image)
+            self._add(self._image)
+        self._complete = bool(complete)
+        return
+
+    def percentile(self, percentiles):
+        """ Percentiles of the image. Exact if the image is complete, else estimated from the
+        histogram with an error smaller than max_error.
+
+        @param percentiles: percentile or sequence of percentiles (0 to 100)
+
+        @return: percentile(s) of the image. NaN if there are no values.
+        """
+        if self._total == 0:
+            return np.full(np.shape(percentiles), np.nan)[()]
+        if self._complete:
+            key = tuple(np.ravel(percentiles))
+            if key not in self._exact_cache:
+                self._exact_cache[key] = data_percentiles(self._image, percentiles,
+                                                          self.ignore_zeros)
+            return self._exact_cache[key]
+        return self._estimate(np.asarray(percentiles, dtype=float))
+
+    def percentile_range(self, low_percentile, high_percentile):
+        """ Colour scale range [min, max] for the given percentiles """
+        return list(self.percentile([low_percentile, high_percentile]))
+
+    @staticmethod
+    def _as_lines(image):
+        image = np.asarray(image)
+        return image.reshape((image.shape[0] if image.ndim > 0 else 1, -1))
+
+    def _estimate(self, percentiles):
+        # Ranks of the values to interpolate between (as numpy.percentile with linear
+        # interpolation). Within a bin the values are assumed to be evenly spread.
+        position = np.clip(percentiles, 0, 100) / 100 * (self._total - 1)
+        lower_rank = np.floor(position)
+        upper_rank = np.minimum(lower_rank + 1, self._total - 1)
+        cumulative = np.cumsum(self._counts)
+        lower_value = self._rank_value(lower_rank, cumulative)
+        upper_value = self._rank_value(upper_rank, cumulative)
+        return lower_value + (position - lower_rank) * (upper_value - lower_value)
+
+    def _rank_value(self, rank, cumulative):
+        index = np.searchsorted(cumulative, rank, side='right')
+        in_bin = rank - (cumulative[index] - self._counts[index])
+        return (self._offset + index + (in_bin + 0.5) / self._counts[index]) * self._bin_width
+
+    def _clear_histogram(self):
+        self._counts[:] = 0
+        self._total = 0
+        # The bins are aligned to a grid of power of two widths: bin i covers
+        # [(offset + i) * width, (offset + i + 1) * width). Therefore the bin of a value is exactly
+        # the same before and after merging bins.
+        self._exponent = 0
+        self._offset = 0
+        return
+
+    @property
+    def _bin_width(self):
+        return math.ldexp(1.0, self._exponent)
+
+    def _grid_index(self, values):
+        return np.floor(np.ldexp(values.astype(float), -self._exponent)).astype(np.int64)
+
+    def _add(self, data):
+        values = _valid_values(data, self.ignore_zeros)
+        if values.size == 0:
+            return
+        self._fit_range(float(values.min()), float(values.max()))
+        self._counts += np.bincount(self._grid_index(values) - self._offset,
+                                    minlength=self.number_of_bins)
+        self._total += values.size
+        return
+
+    def _remove(self, data):
+        values = _valid_values(data, self.ignore_zeros)
+        if values.size == 0:
+            return
+        self._counts -= np.bincount(self._grid_index(values) - self._offset,
+                                    minlength=self.number_of_bins)
+        self._total -= values.size
+        if self._total == 0:
+            self._clear_histogram()
+        return
+
+    def _fit_range(self, min_value, max_value):
+        """ Sets up the bins (if the histogram is empty) or merges bins until the histogram covers
+        the values from min_value to max_value.
+        """
+        # Bins must not be finer than the resolution of the values, so the grid indices fit into
+        # 64 bit integers
+        magnitude = max(abs(min_value), abs(max_value))
+        min_exponent = math.frexp(magnitude)[1] - 52 if magnitude > 0 else -1074
+        if self._total == 0:
+            span = max_value - min_value
+            if span <= 0:
+                span = magnitude if magnitude > 0 else 1.0
+            self._exponent = max(math.frexp(span / (self.number_of_bins - 1))[1], min_exponent)
+            self._offset = int(math.floor(math.ldexp(min_value, -self._exponent)))
+            first_index = last_index = self._offset
+        else:
+            first_index = self._offset
+            last_index = self._offset + self.number_of_bins - 1
+        min_index = min(first_index, int(math.floor(math.ldexp(min_value, -self._exponent))))
+        max_index = max(last_index, int(math.floor(math.ldexp(max_value, -self._exponent))))
+        shift = max(0, min_exponent - self._exponent)
+        while (max_index >> shift) - (min_index >> shift) >= self.number_of_bins:
+            shift += 1
+        new_offset = min_index >> shift
+        if self._total > 0 and (shift > 0 or new_offset != self._offset):
+            old_index = (self._offset + np.arange(self.number_of_bins, dtype=np.int64)) >> shift
+            counts = np.zeros_like(self._counts)
+            np.add.at(counts, old_index - new_offset, self._counts)
+            self._counts = counts
+        self._exponent += shift
+        self._offset = new_offset
+        return
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the Qudi helper class to limit the rate of (GUI) updates.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import time
+from qtpy import QtCore
+
+
+class UpdateDispatcher(QtCore.QObject):
+    """
+    Coalesces update requests and calls an update slot at most max_rate times per second.
+
+    Connect the update signal (e.g. of a logic module) to request_update instead of the update
+    slot. Requests are cheap, so queued signals do not pile up in the event queue. The first
+    request after a quiet period is delivered right away. Further requests within 1/max_rate
+    seconds are merged: only the arguments of the last request are delivered when the interval
+    has passed, so the final state always reaches the slot. Each merged request is counted as
+    dropped frame.
+
+    The dispatcher must be created (and requested) in the thread the slot should run in.
+    """
+
+    def __init__(self, slot, max_rate=20, parent=None):
+        """
+        @param callable slot: update slot to call
+        @param float max_rate: maximum number of calls per second. 0 or None for no limit.
+        @param QObject parent: optional, Qt parent object
+        """
+        super().__init__(parent)
+        self._slot = slot
+        self._interval = 0
+        self.max_rate = max_rate
+        self._last_delivery = None
+        self._pending_args = None
+        self.delivered_frames = 0
+        self.dropped_frames = 0
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+        return
+
+    @property
+    def max_rate(self):
+        return 1 / self._interval if self._interval > 0 else 0
+
+    @max_rate.setter
+    def max_rate(self, rate):
+        self._interval = 1 / rate if rate else 0
+
+    @property
+    def statistics(self):
+        """ Number of delivered and dropped (merged) updates """
+        return {'delivered': self.delivered_frames, 'dropped': self.dropped_frames}
+
+    def request_update(self, *args):
+        """ Requests a call of the update slot with args (replacing args of pending requests) """
+        if self._pending_args is not None:
+            self.dropped_frames += 1
+        self._pending_args = args
+        if self._timer.isActive():
+            return
+        wait = 0 if self._last_delivery is None else \
+            self._last_delivery + self._interval - time.monotonic()
+        if wait <= 0:
+            self.flush()
+        else:
+            self._timer.start(int(wait * 1000) + 1)
+        return
+
+    def flush(self):
+        """ Calls the update slot right away if an update is pending """
+        self._timer.stop()
+        if self._pending_args is None:
+            return
+        args = self._pending_args
+        self._pending_args = None
+        self._last_delivery = time.monotonic()
+        self.delivered_frames += 1
+        self._slot(*args)
+        return
+
+    def stop(self):
+        """ Discards pending updates """
+        self._timer.stop()
+        self._pending_args = None
+        return
@@ -23,6 +23,7 @@ import os
 import pyqtgraph as pg
 
 from core.connector import Connector
+from core.util.percentile import IncrementalPercentile
 from gui.colordefs import QudiPalettePale as Palette
 from gui.guibase import GUIBase
 from gui.colordefs import ColorScaleInferno
@@ -95,6 +96,9 @@ class CameraGUI(GUIBase):
         self._logic = self.camera_logic()
         self._save_logic = self.savelogic()
 
+        # Percentiles of the displayed image for the colour scale
+        self._image_percentiles = IncrementalPercentile(ignore_zeros=False)
+
         # Windows
         self._mw = CameraWindow()
         self._mw.centralwidget.hide()
@@ -244,14 +248,13 @@ class CameraGUI(GUIBase):
 
         # Otherwise, calculate cb range from percentiles.
         else:
-            # xy_image_nonzero = self._image.image[np.nonzero(self._image.image)]
-
             # Read centile range
             low_centile = self._mw.xy_cb_low_percentile_DoubleSpinBox.value()
             high_centile = self._mw.xy_cb_high_percentile_DoubleSpinBox.value()
 
-            cb_min = np.percentile(self._image.image, low_centile)
-            cb_max = np.percentile(self._image.image, high_centile)
+            # Estimated while the video is running, exact for single images
+            self._image_percentiles.update(self._image.image, complete=not self._logic.enabled)
+            cb_min, cb_max = self._image_percentiles.percentile_range(low_centile, high_centile)
 
         cb_range = [cb_min, cb_max]
 
@@ -304,12 +307,14 @@ class CameraGUI(GUIBase):
         """ Run the save routine from the logic to save the xy confocal data."""
         cb_range = self.get_xy_cb_range()
 
-        # Percentile range is None, unless the percentile scaling is selected in GUI.
+        # Percentile range is None, unless the percentile scaling is selected in GUI. Then the
+        # logic calculates the cb range from the percentiles of the saved image.
         pcile_range = None
         if not self._mw.xy_cb_manual_RadioButton.isChecked():
             low_centile = self._mw.xy_cb_low_percentile_DoubleSpinBox.value()
             high_centile = self._mw.xy_cb_high_percentile_DoubleSpinBox.value()
             pcile_range = [low_centile, high_centile]
+            cb_range = None
 
         self._logic.save_xy_data(colorscale_range=cb_range, percentile_range=pcile_range)
 
@@ -28,6 +28,7 @@ import time
 from core.connector import Connector
 from core.configoption import ConfigOption
 from core.statusvariable import StatusVar
+from core.util.percentile import IncrementalPercentile
 from qtwidgets.scan_plotwidget import ScanImageItem
 from gui.guibase import GUIBase
 from gui.guiutils import ColorBar
@@ -153,6 +154,13 @@ class ConfocalGui(GUIBase):
 
         self._hardware_state = True
 
+        # Percentiles of the displayed images for the colour scales
+        self._xy_percentiles = IncrementalPercentile()
+        self._depth_percentiles = IncrementalPercentile()
+        # (image, channel, line counter) of the last percentile update during a scan
+        self._xy_percentiles_scan = None
+        self._depth_percentiles_scan = None
+
         self.initMainUI()      # initialize the main GUI
         self.initSettingsUI()  # initialize the settings GUI
         self.initOptimizerSettingsUI()  # initialize the optimizer settings GUI
@@ -489,11 +497,13 @@ class ConfocalGui(GUIBase):
         self._mw.depth_cb_high_percentile_DoubleSpinBox.valueChanged.connect(self.shortcut_to_depth_cb_centiles)
 
         # Connect the emitted signal of an image change from the logic with
-        # a refresh of the GUI picture:
-        self._scanning_logic.signal_xy_image_updated.connect(self.refresh_xy_image)
-        self._scanning_logic.signal_xy_image_updated.connect(self.refresh_scan_line)
-        self._scanning_logic.signal_depth_image_updated.connect(self.refresh_scan_line)
-        self._scanning_logic.signal_depth_image_updated.connect(self.refresh_depth_image)
+        # a refresh of the GUI picture (at most max_update_rate times per second):
+        self._xy_image_dispatcher = self.rate_limited(self.refresh_xy_scan)
+        self._depth_image_dispatcher = self.rate_limited(self.refresh_depth_scan)
+        self._scanning_logic.signal_xy_image_updated.connect(
+            self._xy_image_dispatcher.request_update)
+        self._scanning_logic.signal_depth_image_updated.connect(
+            self._depth_image_dispatcher.request_update)
         self._optimizer_logic.sigImageUpdated.connect(self.refresh_refocus_image)
         self._scanning_logic.sigImageXYInitialized.connect(self.adjust_xy_window)
         self._scanning_logic.sigImageDepthInitialized.connect(self.adjust_depth_window)
@@ -651,6 +661,12 @@ class ConfocalGui(GUIBase):
 
         @return int: error code (0:OK, -1:error)
         """
+        self._scanning_logic.signal_xy_image_updated.disconnect(
+            self._xy_image_dispatcher.request_update)
+        self._scanning_logic.signal_depth_image_updated.disconnect(
+            self._depth_image_dispatcher.request_update)
+        self._xy_image_dispatcher.stop()
+        self._depth_image_dispatcher.stop()
         self._mw.close()
         return 0
 
@@ -707,22 +723,28 @@ class ConfocalGui(GUIBase):
     def get_xy_cb_range(self):
         """ Determines the cb_min and cb_max values for the xy scan image
         """
+        # Update the percentiles with the scanned lines (zeros of the unfinished scan are
+        # excluded). They are estimated during the scan and exact when the scan is finished.
+        if not self._mw.xy_cb_manual_RadioButton.isChecked():
+            image = self._scanning_logic.xy_image
+            rows, self._xy_percentiles_scan = self._get_scanned_lines(
+                image, self.xy_channel, False, self._xy_percentiles_scan)
+            self._xy_percentiles.update(image[:, :, 3 + self.xy_channel],
+                                        rows=rows,
+                                        complete=self._scanning_logic.module_state() != 'locked')
+
         # If "Manual" is checked, or the image data is empty (all zeros), then take manual cb range.
-        if self._mw.xy_cb_manual_RadioButton.isChecked() or np.count_nonzero(self.xy_image.image) < 1:
+        if self._mw.xy_cb_manual_RadioButton.isChecked() or self._xy_percentiles.count < 1:
             cb_min = self._mw.xy_cb_min_DoubleSpinBox.value()
             cb_max = self._mw.xy_cb_max_DoubleSpinBox.value()
 
         # Otherwise, calculate cb range from percentiles.
         else:
-            # Exclude any zeros (which are typically due to unfinished scan)
-            xy_image_nonzero = self.xy_image.image[np.nonzero(self.xy_image.image)]
-
             # Read centile range
             low_centile = self._mw.xy_cb_low_percentile_DoubleSpinBox.value()
             high_centile = self._mw.xy_cb_high_percentile_DoubleSpinBox.value()
 
-            cb_min = np.percentile(xy_image_nonzero, low_centile)
-            cb_max = np.percentile(xy_image_nonzero, high_centile)
+            cb_min, cb_max = self._xy_percentiles.percentile_range(low_centile, high_centile)
 
         cb_range = [cb_min, cb_max]
 
@@ -731,26 +753,60 @@ class ConfocalGui(GUIBase):
     def get_depth_cb_range(self):
         """ Determines the cb_min and cb_max values for the xy scan image
         """
+        # Update the percentiles with the scanned lines (zeros of the unfinished scan are
+        # excluded). They are estimated during the scan and exact when the scan is finished.
+        if not self._mw.depth_cb_manual_RadioButton.isChecked():
+            image = self._scanning_logic.depth_image
+            rows, self._depth_percentiles_scan = self._get_scanned_lines(
+                image, self.depth_channel, True, self._depth_percentiles_scan)
+            self._depth_percentiles.update(
+                image[:, :, 3 + self.depth_channel],
+                rows=rows,
+                complete=self._scanning_logic.module_state() != 'locked')
+
         # If "Manual" is checked, or the image data is empty (all zeros), then take manual cb range.
-        if self._mw.depth_cb_manual_RadioButton.isChecked() or np.count_nonzero(self.depth_image.image) < 1:
+        if self._mw.depth_cb_manual_RadioButton.isChecked() or self._depth_percentiles.count < 1:
             cb_min = self._mw.depth_cb_min_DoubleSpinBox.value()
             cb_max = self._mw.depth_cb_max_DoubleSpinBox.value()
 
         # Otherwise, calculate cb range from percentiles.
         else:
-            # Exclude any zeros (which are typically due to unfinished scan)
-            depth_image_nonzero = self.depth_image.image[np.nonzero(self.depth_image.image)]
-
             # Read centile range
             low_centile = self._mw.depth_cb_low_percentile_DoubleSpinBox.value()
             high_centile = self._mw.depth_cb_high_percentile_DoubleSpinBox.value()
 
-            cb_min = np.percentile(depth_image_nonzero, low_centile)
-            cb_max = np.percentile(depth_image_nonzero, high_centile)
+            cb_min, cb_max = self._depth_percentiles.percentile_range(low_centile, high_centile)
 
         cb_range = [cb_min, cb_max]
         return cb_range
 
+    def _get_scanned_lines(self, image, channel, zscan, last_scan):
+        """ Determines the lines of a scan image that were scanned since the last update of its
+        percentiles, so only these lines have to be looked at.
+
+        @param ConfocalImage image: xy or depth image of the scanning logic
+        @param int channel: displayed count channel
+        @param bool zscan: True for the depth image, False for the xy image
+        @param tuple last_scan: (image, channel, line counter) returned by the last call or None
+
+        @return tuple: (rows, scan), rows of the image to update (None to compare the whole image)
+                       and the (image, channel, line counter) to pass to the next call
+        """
+        if self._scanning_logic.module_state() != 'locked' or \
+                self._scanning_logic._zscan != zscan:
+            return None, None
+        # Lines before the line counter are complete
+        line = self._scanning_logic._scan_counter
+        scan = (image, channel, line)
+        if last_scan is None or last_scan[0] is not image or last_scan[1] != channel:
+            # New or continued scan, or another channel
+            return None, scan
+        last_line = last_scan[2]
+        if line >= last_line:
+            return list(range(last_line, line)), scan
+        # The permanent scan started again from the first line
+        return list(range(last_line, image.shape[0])) + list(range(line)), scan
+
     def refresh_xy_colorbar(self):
         """ Adjust the xy colorbar.
 
@@ -1380,6 +1436,16 @@ class ConfocalGui(GUIBase):
         self.refresh_depth_colorbar()
         self.refresh_depth_image()
 
+    def refresh_xy_scan(self):
+        """ Update the XY image and the scan line after a line of the XY scan. """
+        self.refresh_xy_image()
+        self.refresh_scan_line()
+
+    def refresh_depth_scan(self):
+        """ Update the scan line and the depth image after a line of the depth scan. """
+        self.refresh_scan_line()
+        self.refresh_depth_image()
+
     def refresh_xy_image(self):
         """ Update the current XY image from the logic.
 
@@ -1589,12 +1655,14 @@ class ConfocalGui(GUIBase):
 
         cb_range = self.get_xy_cb_range()
 
-        # Percentile range is None, unless the percentile scaling is selected in GUI.
+        # Percentile range is None, unless the percentile scaling is selected in GUI. Then the
+        # logic calculates the cb range from the percentiles of the saved data.
         pcile_range = None
         if not self._mw.xy_cb_manual_RadioButton.isChecked():
             low_centile = self._mw.xy_cb_low_percentile_DoubleSpinBox.value()
             high_centile = self._mw.xy_cb_high_percentile_DoubleSpinBox.value()
             pcile_range = [low_centile, high_centile]
+            cb_range = None
 
         self._scanning_logic.save_xy_data(colorscale_range=cb_range, percentile_range=pcile_range, block=False)
 
@@ -1621,12 +1689,14 @@ class ConfocalGui(GUIBase):
 
         cb_range = self.get_depth_cb_range()
 
-        # Percentile range is None, unless the percentile scaling is selected in GUI.
+        # Percentile range is None, unless the percentile scaling is selected in GUI. Then the
+        # logic calculates the cb range from the percentiles of the saved data.
         pcile_range = None
         if not self._mw.depth_cb_manual_RadioButton.isChecked():
             low_centile = self._mw.depth_cb_low_percentile_DoubleSpinBox.value()
             high_centile = self._mw.depth_cb_high_percentile_DoubleSpinBox.value()
             pcile_range = [low_centile, high_centile]
+            cb_range = None
 
         self._scanning_logic.save_depth_data(colorscale_range=cb_range, percentile_range=pcile_range, block=False)
 
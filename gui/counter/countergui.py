@@ -176,7 +176,9 @@ class CounterGui(GUIBase):
         ##################
         # Handling signals from the logic
 
-        self._counting_logic.sigCounterUpdated.connect(self.updateData)
+        # The plot is redrawn at most max_update_rate times per second
+        self._counter_dispatcher = self.rate_limited(self.updateData)
+        self._counting_logic.sigCounterUpdated.connect(self._counter_dispatcher.request_update)
 
         # ToDo:
         # self._counting_logic.sigCountContinuousNext.connect()
@@ -246,6 +248,7 @@ class CounterGui(GUIBase):
         self.sigStartCounter.disconnect()
         self.sigStopCounter.disconnect()
         self._counting_logic.sigCounterUpdated.disconnect()
+        self._counter_dispatcher.stop()
         self._counting_logic.sigCountingSamplesChanged.disconnect()
         self._counting_logic.sigCountLengthChanged.disconnect()
         self._counting_logic.sigCountFrequencyChanged.disconnect()
@@ -22,6 +22,8 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 
 from qtpy.QtCore import QObject
 from core.module import BaseMixin
+from core.configoption import ConfigOption
+from core.util.update_dispatcher import UpdateDispatcher
 import warnings
 
 
@@ -29,6 +31,33 @@ class GUIBaseMixin(BaseMixin):
     """This is the GUI base class. It provides functions that every GUI module should have.
     """
 
+    # Maximum number of updates per second of views updated via rate_limited
+    _max_update_rate = ConfigOption('max_update_rate', 20, missing='nothing')
+
+    def rate_limited(self, slot, max_rate=None):
+        """ Creates an UpdateDispatcher calling slot at most max_rate times per second.
+        Connect the update signal to the request_update method of the dispatcher.
+
+        @param callable slot: the update slot of the view
+        @param float max_rate: optional, maximum number of updates per second. Defaults to the
+                               config option max_update_rate.
+
+        @return UpdateDispatcher: the dispatcher
+        """
+        if max_rate is None:
+            max_rate = self._max_update_rate
+        dispatcher = UpdateDispatcher(slot, max_rate, self if isinstance(self, QObject) else None)
+        if not hasattr(self, '_update_dispatchers'):
+            self._update_dispatchers = dict()
+        self._update_dispatchers[getattr(slot, '__name__', repr(slot))] = dispatcher
+        return dispatcher
+
+    @property
+    def update_statistics(self):
+        """ Number of delivered and dropped updates of each view updated via rate_limited """
+        return {name: dispatcher.statistics
+                for name, dispatcher in getattr(self, '_update_dispatchers', dict()).items()}
+
     def show(self):
         warnings.warn('Every GUI module needs to reimplement the show() '
                 'function!')
@@ -25,6 +25,7 @@ import pyqtgraph as pg
 
 from core.connector import Connector
 from core.util import units
+from core.util.percentile import IncrementalPercentile
 from gui.guibase import GUIBase
 from gui.guiutils import ColorBar
 from gui.colordefs import ColorScaleInferno
@@ -106,6 +107,9 @@ class ODMRGui(GUIBase):
 
         self._odmr_logic = self.odmrlogic1()
 
+        # Percentiles of the displayed matrix for the colour scale
+        self._matrix_percentiles = IncrementalPercentile()
+
         # Use the inherited class 'Ui_ODMRGuiUI' to create now the GUI element:
         self._mw = ODMRMainWindow()
         self._sd = ODMRSettingDialog()
@@ -395,7 +399,10 @@ class ODMRGui(GUIBase):
                                                      QtCore.Qt.QueuedConnection)
         self._odmr_logic.sigOutputStateUpdated.connect(self.update_status,
                                                        QtCore.Qt.QueuedConnection)
-        self._odmr_logic.sigOdmrPlotsUpdated.connect(self.update_plots, QtCore.Qt.QueuedConnection)
+        # The plots are redrawn at most max_update_rate times per second
+        self._odmr_plots_dispatcher = self.rate_limited(self.update_plots)
+        self._odmr_logic.sigOdmrPlotsUpdated.connect(self._odmr_plots_dispatcher.request_update,
+                                                     QtCore.Qt.QueuedConnection)
         self._odmr_logic.sigOdmrFitUpdated.connect(self.update_fit, QtCore.Qt.QueuedConnection)
         self._odmr_logic.sigOdmrElapsedTimeUpdated.connect(self.update_elapsedtime,
                                                            QtCore.Qt.QueuedConnection)
@@ -424,6 +431,7 @@ class ODMRGui(GUIBase):
         self._odmr_logic.sigParameterUpdated.disconnect()
         self._odmr_logic.sigOutputStateUpdated.disconnect()
         self._odmr_logic.sigOdmrPlotsUpdated.disconnect()
+        self._odmr_plots_dispatcher.stop()
         self._odmr_logic.sigOdmrFitUpdated.disconnect()
         self._odmr_logic.sigOdmrElapsedTimeUpdated.disconnect()
         self.sigCwMwOn.disconnect()
@@ -820,9 +828,10 @@ class ODMRGui(GUIBase):
         # Update mean signal plot
         self.odmr_image.setData(odmr_data_x, odmr_data_y[self.display_channel])
         # Update raw data matrix plot
-        cb_range = self.get_matrix_cb_range()
-        self.update_colorbar(cb_range)
         matrix_range = self._mw.odmr_control_DockWidget.matrix_range_SpinBox.value()
+        odmr_matrix_range = self._odmr_logic.select_odmr_matrix_data(odmr_matrix, self.display_channel, matrix_range)
+        cb_range = self.get_matrix_cb_range(odmr_matrix_range)
+        self.update_colorbar(cb_range)
         start = self._odmr_logic.mw_starts[matrix_range]
         step = self._odmr_logic.mw_steps[matrix_range]
         stop = self._odmr_logic.mw_stops[matrix_range]
@@ -836,7 +845,6 @@ class ODMRGui(GUIBase):
                 odmr_matrix.shape[0])
         )
 
-        odmr_matrix_range = self._odmr_logic.select_odmr_matrix_data(odmr_matrix, self.display_channel, matrix_range)
         self.odmr_matrix_image.setImage(
             image=odmr_matrix_range,
             axisOrder='row-major',
@@ -876,27 +884,35 @@ class ODMRGui(GUIBase):
         self.odmr_cb.refresh_colorbar(cb_range[0], cb_range[1])
         return
 
-    def get_matrix_cb_range(self):
+    def get_matrix_cb_range(self, matrix_image=None):
         """
         Determines the cb_min and cb_max values for the matrix plot
+
+        @param numpy.ndarray matrix_image: optional, the matrix to display. Defaults to the
+                                           currently displayed matrix.
         """
-        matrix_image = self.odmr_matrix_image.image
+        if matrix_image is None:
+            matrix_image = self.odmr_matrix_image.image
+
+        # Update the percentiles of the matrix (zeros of the unfinished scan are excluded). They
+        # are estimated during the measurement and exact when it has stopped. The matrix is a
+        # window sliding over the sweeps, i.e. all its lines change with every sweep, so the
+        # histogram is rebuilt instead of updated line by line.
+        if not self._mw.odmr_cb_manual_RadioButton.isChecked():
+            self._matrix_percentiles.rebuild(
+                matrix_image, complete=self._odmr_logic.module_state() != 'locked')
 
         # If "Manual" is checked or the image is empty (all zeros), then take manual cb range.
         # Otherwise, calculate cb range from percentiles.
-        if self._mw.odmr_cb_manual_RadioButton.isChecked() or np.count_nonzero(matrix_image) < 1:
+        if self._mw.odmr_cb_manual_RadioButton.isChecked() or self._matrix_percentiles.count < 1:
             cb_min = self._mw.odmr_cb_min_DoubleSpinBox.value()
             cb_max = self._mw.odmr_cb_max_DoubleSpinBox.value()
         else:
-            # Exclude any zeros (which are typically due to unfinished scan)
-            matrix_image_nonzero = matrix_image[np.nonzero(matrix_image)]
-
             # Read centile range
             low_centile = self._mw.odmr_cb_low_percentile_DoubleSpinBox.value()
             high_centile = self._mw.odmr_cb_high_percentile_DoubleSpinBox.value()
 
-            cb_min = np.percentile(matrix_image_nonzero, low_centile)
-            cb_max = np.percentile(matrix_image_nonzero, high_centile)
+            cb_min, cb_max = self._matrix_percentiles.percentile_range(low_centile, high_centile)
 
         cb_range = [cb_min, cb_max]
         return cb_range
@@ -1127,12 +1143,14 @@ class ODMRGui(GUIBase):
         filetag = self._mw.save_tag_LineEdit.text()
         cb_range = self.get_matrix_cb_range()
 
-        # Percentile range is None, unless the percentile scaling is selected in GUI.
+        # Percentile range is None, unless the percentile scaling is selected in GUI. Then the
+        # logic calculates the cb range from the percentiles of the saved matrices.
         pcile_range = None
         if self._mw.odmr_cb_centiles_RadioButton.isChecked():
             low_centile = self._mw.odmr_cb_low_percentile_DoubleSpinBox.value()
             high_centile = self._mw.odmr_cb_high_percentile_DoubleSpinBox.value()
             pcile_range = [low_centile, high_centile]
+            cb_range = None
 
         self.sigSaveMeasurement.emit(filetag, cb_range, pcile_range)
         return
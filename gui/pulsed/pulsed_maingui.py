@@ -416,7 +416,10 @@ class PulsedMeasurementGui(GUIBase):
 
     def _connect_logic_signals(self):
         # Connect update signals from pulsed_master_logic
-        self.pulsedmasterlogic().sigMeasurementDataUpdated.connect(self.measurement_data_updated)
+        # The plots are redrawn at most max_update_rate times per second
+        self._measurement_data_dispatcher = self.rate_limited(self.measurement_data_updated)
+        self.pulsedmasterlogic().sigMeasurementDataUpdated.connect(
+            self._measurement_data_dispatcher.request_update)
         self.pulsedmasterlogic().sigTimerUpdated.connect(self.measurement_timer_updated)
         self.pulsedmasterlogic().sigFitUpdated.connect(self.fit_data_updated)
         self.pulsedmasterlogic().sigMeasurementStatusUpdated.connect(self.measurement_status_updated)
@@ -582,6 +585,7 @@ class PulsedMeasurementGui(GUIBase):
     def _disconnect_logic_signals(self):
         # Disconnect update signals from pulsed_master_logic
         self.pulsedmasterlogic().sigMeasurementDataUpdated.disconnect()
+        self._measurement_data_dispatcher.stop()
         self.pulsedmasterlogic().sigTimerUpdated.disconnect()
         self.pulsedmasterlogic().sigFitUpdated.disconnect()
         self.pulsedmasterlogic().sigMeasurementStatusUpdated.disconnect()
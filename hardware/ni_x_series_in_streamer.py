@@ -642,7 +642,8 @@ class NIXSeriesInStreamer(Base, DataInStreamInterface):
                                ''.format(self.number_of_channels, buffer.shape[0]))
                 return -1
             number_of_samples = buffer.shape[1] if number_of_samples is None else number_of_samples
-            buffer = buffer.flatten()
+            # reshape returns a view for contiguous buffers, flatten would write into a copy
+            buffer = buffer.reshape(-1)
         elif buffer.ndim == 1:
             if number_of_samples is None:
                 number_of_samples = buffer.size // self.number_of_channels
@@ -20,6 +20,7 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 """
 
 import ctypes
+import os
 import numpy as np
 import time
 from qtpy import QtCore
@@ -32,6 +33,7 @@ from interface.slow_counter_interface import SlowCounterInterface
 from interface.slow_counter_interface import SlowCounterConstraints
 from interface.slow_counter_interface import CountingMode
 from interface.fast_counter_interface import FastCounterInterface
+from hardware.picoquant.tttr_decoder import TTTRHistogrammer, T2_RESOLUTION
 
 # =============================================================================
 # Wrapper around the PHLib.DLL. The current file is based on the header files
@@ -99,14 +101,19 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
         module.Class: 'picoquant.picoharp300.PicoHarp300'
         deviceID: 0 # a device index from 0 to 7.
         mode: 0 # 0: histogram mode, 2: T2 mode, 3: T3 mode
-        
+        gated: False # optional, gated fast counter (one gate per sync pulse)
+        sync_channel: 0 # optional, channel of the sync pulses in T2 mode
+
+    As fast counter the TTTR records are read continuously and histogrammed in T3 mode if mode is
+    3 and in T2 mode otherwise.
     """
 
     _deviceID = ConfigOption('deviceID', 0, missing='warn') # a device index from 0 to 7.
     _mode = ConfigOption('mode', 0, missing='warn')
+    _gated = ConfigOption('gated', False, missing='nothing')
+    _sync_channel = ConfigOption('sync_channel', 0, missing='nothing')
 
     sigReadoutPicoharp = QtCore.Signal()
-    sigAnalyzeData = QtCore.Signal(object, object)
     sigStart = QtCore.Signal()
 
     def __init__(self, config, **kwargs):
@@ -129,6 +136,12 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
         self._bin_width_ns = 3000
         self._record_length_ns = 100 *1e9
 
+        # Read buffer for the TTTR records, reused for every read of the FiFo
+        self._fifo_buffer = np.zeros((self.TTREADMAX,), dtype=np.uint32)
+        # Accumulates the TTTR records to the fast counter timetrace, created by configure
+        self._histogrammer = None
+        self._start_time = 0
+
         self._photon_source2 = None #for compatibility reasons with second APD
         self._count_channel = 1
 
@@ -152,7 +165,6 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
 
         self.sigStart.connect(self.start_measure)
         self.sigReadoutPicoharp.connect(self.get_fresh_data_loop, QtCore.Qt.QueuedConnection) # ,QtCore.Qt.QueuedConnection
-        self.sigAnalyzeData.connect(self.analyze_received_data, QtCore.Qt.QueuedConnection)
         self.result = []
 
 
@@ -162,7 +174,6 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
 
         self.close_connection()
         self.sigReadoutPicoharp.disconnect()
-        self.sigAnalyzeData.disconnect()
 
     def _create_errorcode(self):
         """ Create a dictionary with the errorcode for the device.
@@ -698,6 +709,8 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
 
         @return tuple (buffer, actual_num_counts):
                     buffer = data array where the TTTR data are stored.
+                             The buffer is reused by the next call, so the
+                             data must be processed before.
                     actual_num_counts = how many numbers of TTTR could be
                                         actually be read out. THIS NUMBER IS
                                         NOT CHECKED FOR PERFORMANCE REASONS, SO
@@ -720,22 +733,11 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
         #                 'passed'.format(self.TTREADMAX, num_counts))
         #     num_counts = self.TTREADMAX
 
-        # PicoHarp T3 Format (for analysis and interpretation):
-        # The bit allocation in the record for the 32bit event is, starting
-        # from the MSB:
-        #       channel:     4 bit
-        #       dtime:      12 bit
-        #       nsync:      16 bit
-        # The channel code 15 (all bits ones) marks a special record.
-        # Special records can be overflows or external markers. To
-        # differentiate this, dtime must be checked:
-        #
-        #     If it is zero, the record marks an overflow.
-        #     If it is >=1 the individual bits are external markers.
+        # The records are decoded by hardware.picoquant.tttr_decoder.TTTRDecoder
 
         num_counts = self.TTREADMAX
 
-        buffer = np.zeros((num_counts,), dtype=np.uint32)
+        buffer = self._fifo_buffer
 
         actual_num_counts = ctypes.c_int32()
 
@@ -1057,29 +1059,36 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
 
     #FIXME: The interface connection to the fast counter must be established!
 
-    def configure(self, bin_width_ns, record_length_ns, number_of_gates = 0):
-        """
-        Configuration of the fast counter.
-        bin_width_ns: Length of a single time bin in the time trace histogram
-                      in nanoseconds.
-        record_length_ns: Total length of the timetrace/each single gate in
-                          nanoseconds.
-        number_of_gates: Number of gates in the pulse sequence. Ignore for
-                         ungated counter.
-        """
-        #        self.initialize(mode=3)
-        self._bin_width_ns = bin_width_ns
-        self._record_length_ns = record_length_ns
-        self._number_of_gates = number_of_gates
+    def configure(self, bin_width_s, record_length_s, number_of_gates=0):
+        """ Configuration of the fast counter.
 
-        #FIXME: actualle only an unsigned array will be needed. Change that later.
-        #        self.data_trace = np.zeros(number_of_gates, dtype=np.int64 )
-        self.data_trace = [0]*number_of_gates
-        self.count = 0
+        @param float bin_width_s: Length of a single time bin in the time race histogram in seconds.
+        @param float record_length_s: Total length of the timetrace/each single gate in seconds.
+        @param int number_of_gates: optional, number of gates in the pulse sequence. Ignore for not gated counter.
 
-        self.result = []
-        self.initialize(2)
-        return
+        @return tuple(binwidth_s, record_length_s, number_of_gates):
+                    binwidth_s: float the actual set binwidth in seconds
+                    gate_length_s: the actual record length in seconds
+                    number_of_gates: the number of gated, which are accepted, None if not-gated
+        """
+        self._bin_width_ns = bin_width_s * 1e9
+        self._record_length_ns = record_length_s * 1e9
+        self._number_of_gates = number_of_gates if self._gated else 0
+
+        mode = self.MODE_T3 if self._mode == self.MODE_T3 else self.MODE_T2
+        self.initialize(mode)
+        # T2 time tags have a fixed resolution, the T3 resolution depends on the binning (in ps)
+        resolution = T2_RESOLUTION if mode == self.MODE_T2 else self.get_resolution() * 1e-12
+        number_of_bins = max(1, int(round(record_length_s / bin_width_s)))
+        with self.threadlock:
+            self._histogrammer = TTTRHistogrammer(mode=mode,
+                                                  resolution=resolution,
+                                                  bin_width=bin_width_s,
+                                                  number_of_bins=number_of_bins,
+                                                  number_of_gates=self._number_of_gates,
+                                                  sync_channel=self._sync_channel)
+        return (bin_width_s, number_of_bins * bin_width_s,
+                self._number_of_gates if self._gated else None)
 
     def get_status(self):
         """
@@ -1114,21 +1123,21 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
         Continues the current measurement if the fast counter is in pause state.
         """
         self.meas_run = True
-        self.start(self._record_length_ns/1e6)
+        self.start(self.ACQTMAX)
+        self.sigReadoutPicoharp.emit()
 
     def is_gated(self):
         """
         Boolean return value indicates if the fast counter is a gated counter
         (TRUE) or not (FALSE).
         """
-        return False
+        return bool(self._gated)
 
     def get_binwidth(self):
         """
         returns the width of a single timebin in the timetrace in seconds
         """
-        #FIXME: Must be implemented
-        return 2e-9
+        return self._bin_width_ns * 1e-9
 
     def get_data_trace(self):
         """
@@ -1141,10 +1150,14 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
           - If the counter is gated it will return a 2D-numpy-array with
             returnarray[gate_index, timebin_index]
         """
-
-        info_dict = {'elapsed_sweeps': None,
-                     'elapsed_time': None}  # TODO : implement that according to hardware capabilities
-        return self.data_trace, info_dict
+        with self.threadlock:
+            if self._histogrammer is None:
+                self.log.error('PicoHarp: The fast counter has not been configured.')
+                return np.zeros(0, dtype=np.int64), {'elapsed_sweeps': None,
+                                                     'elapsed_time': None}
+            data, info_dict = self._histogrammer.get_data_trace()
+        info_dict['elapsed_time'] = time.time() - self._start_time
+        return data, info_dict
 
     # =========================================================================
     #  Test routine for continuous readout
@@ -1158,9 +1171,13 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
         self.lock()
 
         self.meas_run = True
+        with self.threadlock:
+            if self._histogrammer is not None:
+                self._histogrammer.reset()
+        self._start_time = time.time()
 
-        # start the device:
-        self.start(int(self._record_length_ns/1e6))
+        # start the device. The records are read until the measurement is stopped.
+        self.start(self.ACQTMAX)
 
         self.sigReadoutPicoharp.emit()
 
@@ -1172,12 +1189,8 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
     def get_fresh_data_loop(self):
         """ This method will be run infinitely until the measurement stops. """
 
-        # for testing one can also take another array:
         buffer, actual_counts = self.tttr_read_fifo()
-        #        buffer, actual_counts = [1,2,3,4,5,6,7,8,9], 9
-
-        # This analysis signel should be analyzed in a queued thread:
-        self.sigAnalyzeData.emit(buffer[0:actual_counts-1], actual_counts)
+        self.analyze_received_data(buffer[:actual_counts], actual_counts)
 
         if not self.meas_run:
             with self.threadlock:
@@ -1185,20 +1198,19 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
                 self.stop_device()
                 return
 
-        print('get new data.')
         # get the next data:
         self.sigReadoutPicoharp.emit()
 
-
-
     def analyze_received_data(self, arr_data, actual_counts):
         """ Analyze the actual data obtained from the TTTR mode of the device.
 
         @param arr_data: numpy uint32 array with length 'actual_counts'.
         @param actual_counts: int, number of read out events from the buffer.
 
-        Write the obtained arr_data to the predefined array data_trace,
-        initialized in the configure method.
+        The records are decoded and added to the histogram returned by
+        get_data_trace (see hardware.picoquant.tttr_decoder for the record
+        formats). The overflows of the time tags are carried over to the next
+        call, so the records must be passed in the order they were read.
 
         The received array contains 32bit words. The bit assignment starts from
         the MSB (most significant bit), which is here displayed as the most
@@ -1207,100 +1219,40 @@ class PicoHarp300(Base, SlowCounterInterface, FastCounterInterface):
         For T2 (initialized device with mode=2):
         ----------------------------------------
 
-        [ 4 bit for channel-number |28 bit for time-tag] = [32 bit word]
-
-        channel-number: 4 marker, which serve for the different channels.
-                            0001 = marker 1
-                            0010 = marker 2
-                            0011 = marker 3
-                            0100 = marker 4
-
-                        The channel code 15 (all bits ones, 1111) marks a
-                        special record. Special records can be overflows or
-                        external markers. To differentiate this, the lower 4
-                        bits of timetag must be checked:
-                            - If they are all zero, the record marks an
-                              overflow.
-                            - If they are >=1 the individual bits are external
-                              markers.
-
-                        Overflow period: 210698240
+        [ 4 bit for channel-number | 28 bit for time-tag] = [32 bit word]
 
-                        the first bit is the overflow bit. It will be set if
-                        the time-tag reached 2^28:
+        channel-number: input channel of the event. The channel code 15 (all
+                        bits ones, 1111) marks a special record. If the lower
+                        4 bits of the time-tag are all zero, the record marks
+                        an overflow of the time-tag (overflow period:
+                        210698240). Otherwise the individual bits are external
+                        markers.
 
-                            0000 = overflow
-
-                        Afterwards both overflow marker and time-tag
-                        will be reseted. This overflow should be detected and
-                        the time axis should be adjusted accordingly.
-
-        time-tag: The resolution is fixed to 4ps. Within the time of
-                  4ps*2^28 = 1.073741824 ms
-                  another photon event should occur so that the time axis can
-                  be computed properly.
+        time-tag: The resolution is fixed to 4ps.
 
         For T3 (initialized device with mode=3):
         ----------------------------------------
 
         [ 4 bit for channel-number | 12 bit for start-stop-time | 16 bit for sync counter] = [32 bit word]
 
-        channel-number: 4 marker, which serve for the different channels.
-                            0001 = marker 1
-                            0010 = marker 2
-                            0011 = marker 3
-                            0100 = marker 4
-
-                        the first bit is the overflow bit. It will be set if
-                        the sync-counter reached 65536 events:
-
-                            1000 = overflow
+        channel-number: input channel of the event (1 to 4). The channel code
+                        15 marks a special record. If the lower 4 bits of the
+                        start-stop-time are all zero, the record marks an
+                        overflow of the sync counter (after 65536 sync pulses).
+                        Otherwise the individual bits are external markers.
 
-                        Afterwards both, overflow marker and sync-counter
-                        will be reseted. This overflow should be detected and
-                        the time axis should be adjusted accordingly.
-
-        start-stop-time: time between to consecutive sync pulses. Maximal time
-                         between two sync pulses is therefore limited to
+        start-stop-time: time between the sync pulse and the photon. Maximal time
+                         is therefore limited to
                              2^12 * Res
                          where Res is the Resolution
                              Res = {4,8,16,32,54,128,256,512} (in ps)
                          For largest Resolution of 512ps you have 2097.152 ns.
-        sync-counter: can hold up to 2^16 = 65536 events. It that number is
-                      reached overflow will be set. That means all 4 bits in
-                      the channel-number are set to high (i.e. 1).
+        sync-counter: number of the sync pulse preceding the event.
         """
-
-        # at first just a simple test
-        time.sleep(0.2)
-
-        self.data_trace[self.count] = actual_counts
-        self.count += 1
-
-        if self.count > self._number_of_gates-1:
-            self.count = 0
-
         if actual_counts == self.TTREADMAX:
-            self.log.warning('Overflow!')
-
-        print('Data analyzed.')
-
-#        self.result = []
-#        for entry in arr_data[0:actual_counts-1]:
-#
-#            # apply three bitmasks to extract the relavent numbers:
-#            overflow = entry & (2**(32-1) )
-#            marker_ch = entry & (2**(32-2)  + 2**(32-3) + 2**(32-4))
-#            time_tag = entry & (2**32 -1 - 2**(32-1) + 2**(32-2) + 2**(32-3) + 2**(32-4))
-
-
-
-
-
-
-
-
-
-
-
+            self.log.warning('PicoHarp: TTTR read buffer full. Records are read slower than '
+                             'they are recorded.')
 
+        with self.threadlock:
+            if self._histogrammer is not None:
+                self._histogrammer.add_records(arr_data[:actual_counts])
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the decoder for the TTTR (time-tagged time-resolved) records of the PicoHarp300
+and a histogrammer accumulating the decoded events to fast counter timetraces.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+from collections import namedtuple
+import numpy as np
+
+# Record layouts of the PicoHarp300 (PHLib manual, PicoQuant demo code). Bits from the MSB:
+#   T2: [ 4 bit channel | 28 bit time tag ], time tag in units of 4 ps
+#   T3: [ 4 bit channel | 12 bit dtime | 16 bit nsync ], dtime in units of the resolution
+# The channel code 15 marks a special record. If the lowest 4 bits (of the time tag in T2, of
+# dtime in T3) are zero, it is an overflow of the time tag (T2) or the sync counter (T3).
+# Otherwise these bits are the external markers.
+MODE_T2 = 2
+MODE_T3 = 3
+T2_WRAPAROUND = 210698240
+T3_WRAPAROUND = 65536
+T2_RESOLUTION = 4e-12
+SPECIAL_CHANNEL = 15
+
+DecodedRecords = namedtuple('DecodedRecords',
+                            ['channel', 'timetag', 'dtime', 'marker', 'marker_timetag'])
+DecodedRecords.__doc__ = """ Events decoded from TTTR records.
+
+channel: input channel of each photon
+timetag: T2: arrival time of each photon in units of 4 ps,
+         T3: number of the sync pulse preceding each photon
+dtime: T2: None, T3: delay of each photon after the sync pulse in units of the resolution
+marker: bit pattern of the external markers of each marker record
+marker_timetag: time tag (T2) or sync number (T3) of each marker record
+"""
+
+
+class TTTRDecoder:
+    """
+    Vectorized decoder for a stream of PicoHarp300 T2 or T3 records.
+
+    The time tags are unwrapped with the overflow records. The number of overflows is carried
+    over to the next call of decode, so the record stream can be decoded in arbitrary buffers.
+    """
+
+    def __init__(self, mode):
+        """
+        @param int mode: 2 for T2 records, 3 for T3 records
+        """
+        if mode not in (MODE_T2, MODE_T3):
+            raise ValueError('TTTR mode must be {0:d} (T2) or {1:d} (T3), but {2} was given.'
+                             ''.format(MODE_T2, MODE_T3, mode))
+        self.mode = mode
+        self.wraparound = T2_WRAPAROUND if mode == MODE_T2 else T3_WRAPAROUND
+        self.overflows = 0
+        return
+
+    def reset(self):
+        """ Starts decoding a new record stream """
+        self.overflows = 0
+        return
+
+    @property
+    def elapsed_timetag(self):
+        """ Time tag (T2) or sync number (T3) up to which the time tags have overflown """
+        return self.overflows * self.wraparound
+
+    def decode(self, records):
+        """ Decodes the next records of the stream.
+
+        @param numpy.ndarray records: 1D array of 32 bit records (dtype uint32)
+
+        @return DecodedRecords: photon and marker events of the records
+        """
+        records = np.asarray(records, dtype=np.uint32)
+        channel = records >> 28
+        if self.mode == MODE_T2:
+            timetag = records & 0x0FFFFFFF
+            dtime = None
+            low_bits = records & 0xF
+        else:
+            timetag = records & 0xFFFF
+            dtime = (records >> 16) & 0x0FFF
+            low_bits = dtime & 0xF
+        special = channel == SPECIAL_CHANNEL
+        overflow = special & (low_bits == 0)
+
+        # Number of overflows before each record, including the overflows of previous buffers
+        overflows = np.cumsum(overflow, dtype=np.int64)
+        overflows += self.overflows
+        if overflows.size > 0:
+            self.overflows = int(overflows[-1])
+        timetag = overflows * self.wraparound + timetag
+
+        photon = ~special
+        marker = special & ~overflow
+        return DecodedRecords(channel=channel[photon].astype(np.uint8),
+                              timetag=timetag[photon],
+                              dtime=None if dtime is None else dtime[photon].astype(np.int64),
+                              marker=low_bits[marker].astype(np.uint8),
+                              marker_timetag=timetag[marker])
+
+
+class TTTRHistogrammer:
+    """
+    Accumulates TTTR records to the histogram of the photon delays after the sync pulses, as
+    returned by FastCounterInterface.get_data_trace.
+
+    T3 records contain the delay after the last sync pulse. In T2 mode the sync pulses are
+    recorded on sync_channel and the delay is the time since the last sync event, which is
+    carried over to the next buffer.
+    Ungated, all sync periods are accumulated to one timetrace. Gated, the sync pulses are
+    counted and the photons after the n-th sync pulse are accumulated to gate n modulo
+    number_of_gates.
+
+    The histogrammer is not thread safe, calls of add_records and get_data_trace from different
+    threads must be locked by the caller.
+    """
+
+    def __init__(self, mode, resolution, bin_width, number_of_bins, number_of_gates=0,
+                 channels=None, sync_channel=0):
+        """
+        @param int mode: 2 for T2 records, 3 for T3 records
+        @param float resolution: time resolution of the records in seconds (4 ps for T2)
+        @param float bin_width: width of a histogram bin in seconds
+        @param int number_of_bins: number of bins of the histogram (of each gate)
+        @param int number_of_gates: optional, number of gates. 0 for an ungated histogram.
+        @param list channels: optional, channels of the counted photons. Defaults to all channels
+                              (except the sync channel in T2 mode).
+        @param int sync_channel: T2 mode only, channel of the sync pulses
+        """
+        self.decoder = TTTRDecoder(mode)
+        self.resolution = float(resolution)
+        self.bin_width = float(bin_width)
+        self.number_of_bins = int(number_of_bins)
+        self.number_of_gates = int(number_of_gates) if number_of_gates else 0
+        self.channels = None if channels is None else np.asarray(channels, dtype=np.uint8)
+        self.sync_channel = int(sync_channel)
+        self.histogram = np.zeros((max(1, self.number_of_gates), self.number_of_bins),
+                                  dtype=np.int64)
+        self.reset()
+        return
+
+    @property
+    def is_gated(self):
+        return self.number_of_gates > 0
+
+    @property
+    def elapsed_sweeps(self):
+        """ Number of sync pulses (ungated) or of complete sets of gates (gated) """
+        if self.is_gated:
+            return self._syncs // self.number_of_gates
+        return self._syncs
+
+    def reset(self):
+        """ Clears the histogram and starts a new record stream """
+        self.decoder.reset()
+        self.histogram[...] = 0
+        # Number of sync pulses and (T2 mode) time tag of the last sync pulse
+        self._syncs = 0
+        self._last_sync = -1
+        return
+
+    def add_records(self, records):
+        """ Decodes the next records of the stream and adds the photons to the histogram.
+
+        @param numpy.ndarray records: 1D array of 32 bit records (dtype uint32)
+
+        @return int: number of photons added to the histogram
+        """
+        events = self.decoder.decode(records)
+        if self.decoder.mode == MODE_T3:
+            sync_number = events.timetag
+            delay = events.dtime
+            counted = np.ones(sync_number.size, dtype=bool)
+            # The sync counter of the last record (or overflow) is a lower bound of the syncs
+            last_sync_number = sync_number[-1] if sync_number.size > 0 else -1
+            if events.marker_timetag.size > 0:
+                last_sync_number = max(last_sync_number, events.marker_timetag[-1])
+            self._syncs = max(self._syncs, int(last_sync_number) + 1,
+                              self.decoder.elapsed_timetag)
+        else:
+            sync_number, delay, counted = self._delays_after_sync(events)
+        if self.channels is not None:
+            counted &= np.isin(events.channel, self.channels)
+
+        # Convert the delays to histogram bins and drop the photons outside of the histogram
+        bins = np.floor(delay * (self.resolution / self.bin_width)).astype(np.int64)
+        counted &= (bins >= 0) & (bins < self.number_of_bins)
+        bins = bins[counted]
+        if self.is_gated:
+            bins += (sync_number[counted] % self.number_of_gates) * self.number_of_bins
+        if bins.size > 0:
+            indices, counts = np.unique(bins, return_counts=True)
+            self.histogram.reshape(-1)[indices] += counts
+        return bins.size
+
+    def _delays_after_sync(self, events):
+        """ T2 mode: number of the preceding sync pulse and delay after it for each photon.
+
+        @return numpy.ndarray, numpy.ndarray, numpy.ndarray: sync number, delay, mask of photons
+                                                             (i.e. not sync events) after a sync
+        """
+        is_sync = events.channel == self.sync_channel
+        # The time tags are increasing, so the last sync time tag is the running maximum
+        last_sync = np.where(is_sync, events.timetag, self._last_sync)
+        np.maximum.accumulate(last_sync, out=last_sync)
+        sync_number = np.cumsum(is_sync, dtype=np.int64)
+        sync_number += self._syncs - 1
+        if is_sync.size > 0:
+            self._last_sync = int(last_sync[-1])
+            self._syncs = int(sync_number[-1]) + 1
+        counted = ~is_sync & (last_sync >= 0)
+        return sync_number, events.timetag - last_sync, counted
+
+    def get_data_trace(self):
+        """ Copy of the accumulated histogram as returned by FastCounterInterface.get_data_trace
+
+        @return numpy.ndarray, dict: 1D (ungated) or 2D (gated) histogram, info dict
+        """
+        data = self.histogram.copy() if self.is_gated else self.histogram[0].copy()
+        return data, {'elapsed_sweeps': self.elapsed_sweeps, 'elapsed_time': None}
@@ -220,6 +220,9 @@ class PulseStreamer(Base, PulserInterface):
         activation_config['all'] = frozenset({'d_ch1', 'd_ch2', 'd_ch3', 'd_ch4', 'd_ch5', 'd_ch6', 'd_ch7', 'd_ch8'})
         constraints.activation_config = activation_config
 
+        # The pulse patterns can be passed on directly without creating the sample arrays
+        constraints.pulse_pattern_upload = True
+
         return constraints
 
     
@@ -671,6 +674,31 @@ class PulseStreamer(Base, PulserInterface):
 
         return len(samples), [self.__current_waveform_name]
 
+    def write_pulse_pattern(self, name, pulse_patterns, total_number_of_samples):
+        """
+        Write a new waveform given as run-length encoded pulse patterns of the digital channels.
+
+        @param str name: the name of the waveform to be created
+        @param dict pulse_patterns: keys are the generic digital channel names (i.e. 'd_ch1') and
+                                    values are tuples (lengths, states) of 1D numpy arrays
+        @param int total_number_of_samples: The number of sample points for the entire waveform
+
+        @return (int, list): Number of samples written (-1 indicates failed process) and list of
+                             created waveform names
+        """
+        self.__current_waveform_name = name
+        self.__samples_written = 0
+        # pulse pattern in swabian language, i.e. a list of [duration, state] for each channel
+        self.__current_waveform = dict()
+        for channel_number, (lengths, states) in pulse_patterns.items():
+            if np.sum(lengths) != total_number_of_samples:
+                self.log.error('Pulse pattern of channel "{0}" does not match the total number '
+                               'of samples.'.format(channel_number))
+                return -1, list()
+            self.__current_waveform[channel_number] = [
+                [int(length), int(state)] for length, state in zip(lengths, states)]
+        return total_number_of_samples, [self.__current_waveform_name]
+
 
     
     def write_sequence(self, name, sequence_parameters):
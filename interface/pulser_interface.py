@@ -458,6 +458,28 @@ class PulserInterface(metaclass=InterfaceMetaclass):
         """
         pass
 
+    def write_pulse_pattern(self, name, pulse_patterns, total_number_of_samples):
+        """
+        Write a new waveform of digital channels only given as run-length encoded pulse patterns
+        instead of dense sample arrays. The logic only uses this method if the constraint
+        pulse_pattern_upload (see PulserConstraints) is True and no analog channel is used.
+
+        @param str name: the name of the waveform to be created
+        @param dict pulse_patterns: keys are the generic digital channel names (i.e. 'd_ch1') and
+                                    values are tuples (lengths, states) of 1D numpy arrays. lengths
+                                    (int64) contains the length in samples of each pulse, states
+                                    (bool) the corresponding marker state. Consecutive pulses
+                                    always have different states.
+        @param int total_number_of_samples: The number of sample points for the entire waveform
+
+        @return (int, list): Number of samples written (-1 indicates failed process) and list of
+                             created waveform names
+
+        This function is not abstract - Thus it is optional and only needs to be implemented by
+        hardware setting the constraint pulse_pattern_upload.
+        """
+        return -1, list()
+
     @abstract_interface_method
     def write_sequence(self, name, sequence_parameters):
         """
@@ -580,3 +602,6 @@ class PulserConstraints:
 
         self.activation_config = dict()
         self.sequence_option = SequenceOption.OPTIONAL
+        # Digital-only waveforms can be written as run-length encoded pulse patterns
+        # (see PulserInterface.write_pulse_pattern) instead of dense sample arrays.
+        self.pulse_pattern_upload = False
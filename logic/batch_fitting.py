@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the vectorized estimators and the worker functions used by FitLogic.batch_fit
+to fit a stack of 1D traces sharing the same x-axis (e.g. the ODMR spectra of all pixels of a
+scan or all lines of the ODMR matrix).
+
+The estimators follow the estimate_* methods in logic/fitmethods but operate on all traces at
+once. The models are defined at module level, so they can be used in worker processes.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import numpy as np
+import lmfit
+from collections import OrderedDict
+from scipy.ndimage import filters
+
+
+####################################
+# Model functions                  #
+####################################
+
+def lorentzian_function(x, amplitude, center, sigma, offset):
+    """ Lorentzian with offset, see make_lorentzian_model """
+    return amplitude * np.power(sigma, 2) / (np.power((center - x), 2) + np.power(sigma, 2)) \
+        + offset
+
+
+def gaussian_function(x, amplitude, center, sigma, offset):
+    """ Gaussian with offset, see make_gaussian_model """
+    return amplitude * np.exp(- np.power((center - x), 2) / (2 * np.power(sigma, 2))) + offset
+
+
+def sine_function(x, amplitude, frequency, phase, offset):
+    """ Sine with offset, see make_sine_model """
+    return amplitude * np.sin(2 * np.pi * frequency * x + phase) + offset
+
+
+def decayexponential_function(x, amplitude, lifetime, offset):
+    """ Exponential decay with offset, see make_decayexponential_model """
+    return amplitude * np.exp(-x / lifetime) + offset
+
+
+# Model function and derived parameters (name, expression) of the fits supported by batch_fit
+BATCH_FIT_MODELS = OrderedDict([
+    ('lorentzian', (lorentzian_function, (('fwhm', '2*sigma'),
+                                          ('contrast', '(amplitude/offset)*100')))),
+    ('gaussian', (gaussian_function, (('fwhm', '2.3548200450309493*sigma'),
+                                      ('contrast', '(amplitude/offset)*100')))),
+    ('sine', (sine_function, ())),
+    ('decayexponential', (decayexponential_function, ())),
+])
+
+# lmfit models built in this process. Keys are the fit names.
+_models = dict()
+
+
+def get_batch_model(fit_name):
+    """ Returns the lmfit model of a fit supported by batch_fit. The model is created only once
+    per process.
+
+    @param str fit_name: name of the fit, one of BATCH_FIT_MODELS
+
+    @return lmfit.Model: the model
+    """
+    model = _models.get(fit_name)
+    if model is None:
+        function, derived_params = BATCH_FIT_MODELS[fit_name]
+        model = lmfit.Model(function, independent_vars=['x'])
+        for name, expr in derived_params:
+            model.set_param_hint(name, expr=expr)
+        _models[fit_name] = model
+    return model
+
+
+####################################
+# Vectorized estimators            #
+####################################
+
+def _bounds(value, min=-np.inf, max=np.inf):
+    """ Initial value and bounds of a parameter as arrays of the same shape """
+    value = np.asarray(value, dtype='float64')
+    return (value,
+            np.broadcast_to(np.asarray(min, dtype='float64'), value.shape),
+            np.broadcast_to(np.asarray(max, dtype='float64'), value.shape))
+
+
+def _find_offset(x_axis, data):
+    """ Vectorized FitLogic.find_offset_parameter.
+
+    @return (numpy.ndarray, numpy.ndarray): smoothed data, offset of each trace
+    """
+    if len(x_axis) < 20.:
+        len_x = 5
+    elif len(x_axis) >= 100.:
+        len_x = 10
+    else:
+        len_x = int(len(x_axis) / 10.) + 1
+    kernel = lorentzian_function(np.linspace(0, len_x, len_x), amplitude=1, center=len_x / 2.,
+                                 sigma=len_x / 4., offset=0.)
+    kernel /= kernel.sum()
+    # The traces are padded with their maximum. Subtract it, so all traces can be padded with 0.
+    data_max = data.max(axis=1, keepdims=True)
+    data_smooth = filters.convolve1d(data - data_max, kernel, axis=1, mode='constant', cval=0.)
+    data_smooth += data_max
+
+    # Most frequent value in a histogram with 10 bins, equivalent to numpy.histogram
+    bins = 10
+    low = data_smooth.min(axis=1)
+    high = data_smooth.max(axis=1)
+    constant = low == high
+    low[constant] -= 0.5
+    high[constant] += 0.5
+    indices = ((data_smooth - low[:, np.newaxis]) * (bins / (high - low))[:, np.newaxis])
+    indices = np.clip(indices.astype('int64'), 0, bins - 1)
+    counts = np.zeros((len(data), bins), dtype='int64')
+    np.add.at(counts, (np.arange(len(data))[:, np.newaxis], indices), 1)
+    most_frequent = counts.argmax(axis=1)
+    bin_width = (high - low) / bins
+    offset = low + (most_frequent + 0.5) * bin_width
+    return data_smooth, offset
+
+
+def estimate_lorentzian_dip(x_axis, data):
+    """ Vectorized estimate_lorentzian_dip.
+
+    @param numpy.ndarray x_axis: 1D axis values, sorted in increasing order
+    @param numpy.ndarray data: 2D array, one trace per row
+
+    @return OrderedDict: parameter names as keys, (value, min, max) arrays as values
+    """
+    data_smooth, offset = _find_offset(x_axis, data)
+    data_level = data_smooth - offset[:, np.newaxis]
+    amplitude = data_level.min(axis=1)
+
+    # integral of the linear spline through the leveled data
+    numerical_integral = np.sum((data_level[:, 1:] + data_level[:, :-1]) * np.diff(x_axis),
+                                axis=1) / 2
+    x_zero = x_axis[np.argmin(data_smooth, axis=1)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.abs(numerical_integral / (np.pi * amplitude))
+
+    stepsize = x_axis[1] - x_axis[0]
+    n_steps = len(x_axis)
+    params = OrderedDict()
+    params['amplitude'] = _bounds(amplitude, max=-1e-12)
+    params['center'] = _bounds(x_zero,
+                               min=x_axis[0] - n_steps * stepsize,
+                               max=x_axis[-1] + n_steps * stepsize)
+    params['sigma'] = _bounds(sigma, min=stepsize / 2, max=(x_axis[-1] - x_axis[0]) * 10)
+    params['offset'] = _bounds(offset)
+    return params
+
+
+def estimate_lorentzian_peak(x_axis, data):
+    """ Vectorized estimate_lorentzian_peak, see estimate_lorentzian_dip """
+    params = estimate_lorentzian_dip(x_axis, -data)
+    params['amplitude'] = _bounds(-params['amplitude'][0], min=-1e-12)
+    params['offset'] = _bounds(-params['offset'][0])
+    return params
+
+
+def estimate_gaussian_peak(x_axis, data):
+    """ Vectorized estimate_gaussian_peak, see estimate_lorentzian_dip """
+    stepsize = abs(x_axis[1] - x_axis[0])
+    n_steps = len(x_axis)
+    data_smoothed = filters.gaussian_filter1d(data, 2, axis=1)
+
+    norm = np.sum(data_smoothed, axis=1)
+    mean_val_calc = np.sum(x_axis * data_smoothed, axis=1) / norm
+    mom2 = np.sum(x_axis ** 2 * data_smoothed, axis=1) / norm
+
+    params = OrderedDict()
+    params['amplitude'] = _bounds(data_smoothed.max(axis=1) - data_smoothed.min(axis=1), min=0)
+    params['center'] = _bounds(x_axis[np.argmax(data_smoothed, axis=1)],
+                               min=x_axis[0] - n_steps * stepsize,
+                               max=x_axis[-1] + n_steps * stepsize)
+    params['sigma'] = _bounds(np.sqrt(np.abs(mom2 - mean_val_calc ** 2)),
+                              min=stepsize,
+                              max=3 * (x_axis[-1] - x_axis[0]))
+    params['offset'] = _bounds(data_smoothed.min(axis=1))
+    return params
+
+
+def estimate_gaussian_dip(x_axis, data):
+    """ Vectorized estimate_gaussian_dip, see estimate_lorentzian_dip """
+    params = estimate_gaussian_peak(x_axis, -data)
+    params['amplitude'] = _bounds(-params['amplitude'][0], min=-np.inf, max=1e-12)
+    params['offset'] = _bounds(-params['offset'][0])
+    return params
+
+
+def estimate_sine(x_axis, data, max_chunk_bytes=2 ** 26):
+    """ Vectorized estimate_sine, see estimate_lorentzian_dip """
+    offset = np.mean(data, axis=1)
+    data_level = data - offset[:, np.newaxis]
+    ampl_val = np.maximum(np.abs(data_level.min(axis=1)), np.abs(data_level.max(axis=1)))
+
+    # Zero padded DFT as calculated by compute_ft
+    n_points = len(x_axis)
+    zeropad_arr = np.zeros((len(data), 2 * n_points))
+    zeropad_arr[:, :n_points] = data_level - data_level.mean(axis=1, keepdims=True)
+    middle = int((2 * n_points + 1) // 2)
+    dft_y = np.abs(np.fft.fft(zeropad_arr, axis=1)[:, :middle])
+    dft_x = np.abs(np.fft.fftfreq(2 * n_points, d=np.round(x_axis[-1] - x_axis[-2], 12)))
+    frequency_max = dft_x[:middle][dft_y.argmax(axis=1)]
+
+    diff_array = np.ediff1d(x_axis)
+    diff_array = diff_array[~np.isclose(diff_array, 0.0, atol=1e-12)]
+    min_x_diff = diff_array.min()
+
+    # Number of phases tried, see estimate_sinewithoutoffset
+    with np.errstate(divide='ignore'):
+        iter_steps = 1 / (frequency_max * min_x_diff)
+    iter_steps = np.where(np.isfinite(iter_steps), iter_steps, 1).astype('int64')
+    iter_steps[iter_steps < 1] = 1
+
+    # Traces with the same number of phases are processed together
+    phase = np.empty(len(data))
+    for steps in np.unique(iter_steps):
+        rows = np.flatnonzero(iter_steps == steps)
+        phases = np.arange(steps) / steps * 2 * np.pi
+        chunk_rows = max(1, int(max_chunk_bytes // (8 * steps * n_points)))
+        for start in range(0, len(rows), chunk_rows):
+            chunk = rows[start:start + chunk_rows]
+            func_val = ampl_val[chunk, np.newaxis, np.newaxis] * np.sin(
+                2 * np.pi * frequency_max[chunk, np.newaxis, np.newaxis] * x_axis
+                + phases[:, np.newaxis])
+            sum_res = np.abs(data_level[chunk, np.newaxis, :] - func_val).sum(axis=2)
+            phase[chunk] = sum_res.argmax(axis=1) / steps * 2 * np.pi - np.pi
+
+    stepsize = x_axis[1] - x_axis[0]
+    params = OrderedDict()
+    params['amplitude'] = _bounds(ampl_val)
+    params['frequency'] = _bounds(frequency_max, min=0.0, max=1 / stepsize * 3)
+    params['phase'] = _bounds(phase, min=-np.pi, max=np.pi)
+    params['offset'] = _bounds(offset)
+    return params
+
+
+def estimate_decayexponential(x_axis, data):
+    """ Vectorized estimate_decayexponential, see estimate_lorentzian_dip """
+    n_points = len(x_axis)
+    tail = max(1, int(n_points / 10))
+    offset = data[:, -tail:].mean(axis=1)
+    ampl = data[:, -tail:].std(axis=1)
+    rising = data[:, 0] < data[:, -1]
+
+    data_level = np.where(rising[:, np.newaxis],
+                          offset[:, np.newaxis] - data,
+                          data - offset[:, np.newaxis])
+    level_min = data_level.min(axis=1)
+    data_level -= np.where(level_min <= 0, level_min, 0)[:, np.newaxis]
+
+    # Index of the first point not larger than the standard deviation. Only the points before
+    # are used to estimate the lifetime.
+    below_std = data_level <= data_level.std(axis=1, keepdims=True)
+    first_index = np.where(below_std.any(axis=1), below_std.argmax(axis=1), n_points - 1)
+
+    # Linear regression of the logarithm of the leveled data
+    mask = np.arange(n_points) < first_index[:, np.newaxis]
+    counts = mask.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        data_level_log = np.where(mask, np.log(np.where(mask, data_level, 1)), 0)
+        x_mean = (mask * x_axis).sum(axis=1) / counts
+        y_mean = data_level_log.sum(axis=1) / counts
+        x_centered = np.where(mask, x_axis - x_mean[:, np.newaxis], 0)
+        slope = (x_centered * data_level_log).sum(axis=1) / (x_centered ** 2).sum(axis=1)
+        intercept = y_mean - slope * x_mean
+        lifetime = -1 / slope
+    valid = (counts >= 2) & np.isfinite(lifetime) & np.isfinite(intercept)
+
+    amplitude = np.where(rising, -np.exp(intercept), np.exp(intercept))
+    amplitude_min = np.where(rising, -np.inf, ampl)
+    amplitude_max = np.where(rising, -ampl, np.inf)
+    # Fallback if the lifetime is too small, i.e. beyond resolution
+    lifetime[~valid] = x_axis[first_index[~valid]] - x_axis[0]
+    amplitude[~valid] = data_level[~valid, 0]
+    amplitude_min[~valid] = -np.inf
+    amplitude_max[~valid] = np.inf
+
+    params = OrderedDict()
+    params['amplitude'] = _bounds(amplitude, min=amplitude_min, max=amplitude_max)
+    params['lifetime'] = _bounds(lifetime, min=2 * (x_axis[1] - x_axis[0]))
+    params['offset'] = _bounds(offset)
+    return params
+
+
+# Vectorized estimators of the fits supported by batch_fit. The first one is the default.
+BATCH_FIT_ESTIMATORS = {
+    'lorentzian': OrderedDict([('dip', estimate_lorentzian_dip),
+                               ('peak', estimate_lorentzian_peak)]),
+    'gaussian': OrderedDict([('peak', estimate_gaussian_peak),
+                             ('dip', estimate_gaussian_dip)]),
+    'sine': OrderedDict([('generic', estimate_sine)]),
+    'decayexponential': OrderedDict([('generic', estimate_decayexponential)]),
+}
+
+
+####################################
+# Fitting                          #
+####################################
+
+def parameters_to_dict(params):
+    """ Converts lmfit.Parameters (or a dict as accepted by _substitute_params) into a picklable
+    dict of dicts with the keys 'value', 'min', 'max', 'vary' and 'expr'.
+    """
+    if params is None:
+        return dict()
+    if isinstance(params, lmfit.Parameters):
+        return {name: {'value': param.value, 'min': param.min, 'max': param.max,
+                       'vary': param.vary, 'expr': param.expr}
+                for name, param in params.items()}
+    return {name: dict(settings) for name, settings in params.items()}
+
+
+def fit_traces(fit_name, x_axis, data, initial_params, add_params=None, fit_kwargs=None):
+    """ Fits each row of data with the model of fit_name. Runs inside the worker processes.
+
+    @param str fit_name: name of the fit, one of BATCH_FIT_MODELS
+    @param numpy.ndarray x_axis: 1D axis values
+    @param numpy.ndarray data: 2D array, one trace per row
+    @param dict initial_params: parameter names as keys, (value, min, max) arrays with one
+                                entry per trace as values (see estimators)
+    @param dict add_params: parameter settings used for all traces instead of the estimated ones
+                            (see parameters_to_dict)
+    @param dict fit_kwargs: additional keyword arguments of lmfit.Model.fit
+
+    @return dict: 'best_values', 'errors' (2D arrays, one column per parameter of the model),
+                  'success', 'redchi' and 'chisqr' (1D arrays)
+    """
+    model = get_batch_model(fit_name)
+    param_names = list(model.make_params())
+    add_params = dict() if add_params is None else add_params
+    fit_kwargs = dict() if fit_kwargs is None else fit_kwargs
+
+    n_traces = len(data)
+    best_values = np.full((n_traces, len(param_names)), np.nan)
+    errors = np.full((n_traces, len(param_names)), np.nan)
+    success = np.zeros(n_traces, dtype=bool)
+    redchi = np.full(n_traces, np.nan)
+    chisqr = np.full(n_traces, np.nan)
+    for index in range(n_traces):
+        params = model.make_params()
+        for name, (value, min_value, max_value) in initial_params.items():
+            params[name].set(value=value[index], min=min_value[index], max=max_value[index])
+        for name, settings in add_params.items():
+            if name not in params:
+                params.add(name)
+            params[name].set(**{key: val for key, val in settings.items()
+                                if key in ('value', 'min', 'max', 'vary', 'expr')
+                                and val is not None})
+        try:
+            result = model.fit(data[index], params=params, x=x_axis, **fit_kwargs)
+        except Exception:
+            continue
+        for column, name in enumerate(param_names):
+            param = result.params[name]
+            best_values[index, column] = param.value
+            if param.stderr is not None:
+                errors[index, column] = param.stderr
+        success[index] = result.success
+        redchi[index] = result.redchi
+        chisqr[index] = result.chisqr
+    return {'best_values': best_values, 'errors': errors, 'success': success, 'redchi': redchi,
+            'chisqr': chisqr}
@@ -25,6 +25,7 @@ import numpy as np
 from core.connector import Connector
 from core.configoption import ConfigOption
 from core.util.mutex import Mutex
+from core.util.percentile import data_percentiles
 from logic.generic_logic import GenericLogic
 from qtpy import QtCore
 import matplotlib.pyplot as plt
@@ -225,7 +226,9 @@ class CameraLogic(GenericLogic):
         @param: list cbar_range: (optional) [color_scale_min, color_scale_max].  If not supplied then a default of
                                  data_min to data_max will be used.
 
-        @param: list percentile_range: (optional) Percentile range of the chosen cbar_range.
+        @param: list percentile_range: (optional) Percentile range of the chosen cbar_range. If no
+                                       cbar_range is given, it is calculated from these
+                                       percentiles of the data.
 
         @param: list crosshair_pos: (optional) crosshair position as [hor, vert] in the chosen image axes.
 
@@ -234,8 +237,10 @@ class CameraLogic(GenericLogic):
         if scan_axis is None:
             scan_axis = ['X', 'Y']
 
-        # If no colorbar range was given, take full range of data
-        if cbar_range is None:
+        # If no colorbar range was given, take the percentile range or full range of data
+        if cbar_range is None and percentile_range is not None:
+            cbar_range = data_percentiles(data, percentile_range, ignore_zeros=False)
+        if cbar_range is None or not np.all(np.isfinite(cbar_range)):
             cbar_range = [np.min(data), np.max(data)]
 
         # Scale color values using SI prefix
@@ -22,7 +22,9 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 from qtpy import QtCore
 from collections import OrderedDict
 from copy import copy
+import os
 import time
+import hashlib
 import datetime
 import numpy as np
 import matplotlib as mpl
@@ -31,7 +33,10 @@ import matplotlib.pyplot as plt
 from logic.generic_logic import GenericLogic
 from core.util.mutex import Mutex
 from core.connector import Connector
+from core.configoption import ConfigOption
 from core.statusvariable import StatusVar
+from core.util.modules import get_home_dir
+from core.util.percentile import data_percentiles
 
 
 class OldConfigFileError(Exception):
@@ -41,6 +46,220 @@ class OldConfigFileError(Exception):
         super().__init__('Old configuration file detected. Ignoring confocal history.')
 
 
+class ConfocalImage:
+    """ Image of a confocal scan.
+
+    Only the counts are stored pixel by pixel (array of shape (rows, columns, channels)). The
+    scanner positions are stored as vectors along the rows and columns of the image:
+    row_positions (shape (rows, 3)) holds the x, y and z position of every image line and
+    column_positions (shape (columns, 3)) the positions along a line. horizontal_axes tells for each
+    of x, y and z which of them applies.
+
+    For compatibility, indexing behaves like the previously used array of shape
+    (rows, columns, 3 + channels) holding [x, y, z, counts...] for every pixel. Indexing a single
+    count channel (e.g. image[:, :, 3]) returns a view of the counts, everything else is created
+    on the fly.
+    """
+
+    def __init__(self, row_positions, column_positions, horizontal_axes, channels=1, dtype=float,
+                 counts=None):
+        """
+        @param numpy.ndarray row_positions: x, y, z positions of the image lines, shape (rows, 3)
+        @param numpy.ndarray column_positions: x, y, z positions along the lines, shape (cols, 3)
+        @param tuple horizontal_axes: 3 bools, True for the axes (x, y, z) changing along a line
+        @param int channels: number of count channels
+        @param dtype: data type of the counts
+        @param numpy.ndarray counts: optional, the counts (shape (rows, cols, channels))
+        """
+        self.row_positions = np.array(row_positions, dtype=float).reshape((-1, 3))
+        self.column_positions = np.array(column_positions, dtype=float).reshape((-1, 3))
+        self.horizontal_axes = tuple(bool(horizontal) for horizontal in horizontal_axes)
+        if counts is None:
+            counts = np.zeros((len(self.row_positions), len(self.column_positions), channels),
+                              dtype=dtype)
+        self.counts = counts
+
+    @classmethod
+    def from_array(cls, image):
+        """ Creates a ConfocalImage from an array of shape (rows, columns, 3 + channels) holding
+        [x, y, z, counts...] for every pixel.
+        """
+        image = np.asarray(image)
+        horizontal_axes = tuple(bool(np.any(image[0, :, axis] != image[0, 0, axis]))
+                                for axis in range(3))
+        return cls(row_positions=image[:, 0, :3],
+                   column_positions=image[0, :, :3],
+                   horizontal_axes=horizontal_axes,
+                   counts=np.array(image[:, :, 3:]))
+
+    @property
+    def shape(self):
+        return self.counts.shape[:2] + (3 + self.counts.shape[2],)
+
+    @property
+    def ndim(self):
+        return 3
+
+    def get_positions(self):
+        """ Returns the scanner positions of the image in a serializable dict. """
+        return {'row_positions': self.row_positions.tolist(),
+                'column_positions': self.column_positions.tolist(),
+                'horizontal_axes': list(self.horizontal_axes)}
+
+    def copy(self):
+        return ConfocalImage(row_positions=self.row_positions,
+                             column_positions=self.column_positions,
+                             horizontal_axes=self.horizontal_axes,
+                             counts=np.array(self.counts))
+
+    def pixel_position(self, row, column):
+        """ Returns the x, y, z scanner position of a single pixel. """
+        return tuple(self.column_positions[column, axis] if horizontal else
+                     self.row_positions[row, axis]
+                     for axis, horizontal in enumerate(self.horizontal_axes))
+
+    def line_positions(self, row):
+        """ Returns the x, y, z scanner positions of all pixels of an image line.
+
+        @return numpy.ndarray: positions, shape (3, columns)
+        """
+        line = np.empty((3, self.counts.shape[1]), dtype=float)
+        for axis, horizontal in enumerate(self.horizontal_axes):
+            line[axis] = self.column_positions[:, axis] if horizontal else \
+                self.row_positions[row, axis]
+        return line
+
+    def set_line(self, row, counts):
+        """ Writes the counts of an image line. The counts array is converted to a larger data type
+        if the counts can not be represented by the current one.
+
+        @param int row: index of the image line
+        @param numpy.ndarray counts: counts of the line, shape (columns, channels)
+        """
+        counts = np.asarray(counts)
+        if not np.can_cast(counts.dtype, self.counts.dtype, casting='safe'):
+            self.counts = self.counts.astype(np.result_type(self.counts.dtype, counts.dtype))
+        self.counts[row] = counts
+
+    def __array__(self, dtype=None):
+        image = self[:, :, :]
+        return image if dtype is None else image.astype(dtype)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 3 or any(index is Ellipsis for index in key):
+            return np.asarray(self)[key]
+        row_key, column_key, channel_key = key + (slice(None),) * (3 - len(key))
+        channels = np.arange(3 + self.counts.shape[2])[channel_key]
+        if np.ndim(channels) == 0 and channels >= 3:
+            return self.counts[row_key, column_key, channels - 3]
+        rows = np.arange(self.counts.shape[0])[row_key]
+        columns = np.arange(self.counts.shape[1])[column_key]
+        planes = [self._get_plane(channel, rows, columns) for channel in np.atleast_1d(channels)]
+        if np.ndim(channels) == 0:
+            return planes[0]
+        return np.stack(planes, axis=-1)
+
+    def _get_plane(self, channel, rows, columns):
+        """ Positions (channel 0, 1, 2) or counts (channel >= 3) for the rows and columns given. """
+        row_ind = np.atleast_1d(rows)
+        column_ind = np.atleast_1d(columns)
+        if channel >= 3:
+            plane = self.counts[row_ind[:, np.newaxis], column_ind, channel - 3]
+        elif self.horizontal_axes[channel]:
+            plane = np.broadcast_to(self.column_positions[column_ind, channel],
+                                    (row_ind.size, column_ind.size))
+        else:
+            plane = np.broadcast_to(self.row_positions[row_ind, channel, np.newaxis],
+                                    (row_ind.size, column_ind.size))
+        return np.array(plane).reshape(np.shape(rows) + np.shape(columns))
+
+
+class ConfocalImageStore:
+    """ Content-addressed store for the images of the confocal history.
+
+    Every image is saved only once as .npy file named by the hash of its content, so images that
+    did not change between history entries share the same file. Images are opened as read-only
+    memory-mapped arrays. The most recently used images are kept in memory.
+    """
+
+    def __init__(self, path, max_cached=4):
+        """
+        @param str path: directory to store the image files in
+        @param int max_cached: number of images to keep in memory
+        """
+        self.path = path
+        self.max_cached = max(int(max_cached), 0)
+        self._cache = OrderedDict()
+        os.makedirs(self.path, exist_ok=True)
+
+    def __contains__(self, key):
+        return key in self._cache or os.path.isfile(self._file_path(key))
+
+    def put(self, image):
+        """ Stores an image (if not already present) and returns its key.
+
+        @param numpy.ndarray image: the image to store
+
+        @return str: key of the image
+        """
+        image = np.ascontiguousarray(image)
+        content_hash = hashlib.sha1(str((image.dtype.str, image.shape)).encode('utf-8'))
+        content_hash.update(image.view(np.uint8).reshape(-1))
+        key = content_hash.hexdigest()
+        if key not in self:
+            # write to a temporary file first to never leave incomplete images behind
+            tmp_path = os.path.join(self.path, key + '.tmp.npy')
+            np.save(tmp_path, image)
+            os.replace(tmp_path, self._file_path(key))
+        if key not in self._cache:
+            image = image.copy()
+            image.flags.writeable = False
+        self._add_to_cache(key, self._cache.pop(key, image))
+        return key
+
+    def get(self, key):
+        """ Returns the (read-only) image stored under key.
+
+        @param str key: key of the image as returned by put
+
+        @return numpy.ndarray: the image
+        """
+        image = self._cache.pop(key, None)
+        if image is None:
+            try:
+                image = np.load(self._file_path(key), mmap_mode='r')
+            except (OSError, ValueError):
+                raise KeyError(key)
+        self._add_to_cache(key, image)
+        return image
+
+    def remove_unused(self, keys_in_use):
+        """ Deletes all images not referenced by keys_in_use.
+
+        @param iterable keys_in_use: keys of all images that should be kept
+        """
+        keys_in_use = set(keys_in_use)
+        for key in list(self._cache):
+            if key not in keys_in_use:
+                del self._cache[key]
+        for filename in os.listdir(self.path):
+            if filename.endswith('.npy') and filename[:-4] not in keys_in_use:
+                try:
+                    os.remove(os.path.join(self.path, filename))
+                except OSError:
+                    pass
+
+    def _add_to_cache(self, key, image):
+        self._cache[key] = image
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    def _file_path(self, key):
+        return os.path.join(self.path, key + '.npy')
+
+
 class ConfocalHistoryEntry(QtCore.QObject):
     """ This class contains all relevant parameters of a Confocal scan.
         It provides methods to extract, restore and serialize this data.
@@ -50,6 +269,14 @@ class ConfocalHistoryEntry(QtCore.QObject):
         """ Make a confocal data setting with default values. """
         super().__init__()
 
+        # The counts of the images are kept in the image store of the confocal logic and
+        # referenced by key. The scanner positions of the images are kept in a dict.
+        self._image_store = confocal._image_store
+        self.xy_image_key = None
+        self.depth_image_key = None
+        self.xy_image_positions = None
+        self.depth_image_positions = None
+
         self.depth_scan_dir_is_xz = True
         self.depth_img_is_xz = True
 
@@ -103,6 +330,35 @@ class ConfocalHistoryEntry(QtCore.QObject):
         self.tilt_reference_x = 0
         self.tilt_reference_y = 0
 
+    @property
+    def xy_image(self):
+        return self._get_image(self.xy_image_key, self.xy_image_positions)
+
+    @xy_image.setter
+    def xy_image(self, image):
+        self.xy_image_key, self.xy_image_positions = self._put_image(image)
+
+    @property
+    def depth_image(self):
+        return self._get_image(self.depth_image_key, self.depth_image_positions)
+
+    @depth_image.setter
+    def depth_image(self, image):
+        self.depth_image_key, self.depth_image_positions = self._put_image(image)
+
+    def _get_image(self, key, positions):
+        if key is None:
+            raise AttributeError('No image stored in confocal history entry.')
+        if positions is None:
+            # full [x, y, z, counts...] array
+            return ConfocalImage.from_array(self._image_store.get(key))
+        return ConfocalImage(counts=self._image_store.get(key), **positions)
+
+    def _put_image(self, image):
+        if not isinstance(image, ConfocalImage):
+            image = ConfocalImage.from_array(image)
+        return self._image_store.put(image.counts), image.get_positions()
+
     def restore(self, confocal):
         """ Write data back into confocal logic and pull all the necessary strings """
         confocal._current_x = self.current_x
@@ -133,17 +389,17 @@ class ConfocalHistoryEntry(QtCore.QObject):
         confocal.initialize_image()
         try:
             if confocal.xy_image.shape == self.xy_image.shape:
-                confocal.xy_image = np.copy(self.xy_image)
+                confocal.xy_image = self.xy_image.copy()
         except AttributeError:
-            self.xy_image = np.copy(confocal.xy_image)
+            self.xy_image = confocal.xy_image
 
         confocal._zscan = True
         confocal.initialize_image()
         try:
             if confocal.depth_image.shape == self.depth_image.shape:
-                confocal.depth_image = np.copy(self.depth_image)
+                confocal.depth_image = self.depth_image.copy()
         except AttributeError:
-            self.depth_image = np.copy(confocal.depth_image)
+            self.depth_image = confocal.depth_image
         confocal._zscan = False
 
     def snapshot(self, confocal):
@@ -172,8 +428,8 @@ class ConfocalHistoryEntry(QtCore.QObject):
         self.point1 = np.copy(confocal.point1)
         self.point2 = np.copy(confocal.point2)
         self.point3 = np.copy(confocal.point3)
-        self.xy_image = np.copy(confocal.xy_image)
-        self.depth_image = np.copy(confocal.depth_image)
+        self.xy_image = confocal.xy_image
+        self.depth_image = confocal.depth_image
 
     def serialize(self):
         """ Give out a dictionary that can be saved via the usual means """
@@ -197,8 +453,10 @@ class ConfocalHistoryEntry(QtCore.QObject):
         serialized['tilt_point3'] = list(self.point3)
         serialized['tilt_reference'] = [self.tilt_reference_x, self.tilt_reference_y]
         serialized['tilt_slope'] = [self.tilt_slope_x, self.tilt_slope_y]
-        serialized['xy_image'] = self.xy_image
-        serialized['depth_image'] = self.depth_image
+        serialized['xy_image_key'] = self.xy_image_key
+        serialized['depth_image_key'] = self.depth_image_key
+        serialized['xy_image_positions'] = self.xy_image_positions
+        serialized['depth_image_positions'] = self.depth_image_positions
         return serialized
 
     def deserialize(self, serialized):
@@ -236,16 +494,20 @@ class ConfocalHistoryEntry(QtCore.QObject):
             self.point2 = np.array(serialized['tilt_point2'])
         if 'tilt_point3' in serialized and len(serialized['tilt_point3']) == 3:
             self.point3 = np.array(serialized['tilt_point3'])
-        if 'xy_image' in serialized:
-            if isinstance(serialized['xy_image'], np.ndarray):
-                self.xy_image = serialized['xy_image']
-            else:
-                raise OldConfigFileError()
-        if 'depth_image' in serialized:
-            if isinstance(serialized['depth_image'], np.ndarray):
-                self.depth_image = serialized['depth_image'].copy()
-            else:
-                raise OldConfigFileError()
+        for image_name in ('xy_image', 'depth_image'):
+            key_name = image_name + '_key'
+            if serialized.get(key_name) is not None:
+                if serialized[key_name] not in self._image_store:
+                    raise FileNotFoundError('Image file of {0} not found in confocal image store.'
+                                            ''.format(image_name))
+                setattr(self, key_name, serialized[key_name])
+                setattr(self, image_name + '_positions', serialized.get(image_name + '_positions'))
+            elif image_name in serialized:
+                # images saved in the status variables by previous versions
+                if isinstance(serialized[image_name], np.ndarray):
+                    setattr(self, image_name, serialized[image_name])
+                else:
+                    raise OldConfigFileError()
 
 
 class ConfocalLogic(GenericLogic):
@@ -262,6 +524,10 @@ class ConfocalLogic(GenericLogic):
     return_slowness = StatusVar(default=2)
     max_history_length = StatusVar(default=10)
 
+    # config options
+    # Directory of the image files of the scan history. Defaults to <home>/confocal_history/<name>
+    _history_image_path = ConfigOption('history_image_path', None, missing='nothing')
+
     # signals
     signal_start_scanning = QtCore.Signal(str)
     signal_continue_scanning = QtCore.Signal(str)
@@ -299,6 +565,8 @@ class ConfocalLogic(GenericLogic):
         self.depth_scan_dir_is_xz = True
         self.depth_img_is_xz = True
         self.permanent_scan = False
+        # data type of the counts returned by the scanner, used for the next images
+        self._count_dtype = np.dtype(float)
 
     def on_activate(self):
         """ Initialisation performed during activation of the module.
@@ -312,6 +580,11 @@ class ConfocalLogic(GenericLogic):
         self.z_range = self._scanning_device.get_position_range()[2]
 
         # restore here ...
+        if self._history_image_path is None:
+            image_path = os.path.join(get_home_dir(), 'confocal_history', self._name)
+        else:
+            image_path = self._history_image_path
+        self._image_store = ConfocalImageStore(image_path)
         self.history = []
         for i in reversed(range(1, self.max_history_length)):
             try:
@@ -338,6 +611,7 @@ class ConfocalLogic(GenericLogic):
             self.history.append(new_state)
 
         self.history_index = len(self.history) - 1
+        self._image_store.remove_unused(self._get_history_image_keys())
 
         # Sets connections between signals and functions
         self.signal_scan_lines_next.connect(self._scan_line, QtCore.Qt.QueuedConnection)
@@ -364,8 +638,20 @@ class ConfocalLogic(GenericLogic):
         for state in reversed(self.history):
             self._statusVariables['history_{0}'.format(histindex)] = state.serialize()
             histindex += 1
+        # Only the images of the history entries restored on the next activation are kept
+        self.history = self.history[-self.max_history_length:]
+        self._image_store.remove_unused(self._get_history_image_keys())
         return 0
 
+    def _get_history_image_keys(self):
+        """ Returns the keys of all images referenced by the history entries. """
+        keys = set()
+        for state in self.history:
+            keys.add(state.xy_image_key)
+            keys.add(state.depth_image_key)
+        keys.discard(None)
+        return keys
+
     def switch_hardware(self, to_on=False):
         """ Switches the Hardware off or on.
 
@@ -507,40 +793,32 @@ class ConfocalLogic(GenericLogic):
             # depth scan is in xz plane
             if self.depth_img_is_xz:
                 #self._image_horz_axis = self._X
-                # creates an image where each pixel will be [x,y,z,counts]
-                self.depth_image = np.zeros((
-                        len(self._image_vert_axis),
-                        len(self._X),
-                        3 + len(self.get_scanner_count_channels())
-                    ))
-
-                self.depth_image[:, :, 0] = np.full(
-                    (len(self._image_vert_axis), len(self._X)), self._XL)
-
-                self.depth_image[:, :, 1] = self._current_y * np.ones(
-                    (len(self._image_vert_axis), len(self._X)))
-
-                z_value_matrix = np.full((len(self._X), len(self._image_vert_axis)), self._Z)
-                self.depth_image[:, :, 2] = z_value_matrix.transpose()
+                # creates an image with x along the lines and z along the rows at fixed y
+                row_positions = np.zeros((len(self._image_vert_axis), 3))
+                row_positions[:, 1] = self._current_y
+                row_positions[:, 2] = self._Z
+                column_positions = np.zeros((len(self._X), 3))
+                column_positions[:, 0] = self._XL
+                self.depth_image = ConfocalImage(row_positions=row_positions,
+                                                 column_positions=column_positions,
+                                                 horizontal_axes=(True, False, False),
+                                                 channels=len(self.get_scanner_count_channels()),
+                                                 dtype=self._count_dtype)
 
             # depth scan is yz plane instead of xz plane
             else:
                 #self._image_horz_axis = self._Y
-                # creats an image where each pixel will be [x,y,z,counts]
-                self.depth_image = np.zeros((
-                        len(self._image_vert_axis),
-                        len(self._Y),
-                        3 + len(self.get_scanner_count_channels())
-                    ))
-
-                self.depth_image[:, :, 0] = self._current_x * np.ones(
-                    (len(self._image_vert_axis), len(self._Y)))
-
-                self.depth_image[:, :, 1] = np.full(
-                    (len(self._image_vert_axis), len(self._Y)), self._YL)
-
-                z_value_matrix = np.full((len(self._Y), len(self._image_vert_axis)), self._Z)
-                self.depth_image[:, :, 2] = z_value_matrix.transpose()
+                # creates an image with y along the lines and z along the rows at fixed x
+                row_positions = np.zeros((len(self._image_vert_axis), 3))
+                row_positions[:, 0] = self._current_x
+                row_positions[:, 2] = self._Z
+                column_positions = np.zeros((len(self._Y), 3))
+                column_positions[:, 1] = self._YL
+                self.depth_image = ConfocalImage(row_positions=row_positions,
+                                                 column_positions=column_positions,
+                                                 horizontal_axes=(False, True, False),
+                                                 channels=len(self.get_scanner_count_channels()),
+                                                 dtype=self._count_dtype)
 
                 # now we are scanning along the y-axis, so we need a new return line along Y:
                 self._return_YL = np.linspace(self._YL[-1], self._YL[0], self.return_slowness)
@@ -552,21 +830,18 @@ class ConfocalLogic(GenericLogic):
         else:
             #self._image_horz_axis = self._X
             self._image_vert_axis = self._Y
-            # creats an image where each pixel will be [x,y,z,counts]
-            self.xy_image = np.zeros((
-                    len(self._image_vert_axis),
-                    len(self._X),
-                    3 + len(self.get_scanner_count_channels())
-                ))
-
-            self.xy_image[:, :, 0] = np.full(
-                (len(self._image_vert_axis), len(self._X)), self._XL)
-
-            y_value_matrix = np.full((len(self._X), len(self._image_vert_axis)), self._Y)
-            self.xy_image[:, :, 1] = y_value_matrix.transpose()
-
-            self.xy_image[:, :, 2] = self._current_z * np.ones(
-                (len(self._image_vert_axis), len(self._X)))
+            # creates an image with x along the lines and y along the rows. The z position is
+            # stored for every line since it is updated before the line is scanned.
+            row_positions = np.zeros((len(self._image_vert_axis), 3))
+            row_positions[:, 1] = self._Y
+            row_positions[:, 2] = self._current_z
+            column_positions = np.zeros((len(self._X), 3))
+            column_positions[:, 0] = self._XL
+            self.xy_image = ConfocalImage(row_positions=row_positions,
+                                          column_positions=column_positions,
+                                          horizontal_axes=(True, False, False),
+                                          channels=len(self.get_scanner_count_channels()),
+                                          dtype=self._count_dtype)
 
             self.sigImageXYInitialized.emit()
         return 0
@@ -750,16 +1025,16 @@ class ConfocalLogic(GenericLogic):
 
         image = self.depth_image if self._zscan else self.xy_image
         n_ch = len(self.get_scanner_axes())
-        s_ch = len(self.get_scanner_count_channels())
 
         try:
             if self._scan_counter == 0:
                 # make a line from the current cursor position to
                 # the starting position of the first scan line of the scan
                 rs = self.return_slowness
-                lsx = np.linspace(self._current_x, image[self._scan_counter, 0, 0], rs)
-                lsy = np.linspace(self._current_y, image[self._scan_counter, 0, 1], rs)
-                lsz = np.linspace(self._current_z, image[self._scan_counter, 0, 2], rs)
+                start_x, start_y, start_z = image.pixel_position(self._scan_counter, 0)
+                lsx = np.linspace(self._current_x, start_x, rs)
+                lsy = np.linspace(self._current_y, start_y, rs)
+                lsz = np.linspace(self._current_z, start_z, rs)
                 if n_ch <= 3:
                     start_line = np.vstack([lsx, lsy, lsz][0:n_ch])
                 else:
@@ -778,13 +1053,10 @@ class ConfocalLogic(GenericLogic):
             # adjust z of line in image to current z before building the line
 
             if not self._zscan:
-                z_shape = image[self._scan_counter, :, 2].shape
-                image[self._scan_counter, :, 2] = self._current_z * np.ones(z_shape)
+                image.row_positions[self._scan_counter, 2] = self._current_z
 
             # make a line in the scan, _scan_counter says which one it is
-            lsx = image[self._scan_counter, :, 0]
-            lsy = image[self._scan_counter, :, 1]
-            lsz = image[self._scan_counter, :, 2]
+            lsx, lsy, lsz = image.line_positions(self._scan_counter)
             if n_ch <= 3:
                 line = np.vstack([lsx, lsy, lsz][0:n_ch])
             else:
@@ -799,32 +1071,33 @@ class ConfocalLogic(GenericLogic):
                 return
 
             # make a line to go to the starting position of the next scan line
+            _, line_y, line_z = image.pixel_position(self._scan_counter, 0)
             if self.depth_img_is_xz or not self._zscan:
                 if n_ch <= 3:
                     return_line = np.vstack([
                         self._return_XL,
-                        image[self._scan_counter, 0, 1] * np.ones(self._return_XL.shape),
-                        image[self._scan_counter, 0, 2] * np.ones(self._return_XL.shape)
+                        line_y * np.ones(self._return_XL.shape),
+                        line_z * np.ones(self._return_XL.shape)
                     ][0:n_ch])
                 else:
                     return_line = np.vstack([
                             self._return_XL,
-                            image[self._scan_counter, 0, 1] * np.ones(self._return_XL.shape),
-                            image[self._scan_counter, 0, 2] * np.ones(self._return_XL.shape),
+                            line_y * np.ones(self._return_XL.shape),
+                            line_z * np.ones(self._return_XL.shape),
                             np.ones(self._return_XL.shape) * self._current_a
                         ])
             else:
                 if n_ch <= 3:
                     return_line = np.vstack([
-                            image[self._scan_counter, 0, 1] * np.ones(self._return_YL.shape),
+                            line_y * np.ones(self._return_YL.shape),
                             self._return_YL,
-                            image[self._scan_counter, 0, 2] * np.ones(self._return_YL.shape)
+                            line_z * np.ones(self._return_YL.shape)
                         ][0:n_ch])
                 else:
                     return_line = np.vstack([
-                            image[self._scan_counter, 0, 1] * np.ones(self._return_YL.shape),
+                            line_y * np.ones(self._return_YL.shape),
                             self._return_YL,
-                            image[self._scan_counter, 0, 2] * np.ones(self._return_YL.shape),
+                            line_z * np.ones(self._return_YL.shape),
                             np.ones(self._return_YL.shape) * self._current_a
                         ])
 
@@ -836,14 +1109,11 @@ class ConfocalLogic(GenericLogic):
                 return
 
             # update image with counts from the line we just scanned
+            image.set_line(self._scan_counter, line_counts)
+            self._count_dtype = np.asarray(line_counts).dtype
             if self._zscan:
-                if self.depth_img_is_xz:
-                    self.depth_image[self._scan_counter, :, 3:3 + s_ch] = line_counts
-                else:
-                    self.depth_image[self._scan_counter, :, 3:3 + s_ch] = line_counts
                 self.signal_depth_image_updated.emit()
             else:
-                self.xy_image[self._scan_counter, :, 3:3 + s_ch] = line_counts
                 self.signal_xy_image_updated.emit()
 
             # next line in scan
@@ -1091,7 +1361,9 @@ class ConfocalLogic(GenericLogic):
         @param: list cbar_range: (optional) [color_scale_min, color_scale_max].  If not supplied then a default of
                                  data_min to data_max will be used.
 
-        @param: list percentile_range: (optional) Percentile range of the chosen cbar_range.
+        @param: list percentile_range: (optional) Percentile range of the chosen cbar_range. If no
+                                       cbar_range is given, it is calculated from these
+                                       percentiles of the non-zero data.
 
         @param: list crosshair_pos: (optional) crosshair position as [hor, vert] in the chosen image axes.
 
@@ -1100,8 +1372,11 @@ class ConfocalLogic(GenericLogic):
         if scan_axis is None:
             scan_axis = ['X', 'Y']
 
-        # If no colorbar range was given, take full range of data
-        if cbar_range is None:
+        # If no colorbar range was given, take the percentile range (excluding zeros of an unfinished
+        # scan) or full range of data
+        if cbar_range is None and percentile_range is not None:
+            cbar_range = data_percentiles(data, percentile_range)
+        if cbar_range is None or not np.all(np.isfinite(cbar_range)):
             cbar_range = [np.min(data), np.max(data)]
 
         # Scale color values using SI prefix
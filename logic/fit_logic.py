@@ -21,11 +21,13 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 """
 
 import importlib
-import inspect
+import logging
+import multiprocessing
 import lmfit
 from qtpy import QtCore
 import numpy as np
 import os
+import re
 import sys
 from collections import OrderedDict
 from distutils.version import LooseVersion
@@ -35,6 +37,119 @@ from core.util.modules import get_main_dir
 from core.util.mutex import Mutex
 from core.config import load, save
 from core.configoption import ConfigOption
+from logic import batch_fitting
+
+logger = logging.getLogger(__name__)
+
+# Top-level function definition in the source of a fit method file. Parsing the files with this
+# expression is much faster than importing them or parsing them with the ast module.
+_FUNCTION_DEFINITION = re.compile(rb'^def[ \t]+(\w+)[ \t]*\(', re.MULTILINE)
+
+
+class FitMethodRegistry:
+    """
+    Process wide registry of the functions defined in the fit method files (make_*_fit,
+    make_*_model, estimate_* and their helpers).
+
+    The files are scanned for top-level function definitions without importing them. The scan
+    result of each file is cached until its modification time changes. A module is imported on
+    the first access of one of its functions and reloaded if the file changed since.
+    """
+
+    def __init__(self):
+        self._lock = Mutex(recursive=True)
+        # Scanned files. Keys are module names, values are (path, mtime, function names) tuples.
+        self._files = dict()
+        # Modification time of the imported version of each module
+        self._imported = dict()
+        # Functions resolved so far. Keys are function names, values are module names.
+        self._resolved = dict()
+
+    def scan(self, paths):
+        """ Scans the python files in the given directories for functions.
+        Files are only parsed again if they changed since the last scan.
+
+        @param list paths: directories containing the fit method files
+
+        @return (OrderedDict, set): function names mapped to module names,
+                                    names of resolved functions that have changed since
+        """
+        with self._lock:
+            methods = OrderedDict()
+            for path in paths:
+                for filename in sorted(os.listdir(path)):
+                    file_path = os.path.join(path, filename)
+                    if not filename.endswith('.py') or not os.path.isfile(file_path):
+                        continue
+                    module_name = filename[:-3]
+                    mtime = os.path.getmtime(file_path)
+                    scanned = self._files.get(module_name)
+                    if scanned is None or scanned[:2] != (file_path, mtime):
+                        scanned = (file_path, mtime, self._function_names(file_path))
+                        self._files[module_name] = scanned
+                    for name in scanned[2]:
+                        methods[name] = module_name
+                if path not in sys.path:
+                    sys.path.append(path)
+
+            outdated = set()
+            for name, module_name in list(self._resolved.items()):
+                if methods.get(name, module_name) != module_name or \
+                        self._files[module_name][1] != self._imported.get(module_name):
+                    outdated.add(name)
+                    del self._resolved[name]
+            return methods, outdated
+
+    def resolve(self, name, module_name):
+        """ Imports (or reloads if changed) the module defining a function and returns it.
+
+        @param str name: function name
+        @param str module_name: name of the module defining the function (see scan)
+
+        @return function: the function
+        """
+        with self._lock:
+            mtime = self._files[module_name][1]
+            if module_name not in self._imported:
+                module = importlib.import_module(module_name)
+            else:
+                module = sys.modules[module_name]
+                if self._imported[module_name] != mtime:
+                    module = importlib.reload(module)
+            self._imported[module_name] = mtime
+            function = getattr(module, name)
+            self._resolved[name] = module_name
+            return function
+
+    @staticmethod
+    def _function_names(file_path):
+        """ Names of the functions defined at the top level of a python file """
+        try:
+            with open(file_path, 'rb') as file:
+                source = file.read()
+        except OSError:
+            logger.exception('Unable to scan fit method file "{0}".'.format(file_path))
+            return list()
+        return [name.decode() for name in _FUNCTION_DEFINITION.findall(source)]
+
+
+_fit_method_registry = FitMethodRegistry()
+
+
+class LazyFitMethod:
+    """ Reference to a method of FitLogic as stored in FitLogic.fit_list. The method (and the
+    fit method file defining it) is only resolved when it is called.
+    """
+
+    def __init__(self, fit_logic, name):
+        self.fit_logic = fit_logic
+        self.__name__ = name
+
+    def __call__(self, *args, **kwargs):
+        return getattr(self.fit_logic, self.__name__)(*args, **kwargs)
+
+    def __repr__(self):
+        return '<LazyFitMethod {0}>'.format(self.__name__)
 
 
 class FitLogic(GenericLogic):
@@ -54,13 +169,15 @@ class FitLogic(GenericLogic):
     _additional_methods_import_path = ConfigOption(name='additional_fit_methods_path',
                                                    default=None,
                                                    missing='nothing')
+    # Number of worker processes used by batch_fit. Defaults to the number of CPUs.
+    _batch_fit_processes = ConfigOption(name='batch_fit_processes', default=None,
+                                        missing='nothing')
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         # locking for thread safety
         self.lock = Mutex()
 
-        filenames = []
         # for path in directories:
         path_list = [os.path.join(get_main_dir(), 'logic', 'fitmethods')]
         # adding additional path, to be defined in the config
@@ -82,12 +199,13 @@ class FitLogic(GenericLogic):
                 self.log.error('ConfigOption additional_predefined_methods_path needs to either be a string or '
                                'a list of strings.')
 
-        for path in path_list:
-            for f in os.listdir(path):
-                if os.path.isfile(os.path.join(path, f)) and f.endswith('.py'):
-                    filenames.append(f[:-3])
-                    if path not in sys.path:
-                        sys.path.append(path)
+        # Scan the fit method files for function definitions. Scans are cached per process and
+        # the modules are only imported when one of their functions is used.
+        self._fit_methods, outdated = _fit_method_registry.scan(path_list)
+        # Remove functions of changed files, they are resolved again on the next access
+        for method in outdated:
+            if method in FitLogic.__dict__:
+                delattr(FitLogic, method)
 
         # A dictionary containing all fit methods and their estimators.
         self.fit_list = OrderedDict()
@@ -95,31 +213,18 @@ class FitLogic(GenericLogic):
         self.fit_list['2d'] = OrderedDict()
         self.fit_list['3d'] = OrderedDict()
 
-        # Go through the fitmethods files and import all methods.
-        # Also determine which methods need to be added to the fit_list dictionary
+        # Determine which methods need to be added to the fit_list dictionary
         estimators_for_dict = list()
         models_for_dict = list()
         fits_for_dict = list()
 
-        for files in filenames:
-            mod = importlib.import_module('{0}'.format(files))
-            for method in dir(mod):
-                ref = getattr(mod, method)
-                if callable(ref) and (inspect.ismethod(ref) or inspect.isfunction(ref)):
-                    method_str = str(method)
-                    try:
-                        # import methods in Fitlogic
-                        setattr(FitLogic, method, ref)
-                        # append method to a list of methods to include in the fit_list dictionary
-                        if method_str.startswith('make_') and method_str.endswith('_fit'):
-                            fits_for_dict.append(method_str.split('_', 1)[1].rsplit('_', 1)[0])
-                        elif method_str.startswith('make_') and method_str.endswith('_model'):
-                            models_for_dict.append(method_str.split('_', 1)[1].rsplit('_', 1)[0])
-                        elif method_str.startswith('estimate_'):
-                            estimators_for_dict.append(method_str.split('_', 1)[1])
-                    except:
-                        self.log.error('Method "{0}" could not be imported to FitLogic.'
-                                       ''.format(str(method)))
+        for method_str in self._fit_methods:
+            if method_str.startswith('make_') and method_str.endswith('_fit'):
+                fits_for_dict.append(method_str.split('_', 1)[1].rsplit('_', 1)[0])
+            elif method_str.startswith('make_') and method_str.endswith('_model'):
+                models_for_dict.append(method_str.split('_', 1)[1].rsplit('_', 1)[0])
+            elif method_str.startswith('estimate_'):
+                estimators_for_dict.append(method_str.split('_', 1)[1])
 
         fits_for_dict.sort()
         models_for_dict.sort()
@@ -140,11 +245,11 @@ class FitLogic(GenericLogic):
             # Attach make_*_fit method to fit_list
             if fit_name not in self.fit_list[dimension]:
                 self.fit_list[dimension][fit_name] = OrderedDict()
-            self.fit_list[dimension][fit_name]['make_fit'] = getattr(self, fit_method)
+            self.fit_list[dimension][fit_name]['make_fit'] = LazyFitMethod(self, fit_method)
 
             # Attach make_*_model method to fit_list
             if fit_name in models_for_dict:
-                self.fit_list[dimension][fit_name]['make_model'] = getattr(self, model_method)
+                self.fit_list[dimension][fit_name]['make_model'] = LazyFitMethod(self, model_method)
             else:
                 self.log.error('No make_*_model method for fit "{0}" found in FitLogic.'
                                ''.format(fit_name))
@@ -154,11 +259,13 @@ class FitLogic(GenericLogic):
             for estimator_name in estimators_for_dict:
                 estimator_method = 'estimate_' + estimator_name
                 if fit_name == estimator_name:
-                    self.fit_list[dimension][fit_name]['generic'] = getattr(self, estimator_method)
+                    self.fit_list[dimension][fit_name]['generic'] = LazyFitMethod(
+                        self, estimator_method)
                     found_estimator = True
                 elif estimator_name.startswith(fit_name + '_'):
                     custom_name = estimator_name.split('_', 1)[1]
-                    self.fit_list[dimension][fit_name][custom_name] = getattr(self, estimator_method)
+                    self.fit_list[dimension][fit_name][custom_name] = LazyFitMethod(
+                        self, estimator_method)
                     found_estimator = True
             if not found_estimator:
                 self.log.error('No estimator method for fit "{0}" found in FitLogic.'
@@ -167,6 +274,22 @@ class FitLogic(GenericLogic):
         self.log.info('Methods were included to FitLogic, but only if naming is right: check the'
                       ' doxygen documentation if you added a new method and it does not show.')
 
+    def __getattr__(self, name):
+        """ Resolves the functions of the fit method files on their first access and attaches
+        them as methods to FitLogic.
+        """
+        fit_methods = self.__dict__.get('_fit_methods')
+        if fit_methods is None or name not in fit_methods:
+            raise AttributeError('\'{0}\' object has no attribute \'{1}\''.format(
+                type(self).__name__, name))
+        try:
+            method = _fit_method_registry.resolve(name, fit_methods[name])
+        except Exception as e:
+            self.log.exception('Method "{0}" could not be imported to FitLogic.'.format(name))
+            raise AttributeError(name) from e
+        setattr(FitLogic, name, method)
+        return getattr(self, name)
+
     def on_activate(self):
         """ Initialisation performed during activation of the module.
         """
@@ -283,6 +406,104 @@ class FitLogic(GenericLogic):
       
         return FitContainer(self, container_name, dimension)
 
+    def batch_fit(self, x_axis, data, fit_function, estimator=None, add_params=None,
+                  processes=None, **kwargs):
+        """ Fit a stack of 1D traces sharing the same x-axis, e.g. the ODMR spectra of all pixels
+            of a scan or all lines of the ODMR matrix.
+
+            @param numpy.array x_axis: 1D axis values
+            @param numpy.array data: traces along the last axis, i.e. of shape
+                                     (..., len(x_axis)). A 1D array is fitted as single trace.
+            @param str fit_function: 'lorentzian', 'gaussian', 'sine' or 'decayexponential'
+            @param str estimator: optional, estimator name as in fit_list (e.g. 'dip' or 'peak').
+                                  Defaults to 'dip' for lorentzian and 'peak' for gaussian.
+            @param Parameters or dict add_params: optional, parameters used for all traces
+                        instead of the values from the estimator (see _substitute_params)
+            @param int processes: optional, number of worker processes. Defaults to the config
+                                  option batch_fit_processes or the number of CPUs.
+            @param kwargs: additional keyword arguments passed on to lmfit.Model.fit
+
+            @return dict: fit results with the keys
+                'best_values': OrderedDict with the parameter names as keys and arrays of the
+                               best values as values
+                'errors': OrderedDict like best_values with the standard errors (NaN if not
+                          available)
+                'success': bool array, False if the fit failed
+                'redchi', 'chisqr': arrays of the reduced and total chi-square
+            All arrays have the shape data.shape[:-1].
+
+        Initial values are estimated for all traces at once. The fits themselves are distributed
+        over a pool of worker processes, the lmfit model is created only once per process.
+        """
+        if fit_function not in batch_fitting.BATCH_FIT_ESTIMATORS:
+            self.log.error('Batch fit "{0}" not available. Select one of {1}.'.format(
+                fit_function, list(batch_fitting.BATCH_FIT_ESTIMATORS)))
+            return None
+        estimators = batch_fitting.BATCH_FIT_ESTIMATORS[fit_function]
+        if estimator is None:
+            estimator = next(iter(estimators))
+        if estimator not in estimators:
+            self.log.error('Estimator "{0}" not available for batch fit "{1}". Select one of '
+                           '{2}.'.format(estimator, fit_function, list(estimators)))
+            return None
+
+        x_axis = np.asarray(x_axis, dtype='float64')
+        data = np.asarray(data, dtype='float64')
+        if x_axis.ndim != 1 or data.shape[-1:] != x_axis.shape or len(x_axis) < 3:
+            self.log.error('Batch fit needs a 1D x_axis of at least 3 values and traces of the '
+                           'same length along the last axis of data.')
+            return None
+        shape = data.shape[:-1]
+        data = data.reshape((-1, len(x_axis)))
+
+        # The estimators expect an increasing x_axis
+        sorted_indices = np.argsort(x_axis)
+        if not np.all(sorted_indices == np.arange(len(x_axis))):
+            x_axis = x_axis[sorted_indices]
+            data = data[:, sorted_indices]
+
+        initial_params = estimators[estimator](x_axis, data)
+        add_params = batch_fitting.parameters_to_dict(add_params)
+
+        if processes is None:
+            processes = self._batch_fit_processes
+        if processes is None:
+            processes = os.cpu_count()
+        # Starting the workers only pays off for a sufficient number of traces per process
+        processes = max(1, min(int(processes), len(data) // 16))
+
+        if processes > 1:
+            chunks = np.array_split(np.arange(len(data)), 4 * processes)
+            args = [(fit_function, x_axis, data[chunk],
+                     {name: tuple(arr[chunk] for arr in bounds)
+                      for name, bounds in initial_params.items()},
+                     add_params, kwargs)
+                    for chunk in chunks if len(chunk) > 0]
+            with multiprocessing.Pool(processes=processes) as pool:
+                results = pool.starmap(batch_fitting.fit_traces, args)
+            result = {key: np.concatenate([res[key] for res in results])
+                      for key in results[0]}
+        else:
+            result = batch_fitting.fit_traces(fit_function, x_axis, data, initial_params,
+                                              add_params, kwargs)
+
+        failed = np.count_nonzero(~result['success'])
+        if failed > 0:
+            self.log.warning('Batch fit "{0}" did not succeed for {1:d} of {2:d} traces.'
+                             ''.format(fit_function, failed, len(data)))
+
+        param_names = list(batch_fitting.get_batch_model(fit_function).make_params())
+        fit_result = dict()
+        fit_result['best_values'] = OrderedDict(
+            (name, result['best_values'][:, column].reshape(shape))
+            for column, name in enumerate(param_names))
+        fit_result['errors'] = OrderedDict(
+            (name, result['errors'][:, column].reshape(shape))
+            for column, name in enumerate(param_names))
+        for key in ('success', 'redchi', 'chisqr'):
+            fit_result[key] = result[key].reshape(shape)
+        return fit_result
+
 
 class FitContainer(QtCore.QObject):
     """ A class for managing a single flexible fit setting in a logic module.
@@ -31,6 +31,7 @@ import matplotlib.pyplot as plt
 
 from logic.generic_logic import GenericLogic
 from core.util.mutex import Mutex
+from core.util.percentile import data_percentiles
 from core.connector import Connector
 from core.configoption import ConfigOption
 from core.statusvariable import StatusVar
@@ -129,11 +130,7 @@ class ODMRLogic(GenericLogic):
         # Initalize the ODMR data arrays (mean signal and sweep matrix)
         self._initialize_odmr_plots()
         # Raw data array
-        self.odmr_raw_data = np.zeros(
-            [self.number_of_lines,
-             len(self._odmr_counter.get_odmr_channels()),
-             self.odmr_plot_x.size]
-        )
+        self._allocate_sweep_buffer(self.number_of_lines)
 
         # Switch off microwave and set CW frequency and power
         self.mw_off()
@@ -268,18 +265,9 @@ class ODMRLogic(GenericLogic):
         """
         self.lines_to_average = int(lines_to_average)
 
-        if self.lines_to_average <= 0:
-            self.odmr_plot_y = np.mean(
-                self.odmr_raw_data[:max(1, self.elapsed_sweeps), :, :],
-                axis=0,
-                dtype=np.float64
-            )
-        else:
-            self.odmr_plot_y = np.mean(
-                self.odmr_raw_data[:max(1, min(self.lines_to_average, self.elapsed_sweeps)), :, :],
-                axis=0,
-                dtype=np.float64
-            )
+        # The averaging window changed, so rebuild the windowed running sum once from the buffer
+        self._recalculate_window_sum()
+        self._update_odmr_plot_y()
 
         self.sigOdmrPlotsUpdated.emit(self.odmr_plot_x, self.odmr_plot_y, self.odmr_plot_xy)
         self.sigParameterUpdated.emit({'average_length': self.lines_to_average})
@@ -670,11 +658,7 @@ class ODMRLogic(GenericLogic):
                 estimated_number_of_lines = self.number_of_lines
             self.log.debug('Estimated number of raw data lines: {0:d}'
                            ''.format(estimated_number_of_lines))
-            self.odmr_raw_data = np.zeros(
-                [estimated_number_of_lines,
-                 len(self._odmr_counter.get_odmr_channels()),
-                 self.odmr_plot_x.size]
-            )
+            self._allocate_sweep_buffer(estimated_number_of_lines)
             self.sigNextLine.emit()
             return 0
 
@@ -767,45 +751,11 @@ class ODMRLogic(GenericLogic):
                 self.sigNextLine.emit()
                 return
 
-            # Add new count data to raw_data array and append if array is too small
+            # Add new count data to the sweep buffer and update the running averages
             if self._clearOdmrData:
-                self.odmr_raw_data[:, :, :] = 0
+                self._clear_sweep_buffer()
                 self._clearOdmrData = False
-            if self.elapsed_sweeps == (self.odmr_raw_data.shape[0] - 1):
-                expanded_array = np.zeros(self.odmr_raw_data.shape)
-                self.odmr_raw_data = np.concatenate((self.odmr_raw_data, expanded_array), axis=0)
-                self.log.warning('raw data array in ODMRLogic was not big enough for the entire '
-                                 'measurement. Array will be expanded.\nOld array shape was '
-                                 '({0:d}, {1:d}), new shape is ({2:d}, {3:d}).'
-                                 ''.format(self.odmr_raw_data.shape[0] - self.number_of_lines,
-                                           self.odmr_raw_data.shape[1],
-                                           self.odmr_raw_data.shape[0],
-                                           self.odmr_raw_data.shape[1]))
-
-            # shift data in the array "up" and add new data at the "bottom"
-            self.odmr_raw_data = np.roll(self.odmr_raw_data, 1, axis=0)
-
-            self.odmr_raw_data[0] = new_counts
-
-            # Add new count data to mean signal
-            if self._clearOdmrData:
-                self.odmr_plot_y[:, :] = 0
-
-            if self.lines_to_average <= 0:
-                self.odmr_plot_y = np.mean(
-                    self.odmr_raw_data[:max(1, self.elapsed_sweeps), :, :],
-                    axis=0,
-                    dtype=np.float64
-                )
-            else:
-                self.odmr_plot_y = np.mean(
-                    self.odmr_raw_data[:max(1, min(self.lines_to_average, self.elapsed_sweeps)), :, :],
-                    axis=0,
-                    dtype=np.float64
-                )
-
-            # Set plot slice of matrix
-            self.odmr_plot_xy = self.odmr_raw_data[:self.number_of_lines, :, :]
+            self._add_sweep(new_counts)
 
             # Update elapsed time/sweeps
             self.elapsed_sweeps += 1
@@ -818,6 +768,113 @@ class ODMRLogic(GenericLogic):
             self.sigNextLine.emit()
             return
 
+    def _allocate_sweep_buffer(self, capacity):
+        """ Preallocate the raw data sweep buffer and reset the running sums.
+
+        @param int capacity: number of sweeps the buffer can hold before it needs to be expanded
+
+        The buffer is filled from the back towards the front with a write pointer, so the newest
+        sweep is always at the write pointer and the sweeps in chronological order (newest first)
+        form a contiguous block. This way odmr_raw_data and odmr_plot_xy are simple views into the
+        buffer. number_of_lines rows of zeros are kept after the last sweep to pad the matrix view
+        at the beginning of a measurement.
+        """
+        capacity = max(1, int(capacity))
+        self._sweep_buffer = np.zeros(
+            [capacity + self.number_of_lines,
+             len(self._odmr_counter.get_odmr_channels()),
+             self.odmr_plot_x.size]
+        )
+        self._sweep_capacity = capacity
+        self._write_pointer = capacity
+        self._sweep_sum = np.zeros(self._sweep_buffer.shape[1:])
+        self._window_sum = np.zeros(self._sweep_buffer.shape[1:])
+        self._update_sweep_views()
+        return
+
+    def _expand_sweep_buffer(self, capacity):
+        """ Reallocate the sweep buffer to a larger capacity and copy the already recorded sweeps.
+
+        @param int capacity: new number of sweeps the buffer can hold
+        """
+        old_buffer = self._sweep_buffer
+        old_sweeps = self._sweep_capacity - self._write_pointer
+        self._sweep_buffer = np.zeros([capacity + self.number_of_lines, *old_buffer.shape[1:]])
+        self._sweep_buffer[capacity - old_sweeps:capacity] = \
+            old_buffer[self._write_pointer:self._sweep_capacity]
+        self._sweep_capacity = capacity
+        self._write_pointer = capacity - old_sweeps
+        return
+
+    def _clear_sweep_buffer(self):
+        """ Discard all recorded sweeps without reallocating the buffer. """
+        self._write_pointer = self._sweep_capacity
+        self._sweep_sum[:] = 0
+        self._window_sum[:] = 0
+        self._update_sweep_views()
+        return
+
+    def _add_sweep(self, new_counts):
+        """ Insert a new sweep into the buffer and update the running sums and mean signal.
+
+        @param numpy.ndarray new_counts: counts of the new sweep with shape (channels, frequencies)
+
+        The cost per sweep only depends on the number of frequency points (apart from the rare,
+        amortized buffer expansion) and not on the number of sweeps already recorded.
+        """
+        if self._write_pointer == 0:
+            self._expand_sweep_buffer(2 * self._sweep_capacity)
+            self.log.warning('raw data array in ODMRLogic was not big enough for the entire '
+                             'measurement. Array will be expanded.\nOld array shape was '
+                             '({0:d}, {1:d}), new shape is ({2:d}, {3:d}).'
+                             ''.format(self._sweep_capacity // 2,
+                                       self._sweep_buffer.shape[1],
+                                       self._sweep_capacity,
+                                       self._sweep_buffer.shape[1]))
+        self._write_pointer -= 1
+        self._sweep_buffer[self._write_pointer] = new_counts
+
+        self._sweep_sum += self._sweep_buffer[self._write_pointer]
+        self._window_sum += self._sweep_buffer[self._write_pointer]
+        # Remove the sweep that just dropped out of the averaging window
+        if self.lines_to_average > 0:
+            dropped_index = self._write_pointer + self.lines_to_average
+            if dropped_index < self._sweep_capacity:
+                self._window_sum -= self._sweep_buffer[dropped_index]
+
+        self._update_sweep_views()
+        self._update_odmr_plot_y()
+        return
+
+    def _recalculate_window_sum(self):
+        """ Recalculate the running sum over the last lines_to_average sweeps from the buffer. """
+        if self.lines_to_average > 0:
+            stop = min(self._write_pointer + self.lines_to_average, self._sweep_capacity)
+        else:
+            stop = self._sweep_capacity
+        self._window_sum = np.sum(self._sweep_buffer[self._write_pointer:stop], axis=0)
+        return
+
+    def _update_odmr_plot_y(self):
+        """ Calculate the mean signal from the running sums. """
+        number_of_sweeps = self._sweep_capacity - self._write_pointer
+        if self.lines_to_average <= 0:
+            self.odmr_plot_y = self._sweep_sum / max(1, number_of_sweeps)
+        else:
+            self.odmr_plot_y = self._window_sum / max(1, min(self.lines_to_average,
+                                                               number_of_sweeps))
+        return
+
+    def _update_sweep_views(self):
+        """ Update odmr_raw_data and odmr_plot_xy. Both are views into the sweep buffer. """
+        if self._sweep_buffer.shape[0] - self._sweep_capacity < self.number_of_lines:
+            # The number of matrix lines has been increased, more zero padding is needed
+            self._expand_sweep_buffer(self._sweep_capacity)
+        self.odmr_raw_data = self._sweep_buffer[self._write_pointer:self._sweep_capacity]
+        self.odmr_plot_xy = self._sweep_buffer[
+                            self._write_pointer:self._write_pointer + self.number_of_lines]
+        return
+
     def get_odmr_channels(self):
         return self._odmr_counter.get_odmr_channels()
 
@@ -969,7 +1026,9 @@ class ODMRLogic(GenericLogic):
                                  If not supplied then a default of data_min to data_max
                                  will be used.
 
-        @param: list percentile_range: (optional) Percentile range of the chosen cbar_range.
+        @param: list percentile_range: (optional) Percentile range of the chosen cbar_range. If no
+                                       cbar_range is given, it is calculated from these
+                                       percentiles of the non-zero matrix data.
 
         @return: fig fig: a matplotlib figure object to be saved to file.
         """
@@ -993,8 +1052,11 @@ class ODMRLogic(GenericLogic):
             fit_count_vals = 0.0
         matrix_data = self.select_odmr_matrix_data(self.odmr_plot_xy, channel_number, freq_range)
 
-        # If no colorbar range was given, take full range of data
-        if cbar_range is None:
+        # If no colorbar range was given, take the percentile range (excluding zeros of an unfinished
+        # scan) or full range of data
+        if cbar_range is None and percentile_range is not None:
+            cbar_range = data_percentiles(matrix_data, percentile_range)
+        if cbar_range is None or not np.all(np.isfinite(cbar_range)):
             cbar_range = np.array([np.min(matrix_data), np.max(matrix_data)])
         else:
             cbar_range = np.array(cbar_range)
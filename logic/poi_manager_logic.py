@@ -23,6 +23,7 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 
 import os
 import numpy as np
+from scipy import ndimage
 import time
 
 from collections import OrderedDict
@@ -34,6 +35,92 @@ from qtpy import QtCore
 from core.util.mutex import Mutex
 
 
+def find_spots(scan, filter_size, window_threshold, subpixel=False):
+    """ Finds the spot-shaped local maxima in a 2D scan image.
+
+    A square window of filter_size x filter_size pixels is slid over the image. A spot is found at
+    the center pixel of a window if
+        - the center pixel is the maximum of the window,
+        - the mean of the window is larger than window_threshold and
+        - the window has a spot shape, i.e. the mean of the center row and center column deviate by
+          less than 20% from each other and at most 4 rows and columns have a larger mean than the
+          center row/column.
+    All window statistics are calculated for all windows at once from sliding sums and a maximum
+    filter.
+
+    @param numpy.ndarray scan: 2D scan image
+    @param int filter_size: Edge length of the window in pixels
+    @param float window_threshold: Minimum mean value of the window
+    @param bool subpixel: Refine the spot positions by the intensity centroid of the window
+
+    @return (numpy.ndarray, numpy.ndarray): row and column indices of the spots (float if subpixel)
+    """
+    scan = np.asarray(scan, dtype=float)
+    size = int(filter_size)
+    # Top-left corners of all windows to check
+    n_rows = scan.shape[0] - size
+    n_cols = scan.shape[1] - size
+    if size < 1 or n_rows < 1 or n_cols < 1:
+        return np.empty(0, dtype=float if subpixel else int), \
+               np.empty(0, dtype=float if subpixel else int)
+    mid = size // 2
+
+    # Sums of all horizontal (row_sums) and vertical (col_sums) lines of length size.
+    # row_sums[r, c] = scan[r, c:c+size].sum(), col_sums[r, c] = scan[r:r+size, c].sum()
+    cumsum = np.zeros((scan.shape[0], scan.shape[1] + 1))
+    np.cumsum(scan, axis=1, out=cumsum[:, 1:])
+    row_sums = cumsum[:, size:] - cumsum[:, :-size]
+    cumsum = np.zeros((scan.shape[0] + 1, scan.shape[1]))
+    np.cumsum(scan, axis=0, out=cumsum[1:])
+    col_sums = cumsum[size:] - cumsum[:-size]
+    del cumsum
+
+    # Mean of the center row and center column of each window
+    center_row_mean = row_sums[mid:mid + n_rows, :n_cols] / size
+    center_col_mean = col_sums[:n_rows, mid:mid + n_cols] / size
+
+    # Number of rows and columns with a larger mean than the center row/column
+    brighter_lines = np.zeros((n_rows, n_cols), dtype=int)
+    for offset in range(size):
+        brighter_lines += row_sums[offset:offset + n_rows, :n_cols] / size > center_row_mean
+        brighter_lines += col_sums[:n_rows, offset:offset + n_cols] / size > center_col_mean
+    is_spot = brighter_lines <= 4
+    # Windows elongated in one direction are rejected
+    if size > 1:
+        is_spot &= center_row_mean <= center_col_mean * 1.2
+        is_spot &= center_col_mean <= center_row_mean * 1.2
+
+    # The window mean must exceed the threshold
+    cumsum = np.zeros((row_sums.shape[0] + 1, n_cols))
+    np.cumsum(row_sums[:, :n_cols], axis=0, out=cumsum[1:])
+    window_sums = cumsum[size:size + n_rows] - cumsum[:n_rows]
+    is_spot &= window_sums / size ** 2 > window_threshold
+
+    # The center pixel must be the maximum of the window
+    window_max = ndimage.maximum_filter(scan, size=size)
+    center = (slice(mid, mid + n_rows), slice(mid, mid + n_cols))
+    is_spot &= scan[center] == window_max[center]
+
+    rows, cols = np.nonzero(is_spot)
+    if not subpixel:
+        return rows + mid, cols + mid
+
+    # Intensity centroid of each window
+    offsets = np.arange(size)
+    row_centroids = np.empty(rows.size)
+    col_centroids = np.empty(cols.size)
+    for ii, (row, col) in enumerate(zip(rows, cols)):
+        window = scan[row:row + size, col:col + size]
+        total = window.sum()
+        if total > 0:
+            row_centroids[ii] = row + np.dot(window.sum(axis=1), offsets) / total
+            col_centroids[ii] = col + np.dot(window.sum(axis=0), offsets) / total
+        else:
+            row_centroids[ii] = row + mid
+            col_centroids[ii] = col + mid
+    return row_centroids, col_centroids
+
+
 class RegionOfInterest:
     """
     Class containing the general information about a specific region of interest (ROI),
@@ -1188,71 +1275,46 @@ class PoiManagerLogic(GenericLogic):
         arr_size = int(spot_size / pixel_size)
         return arr_size
 
-    def _is_spot_shape(self, local_arr):
-        unspot_e = 0
-        ensem_e = 0
-        len_arr = len(local_arr)
-        mid_f = int(0.5 * len_arr)
-        hm_local_arr = local_arr[mid_f].mean()
-        vm_local_arr = local_arr[:, mid_f].mean()
-        for i in range(0, len_arr):
-            if local_arr[i].mean() > hm_local_arr:
-                ensem_e += 1
-            if local_arr[:, i].mean() > vm_local_arr:
-                ensem_e += 1
-            if hm_local_arr > vm_local_arr * 1.2:
-                unspot_e += 1
-            if vm_local_arr > hm_local_arr * 1.2:
-                unspot_e += 1
-        if ensem_e > 4:
-            return False
-        elif unspot_e > 1:
-            return False
-        else:
-            return True
-
-    def _local_max(self, scan):
-        scan = np.asarray(scan, order="C")  # scan has to be a 2-D array
-        filter_size = self._spot_filter(scan)
-        scan_m = scan.mean()
-        mid_f = int(filter_size / 2)
-        xc = []
-        yc = []
-        for i in range(0, len(scan) - filter_size):
-            for j in range(0, len(scan[i]) - filter_size):
-                local_arr = scan[i:i + filter_size, j:j + filter_size]
-                local_arr = np.asarray(local_arr)
-                arr_threshold = scan_m * self._poi_threshold * 0.5
-                if scan[i + mid_f][j + mid_f] == local_arr.max() and self._is_spot_shape(local_arr) and local_arr.mean() > arr_threshold:
-                    xc.append(i + mid_f)
-                    yc.append(j + mid_f)
-        return xc, yc
-
-    def auto_catch_poi(self):
-        scan_image = self.roi_scan_image.T
+    def _local_max(self, scan, subpixel=False):
+        """ Finds the spot-shaped local maxima in a scan image.
+
+        @param numpy.ndarray scan: 2D scan image (first index is the x-axis)
+        @param bool subpixel: Refine the spot positions by the intensity centroid of the window
+
+        @return (numpy.ndarray, numpy.ndarray): x and y pixel indices of the local maxima
+        """
+        scan = np.asarray(scan, dtype=float, order='C')  # scan has to be a 2-D array
+        return find_spots(scan,
+                          filter_size=self._spot_filter(scan),
+                          window_threshold=scan.mean() * self._poi_threshold * 0.5,
+                          subpixel=subpixel)
+
+    def auto_catch_poi(self, subpixel=False):
+        """ Adds a POI for every spot in the current ROI scan image which is brighter than
+        poi_threshold times the mean image intensity.
+
+        @param bool subpixel: Refine the POI positions with sub-pixel resolution
+        """
+        # The spot detection works on the counts truncated to integers
+        scan_image = np.trunc(self.roi_scan_image.T)
         x_range = self.roi_scan_image_extent[0]
         y_range = self.roi_scan_image_extent[1]
-        x_axis = np.arange(x_range[0], x_range[1], (x_range[1] - x_range[0]) / len(scan_image))
-        y_axis = np.arange(y_range[0], y_range[1], (y_range[1] - y_range[0]) / len(scan_image[0]))
+        x_step = (x_range[1] - x_range[0]) / len(scan_image)
+        y_step = (y_range[1] - y_range[0]) / len(scan_image[0])
 
-        for i in range(0, len(scan_image)):
-            for j in range(0, len(scan_image[i])):
-                scan_image[i][j] = int(scan_image[i][j])  # data here somehow needs to be reset, otherwise shit happens.
+        if self._spot_filter(scan_image) < 1:
+            self.log.warning('POI diameter is smaller than the pixel size of the ROI scan image. '
+                             'Unable to detect POIs.')
+            return
 
         threshold = scan_image.mean() * self._poi_threshold
 
-        xc1, yc1 = self._local_max(scan_image)
-        xc2 = []
-        yc2 = []
-        for i in range(0, len(xc1)):
-            if scan_image[xc1[i], yc1[i]] > threshold:
-                xc2.append(xc1[i])
-                yc2.append(yc1[i])
+        xc, yc = self._local_max(scan_image, subpixel=subpixel)
+        peak_values = scan_image[np.rint(xc).astype(int), np.rint(yc).astype(int)]
+        is_bright = peak_values > threshold
 
-        pois = np.zeros((len(xc2), 3))
         z = self.scanner_position[2]
-        for i in range(0, len(pois)):
-            pois[i] = [x_axis[xc2[i]], y_axis[yc2[i]], z]
-            self.add_poi(pois[i])
+        for x_index, y_index in zip(xc[is_bright], yc[is_bright]):
+            self.add_poi([x_range[0] + x_index * x_step, y_range[0] + y_index * y_step, z])
             if self.poi_nametag is None:
-                time.sleep(0.1)
\ No newline at end of file
+                time.sleep(0.1)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the Qudi helper class to memoize the analysis results of pulse objects.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import copy
+from collections import OrderedDict
+
+from core.util.mutex import Mutex
+
+
+class PulseAnalysisCache:
+    """
+    Memoizes the results of SequenceGeneratorLogic.analyze_block_ensemble and analyze_sequence.
+
+    Entries are identified by a hashable key describing the content of the analyzed object and
+    all settings the analysis depends on. In addition each entry records the names of the saved
+    PulseBlocks and PulseBlockEnsembles it has been derived from, so it can be invalidated as soon
+    as one of them is saved again or deleted.
+    Results are copied when stored and returned, so callers are free to modify them.
+    If more than max_entries results are stored, the least recently used ones are dropped.
+    """
+
+    def __init__(self, max_entries=256):
+        """
+        @param int max_entries: Maximum number of stored analysis results
+        """
+        self.max_entries = int(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = Mutex()
+        self._entries = OrderedDict()
+        # Keys of the entries depending on a saved asset. Keys are tuples of
+        # (asset type, asset name), values are sets of entry keys.
+        self._dependencies = dict()
+        return
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def statistics(self):
+        """ Number of cache hits, misses and stored entries """
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+    def get(self, key):
+        """ Returns a copy of the memoized analysis result.
+
+        @param tuple key: entry key
+
+        @return dict: analysis result. None if not present.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[0])
+
+    def put(self, key, result, blocks=(), ensembles=()):
+        """ Stores a copy of an analysis result.
+
+        @param tuple key: entry key
+        @param dict result: analysis result
+        @param iterable blocks: names of the PulseBlocks the result depends on
+        @param iterable ensembles: names of the PulseBlockEnsembles the result depends on
+        """
+        dependencies = [('block', name) for name in blocks]
+        dependencies.extend(('ensemble', name) for name in ensembles)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (copy.deepcopy(result), dependencies)
+            for dependency in dependencies:
+                self._dependencies.setdefault(dependency, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return
+
+    def invalidate(self, asset_type, name):
+        """ Removes all entries depending on a saved asset.
+
+        @param str asset_type: 'block' or 'ensemble'
+        @param str name: asset name
+        """
+        with self._lock:
+            for key in list(self._dependencies.get((asset_type, name), ())):
+                self._remove(key)
+        return
+
+    def clear(self):
+        """ Removes all entries and resets the hit/miss counters """
+        with self._lock:
+            self._entries.clear()
+            self._dependencies.clear()
+            self.hits = 0
+            self.misses = 0
+        return
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for dependency in entry[1]:
+            keys = self._dependencies.get(dependency)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._dependencies[dependency]
+        return
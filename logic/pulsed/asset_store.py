@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the Qudi helper classes to store pulse objects (PulseBlock, PulseBlockEnsemble
+and PulseSequence) in a single indexed file.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import pickle
+import sqlite3
+import hashlib
+from collections import OrderedDict
+
+from core.util.mutex import Mutex
+from core.util.helpers import natural_sort
+
+
+class PulseAssetStore:
+    """
+    Stores the dict representations (get_dict_representation) of pulse objects in a single SQLite
+    database file.
+
+    Each asset is identified by its type ('block', 'ensemble' or 'sequence') and its name, so
+    single assets can be loaded and written without touching all others. Writing an asset that has
+    not changed since it has been loaded or saved the last time is skipped.
+    """
+    asset_types = ('block', 'ensemble', 'sequence')
+
+    def __init__(self, path):
+        """
+        @param str path: Path of the database file. It is created if it does not exist.
+        """
+        self.path = path
+        self._lock = Mutex()
+        # The logic module might be accessed from different threads. All access to the connection
+        # is serialized by the lock.
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS assets ('
+                                     'type TEXT NOT NULL, '
+                                     'name TEXT NOT NULL, '
+                                     'data BLOB NOT NULL, '
+                                     'PRIMARY KEY (type, name))')
+        # Digests of the serialized assets last loaded/saved. Used to skip unchanged assets.
+        self._digests = dict()
+        return
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+            self._digests.clear()
+        return
+
+    def names(self, asset_type):
+        """ Returns the naturally sorted names of all stored assets of a type.
+
+        @param str asset_type: 'block', 'ensemble' or 'sequence'
+
+        @return list: asset names
+        """
+        with self._lock:
+            cursor = self._connection.execute('SELECT name FROM assets WHERE type=?',
+                                              (asset_type,))
+            return natural_sort(row[0] for row in cursor)
+
+    def load(self, asset_type, name):
+        """ Loads the dict representation of a single asset.
+
+        @param str asset_type: 'block', 'ensemble' or 'sequence'
+        @param str name: asset name
+
+        @return dict: dict representation of the asset. None if not present.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT data FROM assets WHERE type=? AND name=?',
+                                           (asset_type, name)).fetchone()
+            if row is None:
+                return None
+            data = bytes(row[0])
+            self._digests[(asset_type, name)] = hashlib.sha1(data).digest()
+        return pickle.loads(data)
+
+    def save(self, asset_type, name, dict_repr):
+        """ Stores the dict representation of a single asset. Unchanged assets are not written.
+
+        @param str asset_type: 'block', 'ensemble' or 'sequence'
+        @param str name: asset name
+        @param dict dict_repr: dict representation of the asset
+
+        @return bool: True if the asset has been written, False if unchanged
+        """
+        return self.save_many(asset_type, {name: dict_repr}) > 0
+
+    def save_many(self, asset_type, dict_reprs):
+        """ Stores the dict representations of multiple assets of a type in a single transaction.
+
+        @param str asset_type: 'block', 'ensemble' or 'sequence'
+        @param dict dict_reprs: dict representations of the assets. Keys are the asset names.
+
+        @return int: Number of assets written
+        """
+        rows = list()
+        digests = dict()
+        for name, dict_repr in dict_reprs.items():
+            data = pickle.dumps(dict_repr, protocol=pickle.HIGHEST_PROTOCOL)
+            digest = hashlib.sha1(data).digest()
+            if self._digests.get((asset_type, name)) != digest:
+                rows.append((asset_type, name, sqlite3.Binary(data)))
+                digests[(asset_type, name)] = digest
+        if rows:
+            with self._lock:
+                with self._connection:
+                    self._connection.executemany(
+                        'INSERT OR REPLACE INTO assets (type, name, data) VALUES (?, ?, ?)', rows)
+                self._digests.update(digests)
+        return len(rows)
+
+    def delete(self, asset_type, name):
+        """ Removes a single asset from the store.
+
+        @param str asset_type: 'block', 'ensemble' or 'sequence'
+        @param str name: asset name
+        """
+        with self._lock:
+            with self._connection:
+                self._connection.execute('DELETE FROM assets WHERE type=? AND name=?',
+                                         (asset_type, name))
+            self._digests.pop((asset_type, name), None)
+        return
+
+
+class LazyAssetDict(OrderedDict):
+    """
+    OrderedDict of pulse objects that are only loaded on first access.
+
+    Initially only the names are known. The values are created by calling the loader function with
+    the name of the asset. If the loader returns None, the name is removed from the dict.
+    values() and items() return lists instead of views since they need to load all assets.
+    """
+    _not_loaded = object()
+
+    def __init__(self, names, loader):
+        """
+        @param iterable names: names of all available assets
+        @param callable loader: function returning the asset for a name (or None)
+        """
+        super().__init__((name, self._not_loaded) for name in names)
+        self._loader = loader
+        return
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if value is self._not_loaded:
+            value = self._loader(key)
+            if value is None:
+                super().__delitem__(key)
+                raise KeyError(key)
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key, *args):
+        try:
+            value = self[key]
+        except KeyError:
+            if args:
+                return args[0]
+            raise
+        del self[key]
+        return value
+
+    def items(self):
+        items = list()
+        for key in list(self.keys()):
+            try:
+                items.append((key, self[key]))
+            except KeyError:
+                pass
+        return items
+
+    def values(self):
+        return [value for key, value in self.items()]
+
+    def copy(self):
+        return OrderedDict(self.items())
+
+    @property
+    def loaded_names(self):
+        """ Names of all assets that have already been loaded """
+        return [key for key, value in dict.items(self) if value is not self._not_loaded]
@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the Qudi helper classes to sample PulseBlockEnsembles chunk by chunk.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import time
+import queue
+import threading
+import numpy as np
+
+from logic.pulsed.sampling_functions import SamplingWorkspace
+
+
+class EnsembleSampler:
+    """
+    Compiled sampling plan for a single PulseBlockEnsemble.
+
+    Instead of iterating over every block repetition and every PulseBlockElement during sampling,
+    the ensemble is compiled once into flat arrays holding the element index, start bin and
+    channel states for all elements in chronological order (incl. repetitions).
+    Digital channels and analog channels with constant sampling functions (Idle, DC) are then
+    filled by run-length expansion of these arrays. Only elements with time dependent sampling
+    functions are evaluated one by one. Identical elements with identical time offset (i.e.
+    repeated elements without rotating frame) are sampled only once.
+
+    This class is independent of the SequenceGeneratorLogic and only needs the PulseBlocks
+    referenced by the ensemble and the element lengths in bins as returned by
+    SequenceGeneratorLogic.analyze_block_ensemble.
+    """
+
+    def __init__(self, ensemble, blocks, elements_length_bins, sample_rate, analog_amplitudes,
+                 offset_bin=0, max_cache_bytes=64 * 1024 ** 2):
+        """
+        @param PulseBlockEnsemble ensemble: The PulseBlockEnsemble instance to sample
+        @param dict blocks: Dictionary containing (at least) all PulseBlock instances referenced
+                            by the ensemble. Keys are the block names.
+        @param numpy.ndarray elements_length_bins: Length in bins of each element in chronological
+                                                   order (incl. repetitions)
+        @param float sample_rate: The sample rate in samples/s
+        @param dict analog_amplitudes: Peak-to-peak amplitudes of the analog channels. Keys are
+                                       the analog channel descriptors.
+        @param int offset_bin: Time bin offset used for the time array of the first element.
+                               Needed to maintain the rotating frame across ensembles.
+        @param int max_cache_bytes: Maximum memory used to cache samples of repeated elements
+        """
+        self.rotating_frame = ensemble.rotating_frame
+        self.sample_rate = float(sample_rate)
+        self.offset_bin = int(offset_bin)
+
+        # Table of all unique elements (each element of each block used in the ensemble) and an
+        # array of indices into this table for every element in chronological order.
+        self._element_table = list()
+        block_offsets = dict()
+        element_ids = list()
+        for block_name, reps in ensemble.block_list:
+            block = blocks[block_name]
+            if block_name not in block_offsets:
+                block_offsets[block_name] = len(self._element_table)
+                self._element_table.extend(block.element_list)
+            block_ids = np.arange(block_offsets[block_name],
+                                  block_offsets[block_name] + len(block.element_list))
+            element_ids.append(np.tile(block_ids, reps + 1))
+        if element_ids:
+            self._element_ids = np.concatenate(element_ids).astype('int64')
+        else:
+            self._element_ids = np.empty(0, dtype='int64')
+
+        elements_length_bins = np.asarray(elements_length_bins, dtype='int64')
+        if elements_length_bins.size != self._element_ids.size:
+            raise ValueError('Number of element lengths ({0:d}) does not match the number of '
+                             'elements in PulseBlockEnsemble "{1}" ({2:d}).'
+                             ''.format(elements_length_bins.size, ensemble.name,
+                                       self._element_ids.size))
+        self._element_stops = np.cumsum(elements_length_bins)
+        self._element_starts = self._element_stops - elements_length_bins
+        self.number_of_samples = int(self._element_stops[-1]) if self._element_stops.size else 0
+
+        # Digital channel states of every element in chronological order
+        self._digital_states = dict()
+        digital_channels = set()
+        for element in self._element_table:
+            digital_channels.update(element.digital_high)
+        for chnl in digital_channels:
+            states = np.array([element.digital_high.get(chnl, False)
+                               for element in self._element_table], dtype=bool)
+            self._digital_states[chnl] = states[self._element_ids]
+
+        # Normalized values of constant analog sampling functions in chronological order.
+        # Elements with time dependent sampling functions are marked with NaN and flagged for
+        # evaluation.
+        self._analog_scale = {chnl: amp / 2 for chnl, amp in analog_amplitudes.items()}
+        self._analog_values = dict()
+        analog_channels = set()
+        for element in self._element_table:
+            analog_channels.update(element.pulse_function)
+        needs_evaluation = np.zeros(len(self._element_table), dtype=bool)
+        for chnl in analog_channels:
+            values = np.full(len(self._element_table), np.nan, dtype='float64')
+            for index, element in enumerate(self._element_table):
+                func = element.pulse_function.get(chnl)
+                if func is None:
+                    continue
+                if func.is_constant:
+                    values[index] = func.get_samples(np.zeros(1))[0] / self._analog_scale[chnl]
+                else:
+                    needs_evaluation[index] = True
+            self._analog_values[chnl] = values[self._element_ids]
+        self._evaluated_elements = np.flatnonzero(needs_evaluation[self._element_ids])
+
+        # Helper arrays to create the time arrays for the sampling functions without allocation
+        self._time_base = np.empty(0, dtype='float64')
+        self._time_buffer = np.empty(0, dtype='float64')
+        # Scratch memory shared by the sampling functions of all channels of an element
+        self._workspace = SamplingWorkspace()
+
+        # Cache for samples of repeated elements. Keys are tuples of
+        # (element table index, number of samples, time offset bin)
+        self._sample_cache = dict()
+        self._cache_bytes_left = max_cache_bytes
+        return
+
+    @property
+    def final_offset_bin(self):
+        """ The offset bin to pass on to the next ensemble in order to maintain the rotating frame.
+        """
+        if self.rotating_frame:
+            return self.offset_bin + self.number_of_samples
+        return self.offset_bin
+
+    def fill_chunk(self, start_bin, analog_samples, digital_samples):
+        """ Sample a chunk of the ensemble into preallocated sample arrays.
+
+        @param int start_bin: Position of the first sample of the chunk within the ensemble
+        @param dict analog_samples: float32 arrays to write the analog samples into. Keys are the
+                                    analog channel descriptors. The chunk length is given by the
+                                    length of these arrays.
+        @param dict digital_samples: bool arrays to write the digital samples into. Keys are the
+                                     digital channel descriptors.
+        """
+        for samples in list(analog_samples.values()) + list(digital_samples.values()):
+            chunk_length = samples.size
+            break
+        else:
+            return
+        stop_bin = start_bin + chunk_length
+
+        # Find all elements overlapping with the chunk and the part of each element within it
+        first = max(np.searchsorted(self._element_starts, start_bin, side='right') - 1, 0)
+        last = np.searchsorted(self._element_starts, stop_bin, side='left')
+        lengths = (np.minimum(self._element_stops[first:last], stop_bin) -
+                   np.maximum(self._element_starts[first:last], start_bin))
+
+        # Run-length expansion of digital states and constant analog values
+        for chnl, samples in digital_samples.items():
+            samples[:] = np.repeat(self._digital_states[chnl][first:last], lengths)
+        for chnl, samples in analog_samples.items():
+            samples[:] = np.repeat(self._analog_values[chnl][first:last], lengths)
+
+        # Evaluate time dependent sampling functions element by element
+        eval_start = np.searchsorted(self._evaluated_elements, first, side='left')
+        eval_stop = np.searchsorted(self._evaluated_elements, last, side='left')
+        for index in self._evaluated_elements[eval_start:eval_stop]:
+            element_start = max(self._element_starts[index], start_bin)
+            element_stop = min(self._element_stops[index], stop_bin)
+            if element_stop <= element_start:
+                continue
+            # Inside the rotating frame the time array continues with the absolute sample position
+            time_offset = self.offset_bin + element_start if self.rotating_frame else self.offset_bin
+            self._sample_element(element_id=self._element_ids[index],
+                                 time_offset=time_offset,
+                                 length=element_stop - element_start,
+                                 write_index=element_start - start_bin,
+                                 analog_samples=analog_samples)
+        return
+
+    def get_digital_runs(self, digital_channels):
+        """ Run-length encoding of the digital channels for the entire ensemble without creating
+        the sample arrays. Consecutive elements with the same state are merged into a single run.
+
+        @param iterable digital_channels: digital channel descriptors. Channels not used by any
+                                          element are low for the entire ensemble.
+
+        @return dict: (lengths, states) tuples of numpy.ndarrays (int64 and bool) for each channel.
+                      lengths holds the number of samples of each run, states its state.
+        """
+        lengths = self._element_stops - self._element_starts
+        non_empty = lengths > 0
+        lengths = lengths[non_empty]
+        runs = dict()
+        for chnl in digital_channels:
+            if chnl in self._digital_states:
+                states = self._digital_states[chnl][non_empty]
+            else:
+                states = np.zeros(lengths.size, dtype=bool)
+            if states.size == 0:
+                runs[chnl] = (np.empty(0, dtype='int64'), np.empty(0, dtype=bool))
+                continue
+            run_starts = np.flatnonzero(np.concatenate(([True], states[1:] != states[:-1])))
+            runs[chnl] = (np.add.reduceat(lengths, run_starts), states[run_starts])
+        return runs
+
+    def _sample_element(self, element_id, time_offset, length, write_index, analog_samples):
+        """ Evaluate the time dependent sampling functions of a single element (or part of it)
+        directly into the sample arrays.
+        """
+        write_slice = slice(write_index, write_index + length)
+        cache_key = (element_id, length, time_offset)
+        cached_samples = self._sample_cache.get(cache_key)
+        if cached_samples is not None:
+            for chnl, samples in cached_samples.items():
+                analog_samples[chnl][write_slice] = samples
+            return
+
+        element = self._element_table[element_id]
+        time_arr = self._get_time_array(time_offset, length)
+        self._workspace.reset(time_arr)
+        evaluated_channels = list()
+        for chnl, func in element.pulse_function.items():
+            if func.is_constant:
+                continue
+            func.get_samples_into(time_arr,
+                                  out=analog_samples[chnl][write_slice],
+                                  scale=self._analog_scale[chnl],
+                                  workspace=self._workspace)
+            evaluated_channels.append(chnl)
+
+        # Without rotating frame the same element will produce the same samples again.
+        if not self.rotating_frame:
+            cache_bytes = 4 * length * len(evaluated_channels)
+            if cache_bytes <= self._cache_bytes_left:
+                self._cache_bytes_left -= cache_bytes
+                self._sample_cache[cache_key] = {
+                    chnl: analog_samples[chnl][write_slice].copy() for chnl in evaluated_channels}
+        return
+
+    def _get_time_array(self, time_offset, length):
+        """ Returns the time array (in s) for the given offset bin and length. The returned array
+        is a view into a buffer reused for each element.
+        """
+        if self._time_base.size < length:
+            self._time_base = np.arange(length, dtype='float64')
+            self._time_buffer = np.empty(length, dtype='float64')
+        time_arr = self._time_buffer[:length]
+        np.add(time_offset, self._time_base[:length], out=time_arr)
+        time_arr /= self.sample_rate
+        return time_arr
+
+
+class ChunkPipeline:
+    """
+    Iterates over the sample chunks of an EnsembleSampler.
+
+    With two or more buffers the chunks are sampled by a worker thread into a fixed set of
+    preallocated chunk buffers while the calling thread consumes the previous chunk (e.g. writes it
+    to the pulse generator). Since numpy releases the GIL for most of the sampling work, sampling
+    and writing overlap. The memory used is bounded by the number of buffers times the chunk size.
+    With a single buffer (or a single chunk) the chunks are sampled in the calling thread.
+
+    Iterating yields (chunk_slice, analog_samples, digital_samples) tuples. The sample arrays are
+    reused and only valid until the next chunk is requested.
+    """
+
+    def __init__(self, sampler, analog_channels, digital_channels, chunk_length, buffers=2,
+                 chunk_callback=None):
+        """
+        @param EnsembleSampler sampler: compiled sampling plan of the ensemble to sample
+        @param iterable analog_channels: analog channel descriptors to sample
+        @param iterable digital_channels: digital channel descriptors to sample
+        @param int chunk_length: Maximum number of samples per chunk
+        @param int buffers: Number of chunk buffers. Sampling is done in a worker thread for
+                            values > 1.
+        @param callable chunk_callback: Optional function called with (chunk_slice, analog_samples,
+                                        digital_samples) right after a chunk has been sampled. It is
+                                        called from the worker thread in pipelined mode.
+        """
+        self.sampler = sampler
+        self.number_of_samples = int(sampler.number_of_samples)
+        self.chunk_length = max(int(chunk_length), 1)
+        self.buffers = max(int(buffers), 1)
+        if self.number_of_samples <= self.chunk_length:
+            self.buffers = 1
+        self.chunk_callback = chunk_callback
+        # Accumulated time in s spent sampling the chunks and waiting for sampled chunks
+        self.sampling_time = 0.0
+        self.wait_time = 0.0
+
+        buffer_length = min(self.chunk_length, self.number_of_samples)
+        self._buffers = [({chnl: np.empty(buffer_length, dtype='float32')
+                           for chnl in analog_channels},
+                          {chnl: np.empty(buffer_length, dtype=bool)
+                           for chnl in digital_channels})
+                         for ii in range(self.buffers)]
+        self._free_buffers = queue.Queue()
+        self._filled_buffers = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread = None
+        return
+
+    @staticmethod
+    def chunk_slices(number_of_samples, chunk_length):
+        """ Slices of all chunks to split number_of_samples into.
+
+        @param int number_of_samples: total number of samples
+        @param int chunk_length: maximum number of samples per chunk
+
+        @return list: slice objects for each chunk
+        """
+        chunk_length = max(int(chunk_length), 1)
+        return [slice(start, min(start + chunk_length, number_of_samples))
+                for start in range(0, number_of_samples, chunk_length)]
+
+    @property
+    def is_pipelined(self):
+        return self.buffers > 1
+
+    def __iter__(self):
+        if self.is_pipelined:
+            return self._iterate_pipelined()
+        return self._iterate_sequential()
+
+    def close(self):
+        """ Stops the worker thread (if running). Needs to be called if the iteration is aborted
+        before all chunks have been consumed.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            # Wake up the worker thread if it is waiting for a free buffer
+            self._free_buffers.put(None)
+            self._thread.join()
+            self._thread = None
+        for buffer_queue in (self._free_buffers, self._filled_buffers):
+            while not buffer_queue.empty():
+                buffer_queue.get_nowait()
+        return
+
+    def _fill(self, chunk_slice, buffer):
+        length = chunk_slice.stop - chunk_slice.start
+        analog_samples = {chnl: samples[:length] for chnl, samples in buffer[0].items()}
+        digital_samples = {chnl: samples[:length] for chnl, samples in buffer[1].items()}
+        start = time.perf_counter()
+        self.sampler.fill_chunk(start_bin=chunk_slice.start,
+                                analog_samples=analog_samples,
+                                digital_samples=digital_samples)
+        if self.chunk_callback is not None:
+            self.chunk_callback(chunk_slice, analog_samples, digital_samples)
+        self.sampling_time += time.perf_counter() - start
+        return chunk_slice, analog_samples, digital_samples
+
+    def _iterate_sequential(self):
+        for chunk_slice in self.chunk_slices(self.number_of_samples, self.chunk_length):
+            yield self._fill(chunk_slice, self._buffers[0])
+
+    def _iterate_pipelined(self):
+        self._stop_event.clear()
+        for buffer in self._buffers:
+            self._free_buffers.put(buffer)
+        self._thread = threading.Thread(target=self._produce, name='ChunkPipeline', daemon=True)
+        self._thread.start()
+        try:
+            for ii in range(len(self.chunk_slices(self.number_of_samples, self.chunk_length))):
+                start = time.perf_counter()
+                item = self._filled_buffers.get()
+                self.wait_time += time.perf_counter() - start
+                # Re-raise exceptions from the worker thread
+                if isinstance(item, Exception):
+                    raise item
+                chunk, buffer = item
+                yield chunk
+                self._free_buffers.put(buffer)
+        finally:
+            self.close()
+
+    def _produce(self):
+        """ Worker thread filling the free buffers chunk by chunk """
+        try:
+            for chunk_slice in self.chunk_slices(self.number_of_samples, self.chunk_length):
+                buffer = self._free_buffers.get()
+                if self._stop_event.is_set():
+                    return
+                self._filled_buffers.put((self._fill(chunk_slice, buffer), buffer))
+        except Exception as e:
+            self._filled_buffers.put(e)
+        return
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the Qudi helper class to sample multiple PulseBlockEnsembles in worker processes.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import shutil
+import tempfile
+import weakref
+import multiprocessing
+import numpy as np
+from collections import OrderedDict
+
+from core.util.network import get_shared_memory_dir
+
+from logic.pulsed.pulse_objects import PulseBlock, PulseBlockEnsemble
+from logic.pulsed.sampling_functions import SamplingFunctions
+from logic.pulsed.ensemble_sampler import EnsembleSampler
+
+
+def _init_worker(sampling_functions_paths):
+    """ Initializer of the worker processes. Imports the sampling function classes. """
+    SamplingFunctions.import_sampling_functions(sampling_functions_paths)
+
+
+def _sample_ensemble_to_files(path, ensemble_dict, block_dicts, elements_length_bins,
+                              sample_rate, analog_amplitudes, analog_channels, digital_channels,
+                              chunk_length):
+    """ Samples a PulseBlockEnsemble into memory-mapped .npy files (one per channel) in path.
+    Runs inside the worker processes.
+
+    @return str: path containing the sample files
+    """
+    ensemble = PulseBlockEnsemble.ensemble_from_dict(ensemble_dict)
+    blocks = {name: PulseBlock.block_from_dict(block_dict)
+              for name, block_dict in block_dicts.items()}
+    sampler = EnsembleSampler(ensemble=ensemble,
+                              blocks=blocks,
+                              elements_length_bins=elements_length_bins,
+                              sample_rate=sample_rate,
+                              analog_amplitudes=analog_amplitudes)
+    number_of_samples = sampler.number_of_samples
+
+    os.makedirs(path, exist_ok=True)
+    analog_samples = dict()
+    digital_samples = dict()
+    for chnl in analog_channels:
+        analog_samples[chnl] = np.lib.format.open_memmap(
+            os.path.join(path, chnl + '.npy'), mode='w+', dtype='float32',
+            shape=(number_of_samples,))
+    for chnl in digital_channels:
+        digital_samples[chnl] = np.lib.format.open_memmap(
+            os.path.join(path, chnl + '.npy'), mode='w+', dtype=bool, shape=(number_of_samples,))
+
+    # Sample in chunks to limit the memory needed for temporary arrays
+    for start in range(0, number_of_samples, chunk_length):
+        chunk_slice = slice(start, min(start + chunk_length, number_of_samples))
+        sampler.fill_chunk(
+            start_bin=start,
+            analog_samples={chnl: arr[chunk_slice] for chnl, arr in analog_samples.items()},
+            digital_samples={chnl: arr[chunk_slice] for chnl, arr in digital_samples.items()})
+    for samples in list(analog_samples.values()) + list(digital_samples.values()):
+        samples.flush()
+    return path
+
+
+def _cleanup(pool, tmp_dir):
+    """ Terminates the worker processes and deletes the temporary directory of a
+    ParallelEnsembleSampler. Also called if the sampler is garbage collected without being closed.
+    """
+    pool.terminate()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+class ParallelEnsembleSampler:
+    """
+    Samples PulseBlockEnsembles in a pool of worker processes.
+
+    The workers write the samples into memory-mapped .npy files inside a temporary directory in
+    shared memory (/dev/shm, see core.util.network.get_shared_memory_dir), which are shared with
+    the calling process without copying them through a pipe. On systems without a memory backed
+    directory (e.g. Windows) the files are placed in the temporary directory. Jobs are started in
+    the order they have been submitted as long as the total size of all samples that have not been
+    released yet stays below max_bytes. At least one job is always running.
+
+    Only ensembles that do not depend on the time offset of a previous ensemble (i.e. that are not
+    sampled in a rotating frame across ensembles) can be sampled this way.
+    """
+
+    def __init__(self, processes, sampling_functions_paths, max_bytes=0,
+                 chunk_length=2 ** 24):
+        """
+        @param int processes: Number of worker processes
+        @param list sampling_functions_paths: Paths to import the sampling function classes from
+                                              (see SamplingFunctions.import_sampling_functions)
+        @param int max_bytes: Memory budget for the samples of all running and unreleased jobs.
+                              0 means no limit.
+        @param int chunk_length: Number of samples processed at once by the workers
+        """
+        self.max_bytes = int(max_bytes)
+        self.chunk_length = int(chunk_length)
+        self._tmp_dir = tempfile.mkdtemp(prefix='qudi_sampling_', dir=get_shared_memory_dir())
+        self._pool = multiprocessing.Pool(processes=processes,
+                                          initializer=_init_worker,
+                                          initargs=(list(sampling_functions_paths),))
+        # Make sure the workers are stopped and the shared memory is freed even if close is never
+        # called. Must not reference self, otherwise the sampler is never garbage collected.
+        self._finalizer = weakref.finalize(self, _cleanup, self._pool, self._tmp_dir)
+        # Jobs waiting to be started. Keys are the job keys, values are (args, bytes) tuples.
+        self._pending = OrderedDict()
+        # Jobs started and not released yet. Keys are the job keys, values are
+        # (AsyncResult, bytes) tuples.
+        self._running = dict()
+        self._bytes_in_use = 0
+        return
+
+    def __contains__(self, key):
+        return key in self._pending or key in self._running
+
+    def submit(self, key, ensemble, blocks, ensemble_info, sample_rate, analog_amplitudes):
+        """ Adds a PulseBlockEnsemble to the queue of jobs.
+
+        @param str key: unique key to get the samples by, e.g. the waveform hash
+        @param PulseBlockEnsemble ensemble: ensemble to sample
+        @param dict blocks: Dictionary containing all PulseBlock instances referenced by ensemble
+        @param dict ensemble_info: as returned by SequenceGeneratorLogic.analyze_block_ensemble
+        @param float sample_rate: The sample rate in samples/s
+        @param dict analog_amplitudes: Peak-to-peak amplitudes of the analog channels
+        """
+        if key in self:
+            return
+        # Pass on the dict representations. Sampling function classes are imported dynamically
+        # and can not be pickled reliably.
+        ensemble_dict = {'name': ensemble.name,
+                         'block_list': list(ensemble.block_list),
+                         'rotating_frame': ensemble.rotating_frame,
+                         'sampling_information': dict(),
+                         'measurement_information': dict()}
+        block_dicts = {name: blocks[name].get_dict_representation()
+                       for name, reps in ensemble.block_list}
+        args = (os.path.join(self._tmp_dir, key),
+                ensemble_dict,
+                block_dicts,
+                np.asarray(ensemble_info['elements_length_bins'], dtype='int64'),
+                sample_rate,
+                dict(analog_amplitudes),
+                sorted(ensemble_info['analog_channels']),
+                sorted(ensemble_info['digital_channels']),
+                self.chunk_length)
+        job_bytes = ensemble_info['number_of_samples'] * (
+                4 * len(ensemble_info['analog_channels']) + len(ensemble_info['digital_channels']))
+        self._pending[key] = (args, job_bytes)
+        self._start_jobs()
+        return
+
+    def get(self, key):
+        """ Waits for a job to finish and opens the samples as memory-mapped arrays.
+        Exceptions raised in the worker process are re-raised.
+
+        @param str key: the job key
+
+        @return (dict, dict): analog and digital sample arrays (keys are channel descriptors)
+        """
+        if key in self._pending:
+            # Start the job regardless of the memory budget since it is needed now
+            self._start_job(key)
+        path = self._running[key][0].get()
+        analog_samples = dict()
+        digital_samples = dict()
+        for filename in os.listdir(path):
+            if not filename.endswith('.npy'):
+                continue
+            samples = np.load(os.path.join(path, filename), mmap_mode='c')
+            if filename.startswith('a'):
+                analog_samples[filename[:-4]] = samples
+            else:
+                digital_samples[filename[:-4]] = samples
+        return analog_samples, digital_samples
+
+    def release(self, key):
+        """ Deletes the samples of a job and starts waiting jobs if the memory budget allows it.
+        All references to the arrays returned by get() must be deleted beforehand.
+
+        @param str key: the job key
+        """
+        if key in self._pending:
+            del self._pending[key]
+        elif key in self._running:
+            result, job_bytes = self._running.pop(key)
+            result.wait()
+            self._bytes_in_use -= job_bytes
+            shutil.rmtree(os.path.join(self._tmp_dir, key), ignore_errors=True)
+        self._start_jobs()
+        return
+
+    def close(self):
+        """ Terminates the worker processes and deletes all remaining samples. """
+        self._finalizer()
+        self._pool.join()
+        self._pending.clear()
+        self._running.clear()
+        self._bytes_in_use = 0
+        return
+
+    def _start_jobs(self):
+        while self._pending:
+            key, (args, job_bytes) = next(iter(self._pending.items()))
+            if self._running and 0 < self.max_bytes < self._bytes_in_use + job_bytes:
+                break
+            self._start_job(key)
+        return
+
+    def _start_job(self, key):
+        args, job_bytes = self._pending.pop(key)
+        self._running[key] = (self._pool.apply_async(_sample_ensemble_to_files, args), job_bytes)
+        self._bytes_in_use += job_bytes
+        return
@@ -19,17 +19,85 @@ Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
 top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
 """
 
+import weakref
 import numpy as np
 
 from logic.pulsed.pulse_analyzer import PulseAnalyzerBase
 
 
+class LaserWindowSums:
+    """
+    Sums of all laser pulses over windows of time bins.
+
+    Without cumulative sum each call sums the window of the laser pulse matrix along axis 1.
+    With the cumulative sum of the laser pulses along axis 1 (and a leading column of zeros)
+    each window sum is the difference of two columns, independent of the window size.
+    """
+    def __init__(self, laser_data, cumulative_sum=None):
+        """
+        @param numpy.ndarray laser_data: 2D array (dim 0: laser number, dim 1: time bin)
+        @param numpy.ndarray cumulative_sum: optional, cumulative sum of laser_data along axis 1
+                                             with a leading column of zeros
+        """
+        self.laser_data = laser_data
+        self.cumulative_sum = cumulative_sum
+
+    def __call__(self, start_bin, end_bin):
+        """
+        @param int start_bin: first bin of the window (slice semantics)
+        @param int end_bin: bin after the last bin of the window (slice semantics)
+
+        @return numpy.ndarray, int: window sum for each laser pulse, number of bins in the window
+        """
+        start, stop, _ = slice(start_bin, end_bin).indices(self.laser_data.shape[1])
+        stop = max(start, stop)
+        if self.cumulative_sum is None:
+            return self.laser_data[:, start:stop].sum(axis=1), stop - start
+        return self.cumulative_sum[:, stop] - self.cumulative_sum[:, start], stop - start
+
+
 class BasicPulseAnalyzer(PulseAnalyzerBase):
     """
 
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # Weak reference to the laser pulses analysed last and their cumulative sum
+        self._last_laser_data = None
+        self._cumulative_sum = None
+
+    def _get_window_sums(self, laser_data):
+        """
+        Window sums for the laser pulses to analyse. If the same (integer) laser pulse array is
+        analysed again, e.g. after the analysis windows have been changed, its cumulative sum is
+        calculated once and reused, so further window changes do not sum the laser pulses again.
+        The laser pulses must not be changed in place between analyses.
+
+        @param numpy.ndarray laser_data: 2D array (dim 0: laser number, dim 1: time bin)
+
+        @return LaserWindowSums: callable returning the window sums for a start and end bin
+        """
+        last_laser_data = None if self._last_laser_data is None else self._last_laser_data()
+        if last_laser_data is not laser_data:
+            self._last_laser_data = weakref.ref(laser_data)
+            self._cumulative_sum = None
+            return LaserWindowSums(laser_data)
+        if self._cumulative_sum is None and laser_data.dtype.kind in 'iu':
+            cumulative_sum = np.cumsum(laser_data, axis=1)
+            self._cumulative_sum = np.zeros((laser_data.shape[0], laser_data.shape[1] + 1),
+                                            dtype=cumulative_sum.dtype)
+            self._cumulative_sum[:, 1:] = cumulative_sum
+        return LaserWindowSums(laser_data, self._cumulative_sum)
+
+    def _get_window_bins(self, *times):
+        """ Converts the times in seconds to bins (i.e. array indices).
+
+        @return tuple: bins for each time or None if the bin width is unknown
+        """
+        bin_width = self.fast_counter_settings.get('bin_width')
+        if not isinstance(bin_width, float):
+            return None
+        return tuple(round(t / bin_width) for t in times)
 
     def analyse_mean_norm(self, laser_data, signal_start=0.0, signal_end=200e-9, norm_start=300e-9,
                           norm_end=500e-9):
@@ -44,47 +112,33 @@ class BasicPulseAnalyzer(PulseAnalyzerBase):
         """
         # Get number of lasers
         num_of_lasers = laser_data.shape[0]
-        # Get counter bin width
-        bin_width = self.fast_counter_settings.get('bin_width')
-
-        if not isinstance(bin_width, float):
-            return np.zeros(num_of_lasers), np.zeros(num_of_lasers)
 
         # Convert the times in seconds to bins (i.e. array indices)
-        signal_start_bin = round(signal_start / bin_width)
-        signal_end_bin = round(signal_end / bin_width)
-        norm_start_bin = round(norm_start / bin_width)
-        norm_end_bin = round(norm_end / bin_width)
-
-        # initialize data arrays for signal and measurement error
-        signal_data = np.empty(num_of_lasers, dtype=float)
-        error_data = np.empty(num_of_lasers, dtype=float)
-
-        # loop over all laser pulses and analyze them
-        for ii, laser_arr in enumerate(laser_data):
-            # calculate the sum and mean of the data in the normalization window
-            tmp_data = laser_arr[norm_start_bin:norm_end_bin]
-            reference_sum = np.sum(tmp_data)
-            reference_mean = (reference_sum / len(tmp_data)) if len(tmp_data) != 0 else 0.0
-
-            # calculate the sum and mean of the data in the signal window
-            tmp_data = laser_arr[signal_start_bin:signal_end_bin]
-            signal_sum = np.sum(tmp_data)
-            signal_mean = (signal_sum / len(tmp_data)) if len(tmp_data) != 0 else 0.0
-
-            # Calculate normalized signal while avoiding division by zero
-            if reference_mean > 0 and signal_mean >= 0:
-                signal_data[ii] = signal_mean / reference_mean
-            else:
-                signal_data[ii] = 0.0
-
-            # Calculate measurement error while avoiding division by zero
-            if reference_sum > 0 and signal_sum > 0:
-                # calculate with respect to gaussian error 'evolution'
-                error_data[ii] = signal_data[ii] * np.sqrt(1 / signal_sum + 1 / reference_sum)
-            else:
-                error_data[ii] = 0.0
-
+        bins = self._get_window_bins(signal_start, signal_end, norm_start, norm_end)
+        if bins is None:
+            return np.zeros(num_of_lasers), np.zeros(num_of_lasers)
+        signal_start_bin, signal_end_bin, norm_start_bin, norm_end_bin = bins
+
+        window_sums = self._get_window_sums(laser_data)
+        # calculate the sum and mean of the data in the normalization and signal window
+        reference_sum, reference_length = window_sums(norm_start_bin, norm_end_bin)
+        signal_sum, signal_length = window_sums(signal_start_bin, signal_end_bin)
+        reference_mean = reference_sum / reference_length if reference_length != 0 else \
+            np.zeros(num_of_lasers)
+        signal_mean = signal_sum / signal_length if signal_length != 0 else \
+            np.zeros(num_of_lasers)
+
+        # Calculate normalized signal while avoiding division by zero
+        valid = (reference_mean > 0) & (signal_mean >= 0)
+        signal_data = np.zeros(num_of_lasers, dtype=float)
+        np.divide(signal_mean, reference_mean, out=signal_data, where=valid)
+
+        # Calculate measurement error while avoiding division by zero
+        # calculate with respect to gaussian error 'evolution'
+        valid = (reference_sum > 0) & (signal_sum > 0)
+        error_data = np.zeros(num_of_lasers, dtype=float)
+        error_data[valid] = signal_data[valid] * np.sqrt(1 / signal_sum[valid] +
+                                                         1 / reference_sum[valid])
         return signal_data, error_data
 
     def analyse_sum(self, laser_data, signal_start=0.0, signal_end=200e-9):
@@ -96,34 +150,21 @@ class BasicPulseAnalyzer(PulseAnalyzerBase):
         """
         # Get number of lasers
         num_of_lasers = laser_data.shape[0]
-        # Get counter bin width
-        bin_width = self.fast_counter_settings.get('bin_width')
-
-        if not isinstance(bin_width, float):
-            return np.zeros(num_of_lasers), np.zeros(num_of_lasers)
 
         # Convert the times in seconds to bins (i.e. array indices)
-        signal_start_bin = round(signal_start / bin_width)
-        signal_end_bin = round(signal_end / bin_width)
+        bins = self._get_window_bins(signal_start, signal_end)
+        if bins is None:
+            return np.zeros(num_of_lasers), np.zeros(num_of_lasers)
 
-        # initialize data arrays for signal and measurement error
-        signal_data = np.empty(num_of_lasers, dtype=float)
-        error_data = np.empty(num_of_lasers, dtype=float)
-
-        # loop over all laser pulses and analyze them
-        for ii, laser_arr in enumerate(laser_data):
-            # calculate the sum of the data in the signal window
-            signal = laser_arr[signal_start_bin:signal_end_bin].sum()
-            signal_error = np.sqrt(signal)
-
-            # Avoid numpy C type variables overflow and NaN values
-            if signal < 0 or signal != signal:
-                signal_data[ii] = 0.0
-                error_data[ii] = 0.0
-            else:
-                signal_data[ii] = signal
-                error_data[ii] = signal_error
+        # calculate the sum of the data in the signal window
+        signal, _ = self._get_window_sums(laser_data)(*bins)
 
+        # Avoid numpy C type variables overflow and NaN values
+        valid = (signal >= 0) & (signal == signal)
+        signal_data = np.zeros(num_of_lasers, dtype=float)
+        error_data = np.zeros(num_of_lasers, dtype=float)
+        signal_data[valid] = signal[valid]
+        error_data[valid] = np.sqrt(signal[valid])
         return signal_data, error_data
 
     def analyse_mean(self, laser_data, signal_start=0.0, signal_end=200e-9):
@@ -136,35 +177,28 @@ class BasicPulseAnalyzer(PulseAnalyzerBase):
         """
         # Get number of lasers
         num_of_lasers = laser_data.shape[0]
-        # Get counter bin width
-        bin_width = self.fast_counter_settings.get('bin_width')
-
-        if not isinstance(bin_width, float):
-            return np.zeros(num_of_lasers), np.zeros(num_of_lasers)
 
         # Convert the times in seconds to bins (i.e. array indices)
-        signal_start_bin = round(signal_start / bin_width)
-        signal_end_bin = round(signal_end / bin_width)
+        bins = self._get_window_bins(signal_start, signal_end)
+        if bins is None:
+            return np.zeros(num_of_lasers), np.zeros(num_of_lasers)
+        signal_start_bin, signal_end_bin = bins
 
         # initialize data arrays for signal and measurement error
-        signal_data = np.empty(num_of_lasers, dtype=float)
-        error_data = np.empty(num_of_lasers, dtype=float)
-
-        # loop over all laser pulses and analyze them
-        for ii, laser_arr in enumerate(laser_data):
-            # calculate the mean of the data in the signal window
-            signal = laser_arr[signal_start_bin:signal_end_bin].mean()
-            signal_sum = laser_arr[signal_start_bin:signal_end_bin].sum()
-            signal_error = np.sqrt(signal_sum) / (signal_end_bin - signal_start_bin)
-
-            # Avoid numpy C type variables overflow and NaN values
-            if signal < 0 or signal != signal:
-                signal_data[ii] = 0.0
-                error_data[ii] = 0.0
-            else:
-                signal_data[ii] = signal
-                error_data[ii] = signal_error
-
+        signal_data = np.zeros(num_of_lasers, dtype=float)
+        error_data = np.zeros(num_of_lasers, dtype=float)
+
+        # calculate the mean of the data in the signal window. The mean of an empty window is NaN.
+        signal_sum, signal_length = self._get_window_sums(laser_data)(signal_start_bin,
+                                                                      signal_end_bin)
+        if signal_length == 0:
+            return signal_data, error_data
+        signal = signal_sum / signal_length
+
+        # Avoid numpy C type variables overflow and NaN values
+        valid = (signal >= 0) & (signal == signal)
+        signal_data[valid] = signal[valid]
+        error_data[valid] = np.sqrt(signal_sum[valid]) / (signal_end_bin - signal_start_bin)
         return signal_data, error_data
 
     def analyse_pass_through(self, laser_data):
@@ -202,37 +236,26 @@ class BasicPulseAnalyzer(PulseAnalyzerBase):
         """
         # Get number of lasers
         num_of_lasers = laser_data.shape[0]
-        # Get counter bin width
-        bin_width = self.fast_counter_settings.get('bin_width')
-
-        if not isinstance(bin_width, float):
-            return np.zeros(num_of_lasers), np.zeros(num_of_lasers)
 
         # Convert the times in seconds to bins (i.e. array indices)
-        signal_start_bin = round(signal_start / bin_width)
-        signal_end_bin = round(signal_end / bin_width)
-        norm_start_bin = round(norm_start / bin_width)
-        norm_end_bin = round(norm_end / bin_width)
-
-        # initialize data arrays for signal and measurement error
-        signal_data = np.empty(num_of_lasers, dtype=float)
-        error_data = np.empty(num_of_lasers, dtype=float)
-
-        # loop over all laser pulses and analyze them
-        for ii, laser_arr in enumerate(laser_data):
-            # calculate the sum and mean of the data in the normalization window
-            tmp_data = laser_arr[norm_start_bin:norm_end_bin]
-            reference_sum = np.sum(tmp_data)
-            reference_mean = (reference_sum / len(tmp_data)) if len(tmp_data) != 0 else 0.0
-
-            # calculate the sum and mean of the data in the signal window
-            tmp_data = laser_arr[signal_start_bin:signal_end_bin]
-            signal_sum = np.sum(tmp_data)
-            signal_mean = (signal_sum / len(tmp_data)) if len(tmp_data) != 0 else 0.0
-
-            signal_data[ii] = signal_mean - reference_mean
-
-            # calculate with respect to gaussian error 'evolution'
-            error_data[ii] = signal_data[ii] * np.sqrt(1 / abs(signal_sum) + 1 / abs(reference_sum))
-
+        bins = self._get_window_bins(signal_start, signal_end, norm_start, norm_end)
+        if bins is None:
+            return np.zeros(num_of_lasers), np.zeros(num_of_lasers)
+        signal_start_bin, signal_end_bin, norm_start_bin, norm_end_bin = bins
+
+        window_sums = self._get_window_sums(laser_data)
+        # calculate the sum and mean of the data in the normalization and signal window
+        reference_sum, reference_length = window_sums(norm_start_bin, norm_end_bin)
+        signal_sum, signal_length = window_sums(signal_start_bin, signal_end_bin)
+        reference_mean = reference_sum / reference_length if reference_length != 0 else \
+            np.zeros(num_of_lasers)
+        signal_mean = signal_sum / signal_length if signal_length != 0 else \
+            np.zeros(num_of_lasers)
+
+        signal_data = signal_mean - reference_mean
+
+        # calculate with respect to gaussian error 'evolution'
+        # Empty windows or windows without counts result in an infinite error.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            error_data = signal_data * np.sqrt(1 / np.abs(signal_sum) + 1 / np.abs(reference_sum))
         return signal_data, error_data
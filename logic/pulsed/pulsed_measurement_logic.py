@@ -23,6 +23,7 @@ from qtpy import QtCore
 from collections import OrderedDict
 import numpy as np
 import copy
+import os
 import time
 import datetime
 import matplotlib.pyplot as plt
@@ -37,6 +38,7 @@ from core.util.math import compute_ft
 from logic.generic_logic import GenericLogic
 from logic.pulsed.pulse_extractor import PulseExtractor
 from logic.pulsed.pulse_analyzer import PulseAnalyzer
+from logic.pulsed.raw_data_stash import RawDataStash
 
 
 class PulsedMeasurementLogic(GenericLogic):
@@ -57,6 +59,16 @@ class PulsedMeasurementLogic(GenericLogic):
     analysis_import_path = ConfigOption(name='additional_analysis_path', default=None)
     # Optional file type descriptor for saving raw data to file
     _raw_data_save_type = ConfigOption(name='raw_data_save_type', default='text')
+    # Reuse the laser flank positions found in an ungated timetrace until the pulse sequence or
+    # any settings change. Only the laser pulse windows are then sliced out of the timetrace.
+    _incremental_extraction = ConfigOption(name='incremental_extraction', default=False,
+                                           missing='nothing')
+    # Directory of the stashed raw data (default: <data directory>/PulsedRawDataStash/<module name>)
+    # and maximum size of the stashed raw data held in memory (in bytes)
+    _raw_data_stash_path = ConfigOption(name='raw_data_stash_path', default=None,
+                                        missing='nothing')
+    _raw_data_stash_memory = ConfigOption(name='raw_data_stash_memory', default=2 ** 28,
+                                          missing='nothing')
 
     # status variables
     # ext. microwave settings
@@ -137,8 +149,12 @@ class PulsedMeasurementLogic(GenericLogic):
         self.laser_data = np.zeros((10, 20), dtype='int64')
         self.raw_data = np.zeros((10, 20), dtype='int64')
 
-        self._saved_raw_data = OrderedDict()  # temporary saved raw data
+        self._saved_raw_data = None  # stashed raw data (RawDataStash), created on activation
         self._recalled_raw_data_tag = None  # the currently recalled raw data dict key
+        self._recalled_raw_data_sum = None  # reused array for the sum with recalled raw data
+
+        # Cached laser pulse windows for the incremental extraction of ungated timetraces
+        self._flank_cache = dict()
 
         # Paused measurement flag
         self.__is_paused = False
@@ -206,6 +222,11 @@ class PulsedMeasurementLogic(GenericLogic):
 
         # recalled saved raw data dict key
         self._recalled_raw_data_tag = None
+        if self._raw_data_stash_path is None:
+            stash_path = os.path.join(self.savelogic().data_dir, 'PulsedRawDataStash', self._name)
+        else:
+            stash_path = self._raw_data_stash_path
+        self._saved_raw_data = RawDataStash(stash_path, self._raw_data_stash_memory)
 
         # Connect internal signals
         self.sigStartTimer.connect(self.__analysis_timer.start, QtCore.Qt.QueuedConnection)
@@ -294,6 +315,8 @@ class PulsedMeasurementLogic(GenericLogic):
             self.log.warning('Fast counter is not idle (status: {0}).\n'
                              'Unable to apply new settings.'.format(counter_status))
 
+        self._flank_cache = dict()
+
         # emit update signal for master (GUI or other logic module)
         self.sigFastCounterSettingsUpdated.emit(self.fast_counter_settings)
         return self.fast_counter_settings
@@ -555,6 +578,7 @@ class PulsedMeasurementLogic(GenericLogic):
 
         # Set measurement_information dict
         self._measurement_information = info_dict.copy()
+        self._flank_cache = dict()
 
         # invoke settings if needed
         if self._invoke_settings_from_sequence and self._measurement_information:
@@ -572,6 +596,7 @@ class PulsedMeasurementLogic(GenericLogic):
             self._sampling_information = info_dict
         else:
             self._sampling_information = dict()
+        self._flank_cache = dict()
         return
 
     @property
@@ -650,6 +675,11 @@ class PulsedMeasurementLogic(GenericLogic):
         with self._threadlock:
             self._pulseanalyzer.analysis_settings = settings_dict
             self.sigAnalysisSettingsUpdated.emit(self.analysis_settings)
+            # Re-analyse the laser pulses of a paused measurement with the new settings. The
+            # analyzers reuse the cumulative sum of the unchanged laser pulses for new windows.
+            if self.module_state() == 'locked' and self.__is_paused and \
+                    self._update_signal_data():
+                self.sigMeasurementDataUpdated.emit()
         return
 
     @QtCore.Slot(dict)
@@ -674,6 +704,7 @@ class PulsedMeasurementLogic(GenericLogic):
         # Use threadlock to update settings during a running measurement
         with self._threadlock:
             self._pulseextractor.extraction_settings = settings_dict
+            self._flank_cache = dict()
             self.sigExtractionSettingsUpdated.emit(self.extraction_settings)
         return
 
@@ -729,6 +760,7 @@ class PulsedMeasurementLogic(GenericLogic):
 
         # Perform sanity checks on settings
         self._measurement_settings_sanity_check()
+        self._flank_cache = dict()
 
         # emit update signal for master (GUI or other logic module)
         self.sigMeasurementSettingsUpdated.emit(self.measurement_settings)
@@ -777,6 +809,7 @@ class PulsedMeasurementLogic(GenericLogic):
 
                 # initialize data arrays
                 self._initialize_data_arrays()
+                self._flank_cache = dict()
 
                 # recall stashed raw data
                 if stashed_raw_data_tag in self._saved_raw_data:
@@ -836,10 +869,11 @@ class PulsedMeasurementLogic(GenericLogic):
 
                 # stash raw data if requested
                 if stash_raw_data_tag:
-                    self._saved_raw_data[stash_raw_data_tag] = (self.raw_data.copy(),
+                    self._saved_raw_data[stash_raw_data_tag] = (self.raw_data,
                                                                 {'elapsed_sweeps': self.__elapsed_sweeps,
                                                                  'elapsed_time': self.__elapsed_time})
                 self._recalled_raw_data_tag = None
+                self._recalled_raw_data_sum = None
 
                 # Set measurement paused flag
                 self.__is_paused = False
@@ -1106,40 +1140,8 @@ class PulsedMeasurementLogic(GenericLogic):
                 # Update elapsed time
 
                 self._extract_laser_pulses()
-
-                tmp_signal, tmp_error = self._analyze_laser_pulses()
-
-                # exclude laser pulses to ignore
-                if len(self._laser_ignore_list) > 0:
-                    # Convert relative negative indices into absolute positive indices
-                    while self._laser_ignore_list[0] < 0:
-                        neg_index = self._laser_ignore_list[0]
-                        self._laser_ignore_list[0] = len(tmp_signal) + neg_index
-                        self._laser_ignore_list.sort()
-
-                    tmp_signal = np.delete(tmp_signal, self._laser_ignore_list)
-                    tmp_error = np.delete(tmp_error, self._laser_ignore_list)
-
-                # order data according to alternating flag
-                if self._alternating:
-                    if len(self.signal_data[0]) != len(tmp_signal[::2]):
-                        self.log.error('Length of controlled variable ({0}) does not match length of number of readout '
-                                       'pulses ({1}).'.format(len(self.signal_data[0]), len(tmp_signal[::2])))
-                        return
-                    self.signal_data[1] = tmp_signal[::2]
-                    self.signal_data[2] = tmp_signal[1::2]
-                    self.measurement_error[1] = tmp_error[::2]
-                    self.measurement_error[2] = tmp_error[1::2]
-                else:
-                    if len(self.signal_data[0]) != len(tmp_signal):
-                        self.log.error('Length of controlled variable ({0}) does not match length of number of readout '
-                                       'pulses ({1}).'.format(len(self.signal_data[0]), len(tmp_signal)))
-                        return
-                    self.signal_data[1] = tmp_signal
-                    self.measurement_error[1] = tmp_error
-
-                # Compute alternative data array from signal
-                self._compute_alt_data()
+                if not self._update_signal_data():
+                    return
 
             # emit signals
             self.sigTimerUpdated.emit(self.__elapsed_time, self.__elapsed_sweeps,
@@ -1147,6 +1149,46 @@ class PulsedMeasurementLogic(GenericLogic):
             self.sigMeasurementDataUpdated.emit()
             return
 
+    def _update_signal_data(self):
+        """ Analyzes the current laser pulses and updates the signal data and measurement error.
+
+        @return bool: True if the signal data has been updated, False otherwise
+        """
+        tmp_signal, tmp_error = self._analyze_laser_pulses()
+
+        # exclude laser pulses to ignore
+        if len(self._laser_ignore_list) > 0:
+            # Convert relative negative indices into absolute positive indices
+            while self._laser_ignore_list[0] < 0:
+                neg_index = self._laser_ignore_list[0]
+                self._laser_ignore_list[0] = len(tmp_signal) + neg_index
+                self._laser_ignore_list.sort()
+
+            tmp_signal = np.delete(tmp_signal, self._laser_ignore_list)
+            tmp_error = np.delete(tmp_error, self._laser_ignore_list)
+
+        # order data according to alternating flag
+        if self._alternating:
+            if len(self.signal_data[0]) != len(tmp_signal[::2]):
+                self.log.error('Length of controlled variable ({0}) does not match length of number of readout '
+                               'pulses ({1}).'.format(len(self.signal_data[0]), len(tmp_signal[::2])))
+                return False
+            self.signal_data[1] = tmp_signal[::2]
+            self.signal_data[2] = tmp_signal[1::2]
+            self.measurement_error[1] = tmp_error[::2]
+            self.measurement_error[2] = tmp_error[1::2]
+        else:
+            if len(self.signal_data[0]) != len(tmp_signal):
+                self.log.error('Length of controlled variable ({0}) does not match length of number of readout '
+                               'pulses ({1}).'.format(len(self.signal_data[0]), len(tmp_signal)))
+                return False
+            self.signal_data[1] = tmp_signal
+            self.measurement_error[1] = tmp_error
+
+        # Compute alternative data array from signal
+        self._compute_alt_data()
+        return True
+
     def _extract_laser_pulses(self):
         # Get counter raw data (including recalled raw data from previous measurement)
         fc_data, info_dict = self._get_raw_data()
@@ -1155,10 +1197,88 @@ class PulsedMeasurementLogic(GenericLogic):
         self.__elapsed_time = info_dict['elapsed_time']
 
         # extract laser pulses from raw data
-        return_dict = self._pulseextractor.extract_laser_pulses(self.raw_data)
-        self.laser_data = return_dict['laser_counts_arr']
+        if self._incremental_extraction and self.raw_data.ndim == 1:
+            self.laser_data = self._extract_with_cached_flanks(self.raw_data)
+        else:
+            return_dict = self._pulseextractor.extract_laser_pulses(self.raw_data)
+            self.laser_data = return_dict['laser_counts_arr']
         return
 
+    def _extract_with_cached_flanks(self, count_data):
+        """
+        Extracts the laser pulses from an ungated timetrace by reusing the laser flank positions
+        found by the extraction method in previous calls.
+
+        The extraction method is run until it finds the same flanks (within a few bins) in two
+        consecutive timetraces. The laser pulse windows are then stored as index array and the laser pulses are simply
+        sliced out of all following timetraces. The cache is cleared whenever the pulse sequence,
+        the fast counter, measurement or extraction settings change.
+        Extraction methods whose result can not be reproduced by slicing out windows starting at
+        the rising flanks are always run in full.
+
+        @param numpy.ndarray count_data: 1D array of the ungated timetrace
+
+        @return numpy.ndarray: 2D array of laser pulses (dimensions: 0: laser number, 1: time bin)
+        """
+        cache = self._flank_cache
+        if 'index_arr' in cache and cache['size'] == count_data.size:
+            laser_data = count_data[cache['index_arr']].astype('int64', copy=False)
+            if cache['zero_mask'] is not None:
+                laser_data[cache['zero_mask']] = 0
+            return laser_data
+
+        return_dict = self._pulseextractor.extract_laser_pulses(count_data)
+        laser_data = return_dict['laser_counts_arr']
+        rising_ind = return_dict.get('laser_indices_rising')
+        falling_ind = return_dict.get('laser_indices_falling')
+        if rising_ind is None or falling_ind is None or not laser_data.any():
+            return laser_data
+        rising_ind = np.asarray(rising_ind, dtype='int64')
+        falling_ind = np.asarray(falling_ind, dtype='int64')
+        if laser_data.ndim != 2 or rising_ind.size != laser_data.shape[0] or \
+                falling_ind.size != rising_ind.size:
+            return laser_data
+
+        # Freeze the flanks only after they have been found at (almost) the same positions in two
+        # consecutive timetraces. The flank detection of noisy data jitters by a few bins.
+        tolerance = max(2, laser_data.shape[1] // 100)
+        prev_rising = cache.get('rising_ind')
+        prev_falling = cache.get('falling_ind')
+        if cache.get('size') != count_data.size or prev_rising is None or \
+                prev_rising.size != rising_ind.size or \
+                np.max(np.abs(prev_rising - rising_ind)) > tolerance or \
+                np.max(np.abs(prev_falling - falling_ind)) > tolerance:
+            self._flank_cache = {'size': count_data.size,
+                                 'rising_ind': rising_ind,
+                                 'falling_ind': falling_ind}
+            return laser_data
+        if cache.get('not_reproducible'):
+            return laser_data
+
+        # Windows of equal length starting at the rising flanks. Bins beyond the end of the
+        # timetrace (and optionally after the falling flank) are zero.
+        bin_offsets = np.arange(laser_data.shape[1], dtype='int64')
+        index_arr = rising_ind[:, np.newaxis] + bin_offsets
+        out_of_range = index_arr >= count_data.size
+        candidates = (out_of_range,
+                      out_of_range | (bin_offsets > (falling_ind - rising_ind)[:, np.newaxis]))
+        index_arr = np.minimum(index_arr, count_data.size - 1)
+        gathered = count_data[index_arr]
+        for zero_mask in candidates:
+            masked = gathered.copy()
+            masked[zero_mask] = 0
+            if np.array_equal(masked, laser_data):
+                cache['index_arr'] = index_arr
+                cache['zero_mask'] = zero_mask if zero_mask.any() else None
+                self.log.debug('Laser flanks cached for incremental pulse extraction.')
+                break
+        else:
+            cache['not_reproducible'] = True
+            self.log.debug('Result of extraction method "{0}" can not be reproduced from the '
+                           'laser flanks. Incremental pulse extraction not possible.'
+                           ''.format(self._pulseextractor.extraction_settings.get('method')))
+        return laser_data
+
     def _analyze_laser_pulses(self):
         # analyze pulses and get data points for signal array. Also check if extraction
         # worked (non-zero array returned).
@@ -1196,18 +1316,26 @@ class PulsedMeasurementLogic(GenericLogic):
             elapsed_time = time.time() - self.__start_time
 
         # add old raw data from previous measurements if necessary
-        if self._saved_raw_data.get(self._recalled_raw_data_tag) is not None:
+        if self._recalled_raw_data_tag in self._saved_raw_data:
             # self.log.info('Found old saved raw data with tag "{0}".'
             #               ''.format(self._recalled_raw_data_tag))
-            elapsed_sweeps += self._saved_raw_data[self._recalled_raw_data_tag][1]['elapsed_sweeps']
-            elapsed_time += self._saved_raw_data[self._recalled_raw_data_tag][1]['elapsed_time']
+            recalled_data, recalled_info = self._saved_raw_data[self._recalled_raw_data_tag]
+            elapsed_sweeps += recalled_info['elapsed_sweeps']
+            elapsed_time += recalled_info['elapsed_time']
             if not fc_data.any():
                 self.log.warning('Only zeros received from fast counter!\n'
                                  'Using recalled raw data only.')
-                fc_data = self._saved_raw_data[self._recalled_raw_data_tag][0]
-            elif self._saved_raw_data[self._recalled_raw_data_tag][0].shape == fc_data.shape:
+                fc_data = recalled_data
+            elif recalled_data.shape == fc_data.shape:
                 self.log.debug('Recalled raw data has the same shape as current data.')
-                fc_data = self._saved_raw_data[self._recalled_raw_data_tag][0] + fc_data
+                # Sum up in a reused array. The array returned by the fast counter may be its
+                # internal buffer and the recalled raw data is read-only.
+                sum_dtype = np.result_type(recalled_data, fc_data)
+                if self._recalled_raw_data_sum is None or \
+                        self._recalled_raw_data_sum.shape != fc_data.shape or \
+                        self._recalled_raw_data_sum.dtype != sum_dtype:
+                    self._recalled_raw_data_sum = np.empty(fc_data.shape, dtype=sum_dtype)
+                fc_data = np.add(recalled_data, fc_data, out=self._recalled_raw_data_sum)
             else:
                 self.log.warning('Recalled raw data has not the same shape as current data.'
                                  '\nDid NOT add recalled raw data to current time trace.')
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the Qudi helper class to stash the raw data of pulsed measurements on disk.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import json
+import uuid
+from collections import OrderedDict
+import numpy as np
+
+
+class RawDataStash:
+    """
+    Stash of fast counter raw data and its info dict (elapsed sweeps and time) by tag.
+
+    Each stashed array is written to a .npy file in path, the tags, file names and info dicts are
+    kept in an index file next to them. The stash therefore survives reloads of the module (and
+    of qudi). Stashed arrays are read-only. The most recently used arrays are held in memory up
+    to max_memory_bytes, the others are read from disk as memory-mapped arrays when requested.
+    """
+    _index_filename = 'stash_index.json'
+
+    def __init__(self, path, max_memory_bytes=2 ** 28):
+        """
+        @param str path: directory to store the stashed raw data in
+        @param int max_memory_bytes: maximum size of the stashed arrays held in memory
+        """
+        self.path = path
+        self.max_memory_bytes = max(int(max_memory_bytes), 0)
+        # Tags in order of their use. Values are dicts with the file name and the info dict.
+        self._index = OrderedDict()
+        # Arrays held in memory in order of their use
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        os.makedirs(self.path, exist_ok=True)
+        self._load_index()
+        return
+
+    def __contains__(self, tag):
+        return tag in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, tag):
+        """ Returns the stashed raw data and its info dict.
+
+        @param str tag: tag of the stashed raw data
+
+        @return (numpy.ndarray, dict): read-only raw data, info dict
+        """
+        entry = self._index[tag]
+        self._index.move_to_end(tag)
+        data = self._cache.get(tag)
+        if data is not None:
+            self._cache.move_to_end(tag)
+            return data, dict(entry['info'])
+        data = np.load(self._file_path(entry['file']), mmap_mode='r')
+        if data.nbytes <= self.max_memory_bytes:
+            data = np.array(data)
+            data.flags.writeable = False
+            self._add_to_cache(tag, data)
+        return data, dict(entry['info'])
+
+    def __setitem__(self, tag, value):
+        """ Stashes raw data under tag. Raw data stashed under the same tag before is replaced.
+
+        @param str tag: tag of the raw data
+        @param tuple value: (numpy.ndarray raw data, dict info)
+        """
+        data, info = value
+        data = np.ascontiguousarray(data)
+        # Write to a new file first, so the stash is never left with an incomplete file. A
+        # replaced file may still be memory-mapped and is deleted afterwards (if possible).
+        filename = uuid.uuid4().hex + '.npy'
+        tmp_path = self._file_path(filename + '.tmp')
+        with open(tmp_path, 'wb') as file:
+            np.save(file, data)
+        os.replace(tmp_path, self._file_path(filename))
+        self._remove(tag)
+        self._index[tag] = {'file': filename,
+                            'info': {key: val.item() if isinstance(val, np.generic) else val
+                                     for key, val in info.items()}}
+        self._save_index()
+        if data.nbytes <= self.max_memory_bytes:
+            data = data.copy()
+            data.flags.writeable = False
+            self._add_to_cache(tag, data)
+        return
+
+    def __delitem__(self, tag):
+        if tag not in self._index:
+            raise KeyError(tag)
+        self._remove(tag)
+        self._save_index()
+        return
+
+    def get(self, tag, default=None):
+        return self[tag] if tag in self._index else default
+
+    def tags(self):
+        """ Tags of the stashed raw data, from the least to the most recently used """
+        return list(self._index)
+
+    def clear(self):
+        for tag in list(self._index):
+            self._remove(tag)
+        self._save_index()
+        return
+
+    @property
+    def memory_bytes(self):
+        """ Size of the stashed arrays currently held in memory """
+        return self._cache_bytes
+
+    def _add_to_cache(self, tag, data):
+        """ Adds an array to the memory cache. Evicts the least recently used arrays if the memory
+        budget is exceeded.
+        """
+        self._cache[tag] = data
+        self._cache_bytes += data.nbytes
+        while self._cache_bytes > self.max_memory_bytes:
+            self._cache_bytes -= self._cache.popitem(last=False)[1].nbytes
+        return
+
+    def _remove(self, tag):
+        entry = self._index.pop(tag, None)
+        data = self._cache.pop(tag, None)
+        if data is not None:
+            self._cache_bytes -= data.nbytes
+        if entry is not None:
+            try:
+                os.remove(self._file_path(entry['file']))
+            except OSError:
+                pass
+        return
+
+    def _file_path(self, filename):
+        return os.path.join(self.path, filename)
+
+    def _load_index(self):
+        """ Reads the index file and deletes files of the stash directory not in the index """
+        try:
+            with open(self._file_path(self._index_filename), 'r') as file:
+                index = json.load(file, object_pairs_hook=OrderedDict)
+        except (OSError, ValueError):
+            index = OrderedDict()
+        for tag, entry in index.items():
+            if os.path.isfile(self._file_path(entry['file'])):
+                self._index[tag] = entry
+        files_in_use = {entry['file'] for entry in self._index.values()}
+        for filename in os.listdir(self.path):
+            if filename.endswith(('.npy', '.tmp')) and filename not in files_in_use:
+                try:
+                    os.remove(self._file_path(filename))
+                except OSError:
+                    pass
+        return
+
+    def _save_index(self):
+        tmp_path = self._file_path(self._index_filename + '.tmp')
+        with open(tmp_path, 'w') as file:
+            json.dump(self._index, file, indent=4)
+        os.replace(tmp_path, self._file_path(self._index_filename))
+        return
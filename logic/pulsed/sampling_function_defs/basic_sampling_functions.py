@@ -22,13 +22,25 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 
 import numpy as np
 from collections import OrderedDict
-from logic.pulsed.sampling_functions import SamplingBase
+from logic.pulsed.sampling_functions import SamplingBase, SamplingWorkspace
+
+
+def _sine_into(workspace, amplitude, frequency, phase, out):
+    """ Writes amplitude * sin(2*pi*frequency*t + phase) into the float64 array out using the angular
+    time array shared in the workspace.
+    """
+    np.add(workspace.angular_time(frequency), phase, out=out)
+    np.sin(out, out=out)
+    np.multiply(amplitude, out, out=out)
+    return out
 
 
 class Idle(SamplingBase):
     """
     Object representing an idle element (zero voltage)
     """
+    is_constant = True
+
     def __init__(self):
         pass
 
@@ -37,11 +49,17 @@ class Idle(SamplingBase):
         samples_arr = np.zeros(len(time_array))
         return samples_arr
 
+    @staticmethod
+    def get_samples_into(time_array, out, scale=1.0, workspace=None):
+        out[:] = 0
+        return out
+
 
 class DC(SamplingBase):
     """
     Object representing an DC element (constant voltage)
     """
+    is_constant = True
     params = OrderedDict()
     params['voltage'] = {'unit': 'V', 'init': 0.0, 'min': -np.inf, 'max': +np.inf, 'type': float}
 
@@ -61,6 +79,10 @@ class DC(SamplingBase):
         samples_arr = self._get_dc(time_array, self.voltage)
         return samples_arr
 
+    def get_samples_into(self, time_array, out, scale=1.0, workspace=None):
+        out[:] = self.voltage / scale
+        return out
+
 
 class Sin(SamplingBase):
     """
@@ -96,6 +118,14 @@ class Sin(SamplingBase):
         samples_arr = self._get_sine(time_array, self.amplitude, self.frequency, phase_rad)
         return samples_arr
 
+    def get_samples_into(self, time_array, out, scale=1.0, workspace=None):
+        if workspace is None:
+            workspace = SamplingWorkspace(time_array)
+        samples_arr = _sine_into(workspace, self.amplitude, self.frequency,
+                                 np.pi * self.phase / 180, workspace.scratch(0))
+        np.divide(samples_arr, scale, out=out, casting='unsafe')
+        return out
+
 
 class DoubleSinSum(SamplingBase):
     """
@@ -154,6 +184,19 @@ class DoubleSinSum(SamplingBase):
         samples_arr += self._get_sine(time_array, self.amplitude_2, self.frequency_2, phase_rad)
         return samples_arr
 
+    def get_samples_into(self, time_array, out, scale=1.0, workspace=None):
+        if workspace is None:
+            workspace = SamplingWorkspace(time_array)
+        samples_arr = workspace.scratch(0)
+        sine_arr = workspace.scratch(1)
+        _sine_into(workspace, self.amplitude_1, self.frequency_1, np.pi * self.phase_1 / 180,
+                   samples_arr)
+        _sine_into(workspace, self.amplitude_2, self.frequency_2, np.pi * self.phase_2 / 180,
+                   sine_arr)
+        np.add(samples_arr, sine_arr, out=samples_arr)
+        np.divide(samples_arr, scale, out=out, casting='unsafe')
+        return out
+
 
 class DoubleSinProduct(SamplingBase):
     """
@@ -212,6 +255,19 @@ class DoubleSinProduct(SamplingBase):
         samples_arr *= self._get_sine(time_array, self.amplitude_2, self.frequency_2, phase_rad)
         return samples_arr
 
+    def get_samples_into(self, time_array, out, scale=1.0, workspace=None):
+        if workspace is None:
+            workspace = SamplingWorkspace(time_array)
+        samples_arr = workspace.scratch(0)
+        sine_arr = workspace.scratch(1)
+        _sine_into(workspace, self.amplitude_1, self.frequency_1, np.pi * self.phase_1 / 180,
+                   samples_arr)
+        _sine_into(workspace, self.amplitude_2, self.frequency_2, np.pi * self.phase_2 / 180,
+                   sine_arr)
+        np.multiply(samples_arr, sine_arr, out=samples_arr)
+        np.divide(samples_arr, scale, out=out, casting='unsafe')
+        return out
+
 
 class TripleSinSum(SamplingBase):
     """
@@ -292,6 +348,22 @@ class TripleSinSum(SamplingBase):
         samples_arr += self._get_sine(time_array, self.amplitude_3, self.frequency_3, phase_rad)
         return samples_arr
 
+    def get_samples_into(self, time_array, out, scale=1.0, workspace=None):
+        if workspace is None:
+            workspace = SamplingWorkspace(time_array)
+        samples_arr = workspace.scratch(0)
+        sine_arr = workspace.scratch(1)
+        _sine_into(workspace, self.amplitude_1, self.frequency_1, np.pi * self.phase_1 / 180,
+                   samples_arr)
+        _sine_into(workspace, self.amplitude_2, self.frequency_2, np.pi * self.phase_2 / 180,
+                   sine_arr)
+        np.add(samples_arr, sine_arr, out=samples_arr)
+        _sine_into(workspace, self.amplitude_3, self.frequency_3, np.pi * self.phase_3 / 180,
+                   sine_arr)
+        np.add(samples_arr, sine_arr, out=samples_arr)
+        np.divide(samples_arr, scale, out=out, casting='unsafe')
+        return out
+
 
 class TripleSinProduct(SamplingBase):
     """
@@ -372,6 +444,22 @@ class TripleSinProduct(SamplingBase):
         samples_arr *= self._get_sine(time_array, self.amplitude_3, self.frequency_3, phase_rad)
         return samples_arr
 
+    def get_samples_into(self, time_array, out, scale=1.0, workspace=None):
+        if workspace is None:
+            workspace = SamplingWorkspace(time_array)
+        samples_arr = workspace.scratch(0)
+        sine_arr = workspace.scratch(1)
+        _sine_into(workspace, self.amplitude_1, self.frequency_1, np.pi * self.phase_1 / 180,
+                   samples_arr)
+        _sine_into(workspace, self.amplitude_2, self.frequency_2, np.pi * self.phase_2 / 180,
+                   sine_arr)
+        np.multiply(samples_arr, sine_arr, out=samples_arr)
+        _sine_into(workspace, self.amplitude_3, self.frequency_3, np.pi * self.phase_3 / 180,
+                   sine_arr)
+        np.multiply(samples_arr, sine_arr, out=samples_arr)
+        np.divide(samples_arr, scale, out=out, casting='unsafe')
+        return out
+
 
 class Chirp(SamplingBase):
     """
@@ -414,6 +502,27 @@ class Chirp(SamplingBase):
                         time_array - time_array[0]) / time_diff / 2) + phase_rad)
         return samples_arr
 
+    def get_samples_into(self, time_array, out, scale=1.0, workspace=None):
+        if workspace is None:
+            workspace = SamplingWorkspace(time_array)
+        phase_rad = np.deg2rad(self.phase)
+        freq_diff = self.stop_freq - self.start_freq
+        time_diff = time_array[-1] - time_array[0]
+        # instantaneous frequency
+        samples_arr = workspace.scratch(0)
+        np.subtract(time_array, time_array[0], out=samples_arr)
+        np.multiply(freq_diff, samples_arr, out=samples_arr)
+        samples_arr /= time_diff
+        samples_arr /= 2
+        samples_arr += self.start_freq
+        # phase and samples
+        np.multiply(workspace.angular_time(1.0), samples_arr, out=samples_arr)
+        samples_arr += phase_rad
+        np.sin(samples_arr, out=samples_arr)
+        np.multiply(self.amplitude, samples_arr, out=samples_arr)
+        np.divide(samples_arr, scale, out=out, casting='unsafe')
+        return out
+
 class AllenEberlyChirp(SamplingBase):
 
     """
@@ -491,6 +600,42 @@ class AllenEberlyChirp(SamplingBase):
                              phi_tanh_chirp(time_array))
         return samples_arr
 
+    def get_samples_into(self, time_array, out, scale=1.0, workspace=None):
+        if workspace is None:
+            workspace = SamplingWorkspace(time_array)
+        phase_rad = np.deg2rad(self.phase)
+        freq_range_max = self.stop_freq - self.start_freq
+        t_start = time_array[0]
+        pulse_duration = time_array[-1] - time_array[0]
+        freq_center = (self.stop_freq + self.start_freq) / 2
+        tau_run = self.tau_pulse
+        amp_conv = 2 * self.amplitude
+
+        # (t - mu) / tau_run and cosh of it
+        relative_time = workspace.scratch(0)
+        np.subtract(time_array, t_start, out=relative_time)
+        relative_time -= pulse_duration / 2
+        relative_time /= tau_run
+        cosh_arr = workspace.scratch(1)
+        np.cosh(relative_time, out=cosh_arr)
+        # sech envelope
+        samples_arr = workspace.scratch(2)
+        np.divide(1, cosh_arr, out=samples_arr)
+        np.multiply(amp_conv, samples_arr, out=samples_arr)
+        # tanh chirp phase
+        cosh_arr *= 1 / np.cosh(pulse_duration / (2 * tau_run))
+        np.log(cosh_arr, out=cosh_arr)
+        np.multiply((2 * np.pi * freq_range_max / 2) * tau_run, cosh_arr, out=cosh_arr)
+        # carrier
+        np.subtract(time_array, t_start, out=relative_time)
+        np.multiply(2 * np.pi * freq_center, relative_time, out=relative_time)
+        np.add(phase_rad, relative_time, out=relative_time)
+        relative_time += cosh_arr
+        np.cos(relative_time, out=relative_time)
+        samples_arr *= relative_time
+        np.divide(samples_arr, scale, out=out, casting='unsafe')
+        return out
+
 # FIXME: Not implemented yet!
 # class ImportedSamples(object):
 #     """
@@ -26,6 +26,7 @@ import sys
 import inspect
 import copy
 import logging
+import numpy as np
 from collections import OrderedDict
 
 
@@ -35,6 +36,9 @@ class SamplingBase:
     """
     params = OrderedDict()
     log = logging.getLogger(__name__)
+    # Set to True if the function returns the same value for every time bin (e.g. Idle or DC).
+    # The sampler will then fill in the samples without evaluating the function for each element.
+    is_constant = False
 
     def __repr__(self):
         kwargs = []
@@ -67,6 +71,25 @@ class SamplingBase:
         hash_other = hash(tuple(hash_list))
         return hash_self == hash_other
 
+    def get_samples_into(self, time_array, out, scale=1.0, workspace=None):
+        """ Evaluates the sampling function and writes the samples divided by scale into out.
+
+        This default implementation calls get_samples. Sampling functions can override it to
+        avoid temporary arrays and to share computations (e.g. the phase of a sine with a certain
+        frequency) with the other channels of an element via the workspace.
+
+        @param numpy.ndarray time_array: time of each sample in s (float64)
+        @param numpy.ndarray out: array to write the samples into (e.g. float32 view into the
+                                  sample chunk). Must have the same length as time_array.
+        @param float scale: the samples are divided by this value (e.g. half the analog amplitude)
+        @param SamplingWorkspace workspace: optional workspace shared by all channels evaluated
+                                            with the same time_array
+
+        @return numpy.ndarray: out
+        """
+        np.divide(self.get_samples(time_array), scale, out=out, casting='unsafe')
+        return out
+
     def get_dict_representation(self):
         dict_repr = dict()
         dict_repr['name'] = type(self).__name__
@@ -76,6 +99,76 @@ class SamplingBase:
         return dict_repr
 
 
+class SamplingWorkspace:
+    """
+    Scratch memory for SamplingBase.get_samples_into shared by all channels sampled with the same
+    time array (i.e. all channels of an element).
+
+    The arrays are reused when the workspace is reset for the next time array, so the evaluation of
+    the sampling functions does not need to allocate memory once the workspace has grown to the
+    largest time array.
+    """
+
+    def __init__(self, time_array=None):
+        """
+        @param numpy.ndarray time_array: time array to evaluate the sampling functions with
+        """
+        self.time_array = None
+        # Arrays holding 2*pi*frequency*time_array for each frequency evaluated with the current
+        # time array. The arrays might be longer than the time array.
+        self._angular_times = dict()
+        self._scratch = list()
+        self._free_arrays = list()
+        if time_array is not None:
+            self.reset(time_array)
+        return
+
+    def reset(self, time_array):
+        """ Sets a new time array. All arrays returned so far become invalid.
+
+        @param numpy.ndarray time_array: time array to evaluate the sampling functions with
+        """
+        self.time_array = time_array
+        self._free_arrays.extend(self._angular_times.values())
+        self._angular_times.clear()
+        return
+
+    def angular_time(self, frequency):
+        """ Returns 2*pi*frequency*time_array. The array is computed once per frequency and time
+        array and must not be modified.
+
+        @param float frequency: frequency in Hz
+
+        @return numpy.ndarray: angular time array (float64)
+        """
+        length = len(self.time_array)
+        array = self._angular_times.get(frequency)
+        if array is None:
+            array = self._allocate(self._free_arrays.pop() if self._free_arrays else None)
+            np.multiply(2 * np.pi * frequency, self.time_array, out=array[:length])
+            self._angular_times[frequency] = array
+        return array[:length]
+
+    def scratch(self, index=0):
+        """ Returns a float64 scratch array with the length of the time array. Scratch arrays with
+        different index can be used at the same time.
+
+        @param int index: index of the scratch array
+
+        @return numpy.ndarray: scratch array with undefined content
+        """
+        while len(self._scratch) <= index:
+            self._scratch.append(None)
+        self._scratch[index] = self._allocate(self._scratch[index])
+        return self._scratch[index][:len(self.time_array)]
+
+    def _allocate(self, array):
+        """ Returns array if it can hold the time array, a new array otherwise """
+        if array is None or array.size < len(self.time_array):
+            return np.empty(len(self.time_array), dtype='float64')
+        return array
+
+
 class SamplingFunctions:
     """
 
@@ -41,6 +41,11 @@ from logic.generic_logic import GenericLogic
 from logic.pulsed.pulse_objects import PulseBlock, PulseBlockEnsemble, PulseSequence
 from logic.pulsed.pulse_objects import PulseObjectGenerator, PulseBlockElement
 from logic.pulsed.sampling_functions import SamplingFunctions
+from logic.pulsed.ensemble_sampler import EnsembleSampler, ChunkPipeline
+from logic.pulsed.parallel_sampling import ParallelEnsembleSampler
+from logic.pulsed.asset_store import PulseAssetStore, LazyAssetDict
+from logic.pulsed.waveform_cache import WaveformCache, get_waveform_hash
+from logic.pulsed.analysis_cache import PulseAnalysisCache
 from interface.pulser_interface import SequenceOption
 
 
@@ -76,6 +81,15 @@ class SequenceGeneratorLogic(GenericLogic):
                                                    missing='nothing')
     _info_on_estimated_upload_time = ConfigOption(name='info_on_estimated_upload_time', default=60, missing='nothing')
     _disable_bench_prompt = ConfigOption(name='disable_benchmark_prompt', default=False, missing='nothing')
+    # Optional on-disk cache of sampled waveforms. The cache is disabled if the size is 0.
+    _waveform_cache_dir = ConfigOption(name='waveform_cache_path', default=None, missing='nothing')
+    _waveform_cache_bytes = ConfigOption(name='waveform_cache_bytes', default=0, missing='nothing')
+    # Number of worker processes to sample the ensembles of a PulseSequence in parallel.
+    # Parallel sampling is disabled for values < 2.
+    _sampling_processes = ConfigOption(name='sampling_processes', default=0, missing='nothing')
+    # Number of chunk buffers used for chunkwise sampling (see overhead_bytes). For values > 1 the
+    # next chunk is sampled in a worker thread while the previous one is written to the device.
+    _sampling_buffers = ConfigOption(name='sampling_buffers', default=2, missing='nothing')
 
     # status vars
     # Global parameters describing the channel usage and common parameters used during pulsed object
@@ -101,6 +115,10 @@ class SequenceGeneratorLogic(GenericLogic):
     # _saved_pulse_block_ensembles = StatusVar(default=OrderedDict())
     # _saved_pulse_sequences = StatusVar(default=OrderedDict())
 
+    # Content hashes (see waveform_cache.get_waveform_hash) of the waveforms written to the pulse
+    # generator. Keys are the waveform name tags.
+    _written_waveform_hashes = StatusVar(name='written_waveform_hashes', default=dict())
+
     _benchmark_write = BenchmarkTool()
     _benchmark_write_state = StatusVar(representer=_benchmark_write.save, constructor=_benchmark_write.load_from_dict)
     _benchmark_load = BenchmarkTool()
@@ -148,6 +166,16 @@ class SequenceGeneratorLogic(GenericLogic):
         # Get instance of PulseObjectGenerator which takes care of collecting all predefined methods
         self._pog = None
 
+        # On-disk cache of sampled waveforms
+        self._waveform_cache = None
+        # Single file store of the PulseBlock, PulseBlockEnsemble and PulseSequence instances
+        self._asset_store = None
+        # Worker processes sampling the ensembles of a PulseSequence (only during sequence sampling)
+        self._parallel_sampler = None
+        self._sampling_functions_paths = list()
+        # Memoized results of analyze_block_ensemble and analyze_sequence
+        self._analysis_cache = PulseAnalysisCache()
+
         # The created pulse objects (PulseBlock, PulseBlockEnsemble, PulseSequence) are saved in
         # these dictionaries. The keys are the names.
         self._saved_pulse_blocks = OrderedDict()
@@ -198,17 +226,36 @@ class SequenceGeneratorLogic(GenericLogic):
                 self.log.error('ConfigOption additional_sampling_functions_path needs to either be a string or '
                                'a list of strings.')
         SamplingFunctions.import_sampling_functions(sf_path_list)
+        self._sampling_functions_paths = sf_path_list
 
         # Read back settings from device and update instance variables accordingly
         self._read_settings_from_device()
 
+        # Initialize the on-disk cache for sampled waveforms
+        if self._waveform_cache_dir is None:
+            self._waveform_cache_dir = os.path.join(self._assets_storage_dir, 'waveform_cache')
+        self._waveform_cache = WaveformCache(path=self._waveform_cache_dir,
+                                             max_bytes=self._waveform_cache_bytes)
+
+        # Names of the waveforms and sequences present on the device. Queried once here and
+        # kept up to date by the sigAvailable...Updated signals, so loading the sampling
+        # information of the saved assets does not query the device for every single asset.
+        self._device_waveforms = set(self.sampled_waveforms)
+        self._device_sequences = set(self.sampled_sequences)
+        self.sigAvailableWaveformsUpdated.connect(self._update_device_waveforms)
+        self.sigAvailableSequencesUpdated.connect(self._update_device_sequences)
+
         # Update saved blocks/ensembles/sequences from serialized files
         self._saved_pulse_blocks = OrderedDict()
         self._saved_pulse_block_ensembles = OrderedDict()
         self._saved_pulse_sequences = OrderedDict()
-        self._update_blocks_from_file()
-        self._update_ensembles_from_file()
-        self._update_sequences_from_file()
+        # Open the asset store and move the pickled assets of older versions into it
+        self._asset_store = PulseAssetStore(
+            os.path.join(self._assets_storage_dir, 'pulse_assets.db'))
+        self._migrate_pickled_assets()
+        self._update_blocks_from_store()
+        self._update_ensembles_from_store()
+        self._update_sequences_from_store()
 
         # Get instance of PulseObjectGenerator which takes care of collecting all predefined methods
         self._pog = PulseObjectGenerator(sequencegeneratorlogic=self)
@@ -220,6 +267,18 @@ class SequenceGeneratorLogic(GenericLogic):
     def on_deactivate(self):
         """ Deinitialisation performed during deactivation of the module.
         """
+        self.sigAvailableWaveformsUpdated.disconnect(self._update_device_waveforms)
+        self.sigAvailableSequencesUpdated.disconnect(self._update_device_sequences)
+        self._stop_parallel_sampling()
+        self._asset_store.close()
+        return
+
+    def _update_device_waveforms(self, waveform_names):
+        self._device_waveforms = set(waveform_names)
+        return
+
+    def _update_device_sequences(self, sequence_names):
+        self._device_sequences = set(sequence_names)
         return
 
     # @_saved_pulse_blocks.constructor
@@ -308,6 +367,13 @@ class SequenceGeneratorLogic(GenericLogic):
     def pulse_generator_constraints(self):
         return self.pulsegenerator().get_constraints()
 
+    @property
+    def analysis_cache_statistics(self):
+        """ Hits, misses and number of entries of the memoized analyze_block_ensemble and
+        analyze_sequence results.
+        """
+        return self._analysis_cache.statistics
+
     @property
     def sampled_waveforms(self):
         return netobtain(self.pulsegenerator().get_waveform_names())
@@ -465,6 +531,7 @@ class SequenceGeneratorLogic(GenericLogic):
             self.log.error('Can´t clear the pulser as it is running. Switch off the pulser and try again.')
             return -1
         self.pulsegenerator().clear_all()
+        self._written_waveform_hashes = dict()
         # Delete all sampling information from all PulseBlockEnsembles and PulseSequences
         for seq_name in self.saved_pulse_sequences:
             seq = self.saved_pulse_sequences[seq_name]
@@ -737,7 +804,8 @@ class SequenceGeneratorLogic(GenericLogic):
         @param PulseBlock block: PulseBlock instance to save
         """
         self._saved_pulse_blocks[block.name] = block
-        self._save_block_to_file(block)
+        self._analysis_cache.invalidate('block', block.name)
+        self._save_block_to_store(block)
         self.sigBlockDictUpdated.emit(self._saved_pulse_blocks)
         return
 
@@ -760,18 +828,36 @@ class SequenceGeneratorLogic(GenericLogic):
         # Delete from dict
         if name in self.saved_pulse_blocks:
             del (self._saved_pulse_blocks[name])
+        self._analysis_cache.invalidate('block', name)
 
         # Delete from disk
-        filepath = os.path.join(self._assets_storage_dir, '{0}.block'.format(name))
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        self._asset_store.delete('block', name)
 
         self.sigBlockDictUpdated.emit(self.saved_pulse_blocks)
         return
 
-    def _load_block_from_file(self, block_name):
+    def _load_block_from_store(self, block_name):
         """
-        De-serializes a PulseBlock instance from file.
+        Creates a PulseBlock instance from its dict representation in the asset store.
+
+        @param str block_name: The name of the PulseBlock instance to load
+        @return PulseBlock: The loaded PulseBlock instance (None if loading failed)
+        """
+        try:
+            block_dict = self._asset_store.load('block', block_name)
+            if block_dict is not None:
+                return PulseBlock.block_from_dict(block_dict)
+        except AttributeError:
+            self.log.error('Failed to load PulseBlock "{0}" because of unknown sampling functions.\n'
+                           'For better debugging I dumped the traceback to debug.'.format(block_name))
+            self.log.debug('{0!s}'.format(traceback.format_exc()))
+        except Exception:
+            self.log.exception('Failed to load PulseBlock "{0}" from asset store.'.format(block_name))
+        return None
+
+    def _load_pickled_block(self, block_name):
+        """
+        De-serializes a PulseBlock instance from a pickle file of older qudi versions.
 
         @param str block_name: The name of the PulseBlock instance to de-serialize
         @return PulseBlock: The de-serialized PulseBlock instance
@@ -792,44 +878,34 @@ class SequenceGeneratorLogic(GenericLogic):
                 self.log.debug('{0!s}'.format(traceback.format_exc()))
         return block
 
-    def _update_blocks_from_file(self):
+    def _update_blocks_from_store(self):
         """
-        Update the saved_pulse_blocks dict by de-serializing stored file.
+        Update the saved_pulse_blocks dict with all PulseBlock names in the asset store.
+        The PulseBlock instances are loaded on first access.
         """
-        # Get all files in asset directory ending on ".block" and extract a sorted list of
-        # PulseBlock names
-        with os.scandir(self._assets_storage_dir) as scan:
-            names = natural_sort(f.name[:-6] for f in scan if f.is_file and f.name.endswith('.block'))
-
-        # Load all blocks from file
-        for block_name in names:
-            block = self._load_block_from_file(block_name)
-            if block is not None:
-                self._saved_pulse_blocks[block_name] = block
-
+        self._saved_pulse_blocks = LazyAssetDict(self._asset_store.names('block'),
+                                                 self._load_block_from_store)
         self.sigBlockDictUpdated.emit(self._saved_pulse_blocks)
         return
 
-    def _save_block_to_file(self, block):
+    def _save_block_to_store(self, block):
         """
-        Saves a single PulseBlock instance to file by serialization using pickle.
+        Saves a single PulseBlock instance to the asset store.
 
         @param PulseBlock block: The PulseBlock instance to be saved
         """
-        filename = '{0}.block'.format(block.name)
         try:
-            with open(os.path.join(self._assets_storage_dir, filename), 'wb') as file:
-                pickle.dump(block, file)
+            self._asset_store.save('block', block.name, block.get_dict_representation())
         except:
-            self.log.error('Failed to serialize PulseBlock "{0}" to file.'.format(block.name))
+            self.log.exception('Failed to save PulseBlock "{0}" to asset store.'.format(block.name))
         return
 
-    def _save_blocks_to_file(self):
+    def _save_blocks_to_store(self):
         """
-        Saves the saved_pulse_blocks dict items to files.
+        Saves the saved_pulse_blocks dict items to the asset store.
         """
         for block in self._saved_pulse_blocks.values():
-            self._save_block_to_file(block)
+            self._save_block_to_store(block)
         return
 
     def save_ensemble(self, ensemble):
@@ -838,7 +914,8 @@ class SequenceGeneratorLogic(GenericLogic):
         @param PulseBlockEnsemble ensemble: PulseBlockEnsemble instance to save
         """
         self._saved_pulse_block_ensembles[ensemble.name] = ensemble
-        self._save_ensemble_to_file(ensemble)
+        self._analysis_cache.invalidate('ensemble', ensemble.name)
+        self._save_ensemble_to_store(ensemble)
         self.sigEnsembleDictUpdated.emit(self.saved_pulse_block_ensembles)
         return
 
@@ -867,18 +944,41 @@ class SequenceGeneratorLogic(GenericLogic):
                 self.sigAvailableWaveformsUpdated.emit(self.sampled_waveforms)
             # delete PulseBlockEnsemble
             del self._saved_pulse_block_ensembles[name]
+        self._analysis_cache.invalidate('ensemble', name)
 
         # Delete from disk
-        filepath = os.path.join(self._assets_storage_dir, '{0}.ensemble'.format(name))
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        self._asset_store.delete('ensemble', name)
 
         self.sigEnsembleDictUpdated.emit(self.saved_pulse_block_ensembles)
         return
 
-    def _load_ensemble_from_file(self, ensemble_name):
+    def _load_ensemble_from_store(self, ensemble_name):
         """
-        De-serializes a PulseBlockEnsemble instance from file.
+        Creates a PulseBlockEnsemble instance from its dict representation in the asset store.
+        Outdated sampling information is removed if the waveforms are not present on the device.
+
+        @param str ensemble_name: The name of the PulseBlockEnsemble instance to load
+        @return PulseBlockEnsemble: The loaded PulseBlockEnsemble instance (None if loading failed)
+        """
+        try:
+            ensemble_dict = self._asset_store.load('ensemble', ensemble_name)
+            if ensemble_dict is None:
+                return None
+            ensemble = PulseBlockEnsemble.ensemble_from_dict(ensemble_dict)
+        except Exception:
+            self.log.exception('Failed to load PulseBlockEnsemble "{0}" from asset store.'
+                               ''.format(ensemble_name))
+            return None
+
+        if ensemble.sampling_information.get('waveforms'):
+            waveform_set = set(ensemble.sampling_information['waveforms'])
+            if not self._device_waveforms.issuperset(waveform_set):
+                ensemble.sampling_information = dict()
+        return ensemble
+
+    def _load_pickled_ensemble(self, ensemble_name):
+        """
+        De-serializes a PulseBlockEnsemble instance from a pickle file of older qudi versions.
 
         @param str ensemble_name: The name of the PulseBlockEnsemble instance to de-serialize
         @return PulseBlockEnsemble: The de-serialized PulseBlockEnsemble instance
@@ -895,53 +995,35 @@ class SequenceGeneratorLogic(GenericLogic):
                 os.remove(filepath)
         return ensemble
 
-    def _update_ensembles_from_file(self):
+    def _update_ensembles_from_store(self):
         """
-        Update the saved_pulse_block_ensembles dict from temporary file.
+        Update the saved_pulse_block_ensembles dict with all PulseBlockEnsemble names in the asset
+        store. The PulseBlockEnsemble instances are loaded on first access.
         """
-        # Get all files in asset directory ending on ".ensemble" and extract a sorted list of
-        # PulseBlockEnsemble names
-        with os.scandir(self._assets_storage_dir) as scan:
-            names = natural_sort(f.name[:-9] for f in scan if f.is_file and f.name.endswith('.ensemble'))
-
-        # Get all waveforms currently stored on pulser hardware in order to delete outdated
-        # sampling_information dicts
-        sampled_waveforms = set(self.sampled_waveforms)
-
-        # Load all ensembles from file
-        for ensemble_name in names:
-            ensemble = self._load_ensemble_from_file(ensemble_name)
-            if ensemble is not None:
-                if ensemble.sampling_information.get('waveforms'):
-                    waveform_set = set(ensemble.sampling_information['waveforms'])
-                    if not sampled_waveforms.issuperset(waveform_set):
-                        ensemble.sampling_information = dict()
-                self._saved_pulse_block_ensembles[ensemble_name] = ensemble
-
+        self._saved_pulse_block_ensembles = LazyAssetDict(self._asset_store.names('ensemble'),
+                                                          self._load_ensemble_from_store)
         self.sigEnsembleDictUpdated.emit(self.saved_pulse_block_ensembles)
         return
 
-    def _save_ensemble_to_file(self, ensemble):
+    def _save_ensemble_to_store(self, ensemble):
         """
-        Saves a single PulseBlockEnsemble instance to file by serialization using pickle.
+        Saves a single PulseBlockEnsemble instance to the asset store.
 
         @param PulseBlockEnsemble ensemble: The PulseBlockEnsemble instance to be saved
         """
-        filename = '{0}.ensemble'.format(ensemble.name)
         try:
-            with open(os.path.join(self._assets_storage_dir, filename), 'wb') as file:
-                pickle.dump(ensemble, file)
+            self._asset_store.save('ensemble', ensemble.name, ensemble.get_dict_representation())
         except:
-            self.log.error('Failed to serialize PulseBlockEnsemble "{0}" to file.'
-                           ''.format(ensemble.name))
+            self.log.exception('Failed to save PulseBlockEnsemble "{0}" to asset store.'
+                               ''.format(ensemble.name))
         return
 
-    def _save_ensembles_to_file(self):
+    def _save_ensembles_to_store(self):
         """
-        Saves the saved_pulse_block_ensembles dict items to files.
+        Saves the saved_pulse_block_ensembles dict items to the asset store.
         """
         for ensemble in self.saved_pulse_block_ensembles.values():
-            self._save_ensemble_to_file(ensemble)
+            self._save_ensemble_to_store(ensemble)
         return
 
     def save_sequence(self, sequence):
@@ -953,7 +1035,7 @@ class SequenceGeneratorLogic(GenericLogic):
         @return: str: name of the serialized object, if needed.
         """
         self._saved_pulse_sequences[sequence.name] = sequence
-        self._save_sequence_to_file(sequence)
+        self._save_sequence_to_store(sequence)
         self.sigSequenceDictUpdated.emit(self.saved_pulse_sequences)
         return
 
@@ -986,16 +1068,41 @@ class SequenceGeneratorLogic(GenericLogic):
             del self._saved_pulse_sequences[name]
 
         # Delete from disk
-        filepath = os.path.join(self._assets_storage_dir, '{0}.sequence'.format(name))
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        self._asset_store.delete('sequence', name)
 
         self.sigSequenceDictUpdated.emit(self.saved_pulse_sequences)
         return
 
-    def _load_sequence_from_file(self, sequence_name):
+    def _load_sequence_from_store(self, sequence_name):
+        """
+        Creates a PulseSequence instance from its dict representation in the asset store.
+        Outdated sampling information is removed if the sequence or its waveforms are not present
+        on the device.
+
+        @param str sequence_name: The name of the PulseSequence instance to load
+        @return PulseSequence: The loaded PulseSequence instance (None if loading failed)
+        """
+        try:
+            sequence_dict = self._asset_store.load('sequence', sequence_name)
+            if sequence_dict is None:
+                return None
+            sequence = PulseSequence.sequence_from_dict(sequence_dict)
+        except Exception:
+            self.log.exception('Failed to load PulseSequence "{0}" from asset store.'
+                               ''.format(sequence_name))
+            return None
+
+        if sequence.name not in self._device_sequences:
+            sequence.sampling_information = dict()
+        elif sequence.sampling_information:
+            waveform_set = set(sequence.sampling_information['waveforms'])
+            if not self._device_waveforms.issuperset(waveform_set):
+                sequence.sampling_information = dict()
+        return sequence
+
+    def _load_pickled_sequence(self, sequence_name):
         """
-        De-serializes a PulseSequence instance from file.
+        De-serializes a PulseSequence instance from a pickle file of older qudi versions.
 
         @param str sequence_name: The name of the PulseSequence instance to de-serialize
         @return PulseSequence: The de-serialized PulseSequence instance
@@ -1054,58 +1161,78 @@ class SequenceGeneratorLogic(GenericLogic):
                                    ''.format(sequence_name))
                     os.remove(filepath)
                     return None
-            self._save_sequence_to_file(sequence)
         return sequence
 
-    def _update_sequences_from_file(self):
+    def _update_sequences_from_store(self):
         """
-        Update the saved_pulse_sequences dict from files.
+        Update the saved_pulse_sequences dict with all PulseSequence names in the asset store.
+        The PulseSequence instances are loaded on first access.
         """
-        # Get all files in asset directory ending on ".sequence" and extract a sorted list of
-        # PulseSequence names
-        with os.scandir(self._assets_storage_dir) as scan:
-            names = natural_sort(f.name[:-9] for f in scan if f.is_file and f.name.endswith('.sequence'))
-
-        # Get all waveforms and sequences currently stored on pulser hardware in order to delete
-        # outdated sampling_information dicts
-        sampled_waveforms = set(self.sampled_waveforms)
-        sampled_sequences = set(self.sampled_sequences)
-
-        # Load all sequences from file
-        for sequence_name in names:
-            sequence = self._load_sequence_from_file(sequence_name)
-            if sequence is not None:
-                if sequence.name not in sampled_sequences:
-                    sequence.sampling_information = dict()
-                elif sequence.sampling_information:
-                    waveform_set = set(sequence.sampling_information['waveforms'])
-                    if not sampled_waveforms.issuperset(waveform_set):
-                        sequence.sampling_information = dict()
-                self._saved_pulse_sequences[sequence_name] = sequence
-
+        self._saved_pulse_sequences = LazyAssetDict(self._asset_store.names('sequence'),
+                                                    self._load_sequence_from_store)
         self.sigSequenceDictUpdated.emit(self.saved_pulse_sequences)
         return
 
-    def _save_sequence_to_file(self, sequence):
+    def _save_sequence_to_store(self, sequence):
         """
-        Saves a single PulseSequence instance to file by serialization using pickle.
+        Saves a single PulseSequence instance to the asset store.
 
         @param PulseSequence sequence: The PulseSequence instance to be saved
         """
-        filename = '{0}.sequence'.format(sequence.name)
         try:
-            with open(os.path.join(self._assets_storage_dir, filename), 'wb') as file:
-                pickle.dump(sequence, file)
+            sequence_dict = sequence.get_dict_representation()
+            # Store the sequence steps as plain dicts. Pickled SequenceStep instances lose their
+            # attribute access.
+            sequence_dict['ensemble_list'] = [dict(step) for step in sequence.ensemble_list]
+            self._asset_store.save('sequence', sequence.name, sequence_dict)
         except:
-            self.log.error('Failed to serialize PulseSequence "{0}" to file.'.format(sequence.name))
+            self.log.exception('Failed to save PulseSequence "{0}" to asset store.'
+                               ''.format(sequence.name))
         return
 
-    def _save_sequences_to_file(self):
+    def _save_sequences_to_store(self):
         """
-        Saves the saved_pulse_sequences dict items to files.
+        Saves the saved_pulse_sequences dict items to the asset store.
         """
         for sequence in self.saved_pulse_sequences.values():
-            self._save_sequence_to_file(sequence)
+            self._save_sequence_to_store(sequence)
+        return
+
+    def _migrate_pickled_assets(self):
+        """
+        One-shot migration of the PulseBlock, PulseBlockEnsemble and PulseSequence instances pickled
+        to separate files by older versions into the asset store.
+        The migrated files are moved into the subdirectory "pickled_assets" of the asset directory.
+        """
+        asset_types = (('block', self._load_pickled_block, self._save_block_to_store),
+                       ('ensemble', self._load_pickled_ensemble, self._save_ensemble_to_store),
+                       ('sequence', self._load_pickled_sequence, self._save_sequence_to_store))
+        with os.scandir(self._assets_storage_dir) as scan:
+            filenames = [f.name for f in scan if f.is_file() and
+                         f.name.endswith(('.block', '.ensemble', '.sequence'))]
+        if not filenames:
+            return
+
+        backup_dir = os.path.join(self._assets_storage_dir, 'pickled_assets')
+        if not os.path.exists(backup_dir):
+            os.makedirs(backup_dir)
+
+        migrated = 0
+        for asset_type, load_func, save_func in asset_types:
+            extension = '.' + asset_type
+            names = natural_sort(name[:-len(extension)] for name in filenames if
+                                 name.endswith(extension))
+            for name in names:
+                asset = load_func(name)
+                if asset is not None:
+                    save_func(asset)
+                    migrated += 1
+                filepath = os.path.join(self._assets_storage_dir, name + extension)
+                if os.path.exists(filepath):
+                    os.replace(filepath, os.path.join(backup_dir, name + extension))
+        self.log.info('Migrated {0:d} pickled pulse assets into the asset store "{1}".\n'
+                      'The pickle files have been moved to "{2}".'
+                      ''.format(migrated, self._asset_store.path, backup_dir))
         return
 
     def generate_predefined_sequence(self, predefined_sequence_name, kwargs_dict):
@@ -1287,6 +1414,17 @@ class SequenceGeneratorLogic(GenericLogic):
         laser_channel = self.generation_parameters['gate_channel'] if self.generation_parameters[
             'gate_channel'] else self.generation_parameters['laser_channel']
 
+        # Return the memoized result if the ensemble has already been analyzed with the same
+        # settings and none of its blocks has changed since then.
+        cache_key = ('ensemble',
+                     tuple((block_name, reps) for block_name, reps in ensemble),
+                     self.__sample_rate,
+                     laser_channel)
+        return_dict = self._analysis_cache.get(cache_key)
+        if return_dict is not None:
+            return_dict['generation_parameters'] = self.generation_parameters.copy()
+            return return_dict
+
         # memorize the digital channel state of the previous element
         tmp_digital_high = dict()
         # memorize the laser_on flag of the previous element (in case of non-digital laser channel)
@@ -1389,6 +1527,8 @@ class SequenceGeneratorLogic(GenericLogic):
         return_dict['ideal_length'] = current_end_time
         return_dict['laser_rising_bins'] = laser_rising_bins
         return_dict['laser_falling_bins'] = laser_falling_bins
+        self._analysis_cache.put(cache_key, return_dict,
+                                 blocks={block_name for block_name, reps in ensemble})
         return return_dict
 
     def analyze_sequence(self, sequence):
@@ -1436,6 +1576,18 @@ class SequenceGeneratorLogic(GenericLogic):
         laser_channel = self.generation_parameters['gate_channel'] if self.generation_parameters[
             'gate_channel'] else self.generation_parameters['laser_channel']
 
+        # Return the memoized result if the sequence has already been analyzed with the same
+        # settings and none of its ensembles and blocks has changed since then.
+        cache_key = ('sequence',
+                     sequence.name,
+                     tuple((seq_step.ensemble, seq_step.repetitions) for seq_step in sequence),
+                     self.__sample_rate,
+                     laser_channel)
+        return_dict = self._analysis_cache.get(cache_key)
+        if return_dict is not None:
+            return_dict['generation_parameters'] = self.generation_parameters.copy()
+            return return_dict
+
         # Determine channel activation and the channel states of the very first and last element
         digital_channels = set()
         analog_channels = set()
@@ -1606,6 +1758,13 @@ class SequenceGeneratorLogic(GenericLogic):
         return_dict['laser_rising_bins'] = laser_rising_bins
         return_dict['laser_falling_bins'] = laser_falling_bins
 
+        block_name_set = set()
+        for ensemble_name in ensemble_name_set:
+            block_name_set.update(
+                block_name for block_name, reps in self.get_ensemble(ensemble_name))
+        self._analysis_cache.put(cache_key, return_dict,
+                                 blocks=block_name_set,
+                                 ensembles=ensemble_name_set)
         return return_dict
 
     def _sampling_ensemble_sanity_check(self, ensemble):
@@ -1676,9 +1835,10 @@ class SequenceGeneratorLogic(GenericLogic):
 
         This method is creating the actual samples (voltages and logic states) for each time step
         of the analog and digital channels specified in the PulseBlockEnsemble.
-        Therefore it iterates through all blocks, repetitions and elements of the ensemble and
-        calculates the exact voltages (float64) according to the specified math_function. The
-        samples are later on stored inside a float32 array.
+        Therefore the ensemble is compiled into a sampling plan (see EnsembleSampler) which fills
+        digital channels and constant analog channels by run-length expansion and calculates the
+        exact voltages (float64) of all other elements according to the specified math_function.
+        The samples are later on stored inside a float32 array.
         So each element is calculated with high precision (float64) and then down-converted to
         float32 to be stored.
 
@@ -1719,12 +1879,246 @@ class SequenceGeneratorLogic(GenericLogic):
         # Set the waveform name (excluding the device specific channel naming suffix, i.e. '_ch1')
         waveform_name = name_tag if name_tag else ensemble.name
 
+        # Take current time
+        start_time = time.time()
+
+        # get important parameters from the ensemble and extend it to match the waveform
+        # length granularity of the device
+        ensemble_info = self._analyze_and_extend_ensemble(ensemble)
+
+        # Calculate the byte size per sample.
+        # One analog sample per channel is 4 bytes (np.float32) and one digital sample per channel
+        # is 1 byte (np.bool).
+        bytes_per_sample = len(ensemble_info['analog_channels']) * 4 + len(
+            ensemble_info['digital_channels'])
+
+        # Calculate the bytes estimate for the entire ensemble
+        bytes_per_ensemble = bytes_per_sample * ensemble_info['number_of_samples']
+
+        # Determine the size of the sample arrays to be written as a whole.
+        # If sampled in chunks, the overhead is shared by all chunk buffers of the pipeline.
+        if bytes_per_ensemble <= self._overhead_bytes or self._overhead_bytes == 0:
+            array_length = ensemble_info['number_of_samples']
+        else:
+            sampling_buffers = max(int(self._sampling_buffers), 1)
+            array_length = max(self._overhead_bytes // (bytes_per_sample * sampling_buffers), 1)
+
+        n_max_samples = self.pulsegenerator().get_constraints().waveform_length.max
+        if n_max_samples > 0. and ensemble_info['number_of_samples'] > n_max_samples:
+            self.log.error("Tried to write more samples ({:d}) than device supports ({:d}).".format(
+                ensemble_info['number_of_samples'],
+                n_max_samples))
+            if not self.__sequence_generation_in_progress:
+                self.module_state.unlock()
+            self.sigSampleEnsembleComplete.emit(None)
+            return -1, list(), dict()
+
+        # Hash everything the samples depend on. If the very same waveform has already been written
+        # to the device, sampling and upload can be skipped entirely.
+        waveform_hash = get_waveform_hash(ensemble=ensemble,
+                                          blocks=self._saved_pulse_blocks,
+                                          pulse_generator_settings=self.pulse_generator_settings,
+                                          offset_bin=offset_bin)
+        written_waveforms = self._get_written_waveforms(waveform_name, waveform_hash)
+        if written_waveforms:
+            self.log.info('PulseBlockEnsemble "{0}" is unchanged and already present on the device '
+                          'as "{1}". Skipping sampling and upload.'.format(ensemble.name,
+                                                                          waveform_name))
+            if ensemble.rotating_frame:
+                offset_bin += ensemble_info['number_of_samples']
+            return self._finish_ensemble_sampling(ensemble, waveform_name, ensemble_info,
+                                                  written_waveforms, offset_bin)
+
         # check for old waveforms associated with the ensemble and delete them from pulse generator.
         self._delete_waveform_by_nametag(waveform_name)
 
-        # Take current time
-        start_time = time.time()
+        # Digital-only ensembles are passed on as pulse patterns to devices supporting it. The dense
+        # sample arrays are not created at all in this case.
+        if self._use_pulse_pattern_upload(ensemble_info):
+            return self._write_pulse_patterns(ensemble, waveform_name, waveform_hash, ensemble_info,
+                                              offset_bin, start_time)
+
+        # Try to get the samples from the on-disk waveform cache
+        presampled_analog_samples, presampled_digital_samples = self._waveform_cache.load(waveform_hash)
+        is_presampled = presampled_analog_samples is not None
+        if is_presampled:
+            self.log.debug('Samples of PulseBlockEnsemble "{0}" loaded from waveform cache.'
+                           ''.format(ensemble.name))
+        # Or from the worker processes if the ensemble is sampled in parallel
+        parallel_key = None
+        if not is_presampled and self._parallel_sampler is not None and \
+                waveform_hash in self._parallel_sampler:
+            parallel_key = waveform_hash
+            try:
+                presampled_analog_samples, presampled_digital_samples = \
+                    self._parallel_sampler.get(parallel_key)
+                is_presampled = True
+            except Exception:
+                self.log.exception('Parallel sampling of PulseBlockEnsemble "{0}" failed. Sampling '
+                                   'it in the main process instead.'.format(ensemble.name))
+
+        t_est_upload = self._benchmark_write.estimate_time(ensemble_info['number_of_samples'])
+        if t_est_upload > self._info_on_estimated_upload_time:
+            now = datetime.datetime.now()
+            self.log.info("Estimated finish of writing for long waveform:"
+                          " {0:%Y-%m-%d %H:%M:%S} ({1:d} s)".format(
+                (now + datetime.timedelta(0, t_est_upload)), int(t_est_upload)))
 
+        if is_presampled:
+            # Pass on views into the memory-mapped samples
+            chunks = ((chunk_slice,
+                       {chnl: samples[chunk_slice]
+                        for chnl, samples in presampled_analog_samples.items()},
+                       {chnl: samples[chunk_slice]
+                        for chnl, samples in presampled_digital_samples.items()})
+                      for chunk_slice in ChunkPipeline.chunk_slices(
+                ensemble_info['number_of_samples'], array_length))
+        else:
+            # Compile the ensemble into a sampling plan. The plan fills the sample arrays chunk by
+            # chunk without iterating over every block repetition and element.
+            sampler = EnsembleSampler(ensemble=ensemble,
+                                      blocks=self._saved_pulse_blocks,
+                                      elements_length_bins=ensemble_info['elements_length_bins'],
+                                      sample_rate=self.__sample_rate,
+                                      analog_amplitudes=self.__analog_levels[0],
+                                      offset_bin=offset_bin)
+            # Create a new waveform cache entry to store the samples in (if the cache is enabled)
+            cache_analog_samples, cache_digital_samples = self._waveform_cache.create(
+                key=waveform_hash,
+                number_of_samples=ensemble_info['number_of_samples'],
+                analog_channels=ensemble_info['analog_channels'],
+                digital_channels=ensemble_info['digital_channels'])
+
+            def copy_to_cache(chunk_slice, chunk_analog_samples, chunk_digital_samples):
+                for chnl, samples in chunk_analog_samples.items():
+                    cache_analog_samples[chnl][chunk_slice] = samples
+                for chnl, samples in chunk_digital_samples.items():
+                    cache_digital_samples[chnl][chunk_slice] = samples
+
+            # Allocate the chunk buffers. The next chunk is sampled while the previous one is
+            # written to the device if more than one buffer is used.
+            try:
+                chunks = ChunkPipeline(
+                    sampler=sampler,
+                    analog_channels=ensemble_info['analog_channels'],
+                    digital_channels=ensemble_info['digital_channels'],
+                    chunk_length=array_length,
+                    buffers=self._sampling_buffers,
+                    chunk_callback=None if cache_analog_samples is None else copy_to_cache)
+            except MemoryError:
+                self.log.error('Sampling of PulseBlockEnsemble "{0}" failed due to a MemoryError.\n'
+                               'The sample array needed is too large to allocate in memory.\n'
+                               'Try using the overhead_bytes ConfigOption to limit memory usage.'
+                               ''.format(ensemble.name))
+                if cache_analog_samples is not None:
+                    del cache_analog_samples, cache_digital_samples
+                    self._waveform_cache.remove(waveform_hash)
+                if not self.__sequence_generation_in_progress:
+                    self.module_state.unlock()
+                self.sigSampleEnsembleComplete.emit(None)
+                return -1, list(), dict()
+
+        # Report the progress of long uploads every 10 %
+        report_progress = t_est_upload > self._info_on_estimated_upload_time
+        next_progress_report = 0.1
+        # sample arrays of the last chunk written
+        analog_samples = dict()
+        digital_samples = dict()
+        # set of written waveform names on the device
+        written_waveforms = set()
+        for chunk_slice, analog_samples, digital_samples in chunks:
+            array_length = chunk_slice.stop - chunk_slice.start
+
+            # Set first/last chunk flags and write to the device
+            is_first_chunk = chunk_slice.start == 0
+            is_last_chunk = chunk_slice.stop == ensemble_info['number_of_samples']
+            written_samples, wfm_list = self.pulsegenerator().write_waveform(
+                name=waveform_name,
+                analog_samples=analog_samples,
+                digital_samples=digital_samples,
+                is_first_chunk=is_first_chunk,
+                is_last_chunk=is_last_chunk,
+                total_number_of_samples=ensemble_info['number_of_samples'])
+
+            # Update written waveforms set
+            written_waveforms.update(wfm_list)
+
+            # check if write process was successful
+            if written_samples != array_length:
+                self.log.error('Sampling of ensemble "{0}" failed. Write to device was '
+                               'unsuccessful.\nThe number of actually written samples ({1:d}) '
+                               'does not match the number of samples staged to write ({2:d}).'
+                               ''.format(ensemble.name, written_samples, array_length))
+                chunks.close()
+                if not is_presampled and cache_analog_samples is not None:
+                    del cache_analog_samples, cache_digital_samples
+                    self._waveform_cache.remove(waveform_hash)
+                if parallel_key is not None:
+                    del chunks, analog_samples, digital_samples
+                    del presampled_analog_samples, presampled_digital_samples
+                    self._parallel_sampler.release(parallel_key)
+                if not self.__sequence_generation_in_progress:
+                    self.module_state.unlock()
+                self.sigAvailableWaveformsUpdated.emit(self.sampled_waveforms)
+                self.sigSampleEnsembleComplete.emit(None)
+                return -1, list(), dict()
+
+            progress = chunk_slice.stop / ensemble_info['number_of_samples']
+            if report_progress and progress >= next_progress_report:
+                self.log.info('Written {0:.0f}% of waveform "{1}" ({2:.2f} MSa/s)'.format(
+                    100 * progress, waveform_name,
+                    chunk_slice.stop / (time.time() - start_time) / 1e6))
+                next_progress_report = np.floor(progress * 10 + 1) / 10
+
+        if not is_presampled and chunks.is_pipelined:
+            self.log.debug('Pipelined sampling of PulseBlockEnsemble "{0}": {1:.3f} s sampling, '
+                           '{2:.3f} s waiting for samples.'.format(ensemble.name,
+                                                                   chunks.sampling_time,
+                                                                   chunks.wait_time))
+
+        if not is_presampled and cache_analog_samples is not None:
+            self._waveform_cache.commit(waveform_hash, cache_analog_samples, cache_digital_samples)
+        if parallel_key is not None:
+            # Drop all references to the memory-mapped samples before deleting them
+            del chunks, analog_samples, digital_samples
+            del presampled_analog_samples, presampled_digital_samples
+            self._parallel_sampler.release(parallel_key)
+
+        # if the rotating frame should be preserved (default) pass on the incremented offset
+        if ensemble.rotating_frame:
+            offset_bin += ensemble_info['number_of_samples']
+
+        # Remember the content of the written waveforms
+        self._written_waveform_hashes[waveform_name] = {'hash': waveform_hash,
+                                                        'waveforms': natural_sort(written_waveforms)}
+
+        self.log.info('Time needed for sampling and writing PulseBlockEnsemble {0} to device: {1} sec'
+                      ''.format(ensemble.name, int(np.rint(time.time() - start_time))))
+        self.log.debug('Estimated {:.3f} s from current estimated write speed {:.2f} MSa/s'
+                       ' from {} benchmarks'.format(
+            self._benchmark_write.estimate_time(ensemble_info['number_of_samples']),
+            self._benchmark_write.estimate_speed() / 1e6,
+            self._benchmark_write.n_benchmarks))
+
+        # Samples loaded from the waveform cache would distort the estimated sampling speed
+        if not is_presampled:
+            self._benchmark_write.add_benchmark(time.time() - start_time,
+                                                ensemble_info['number_of_samples'])
+
+        if ensemble_info['number_of_samples'] == 0:
+            self.log.warning('Empty waveform (0 samples) created from PulseBlockEnsemble "{0}".'
+                             ''.format(ensemble.name))
+        return self._finish_ensemble_sampling(ensemble, waveform_name, ensemble_info,
+                                              written_waveforms, offset_bin)
+
+    def _analyze_and_extend_ensemble(self, ensemble):
+        """ Analyzes a PulseBlockEnsemble and appends an idle block if its length is no multiple of
+        the waveform length step size of the pulse generator.
+
+        @param PulseBlockEnsemble ensemble: The ensemble to analyze (and extend)
+
+        @return dict: ensemble_info as returned by analyze_block_ensemble
+        """
         # get important parameters from the ensemble
         ensemble_info = self.analyze_block_ensemble(ensemble)
 
@@ -1766,160 +2160,72 @@ class SequenceGeneratorLogic(GenericLogic):
             else:
                 self.log.warn('Extending waveform {0} by {2} bins. New length {1}.'.format(
                     ensemble.name, ensemble_info['number_of_samples'], extension_samples))
+        return ensemble_info
 
-        # Calculate the byte size per sample.
-        # One analog sample per channel is 4 bytes (np.float32) and one digital sample per channel
-        # is 1 byte (np.bool).
-        bytes_per_sample = len(ensemble_info['analog_channels']) * 4 + len(
-            ensemble_info['digital_channels'])
+    def _use_pulse_pattern_upload(self, ensemble_info):
+        """ Checks if an ensemble can be written to the device as run-length encoded pulse patterns
+        (see PulserInterface.write_pulse_pattern).
 
-        # Calculate the bytes estimate for the entire ensemble
-        bytes_per_ensemble = bytes_per_sample * ensemble_info['number_of_samples']
+        @param dict ensemble_info: as returned by analyze_block_ensemble
 
-        # Determine the size of the sample arrays to be written as a whole.
-        if bytes_per_ensemble <= self._overhead_bytes or self._overhead_bytes == 0:
-            array_length = ensemble_info['number_of_samples']
-        else:
-            array_length = self._overhead_bytes // bytes_per_sample
+        @return bool: True if the ensemble uses digital channels only and the device supports it
+        """
+        if ensemble_info['analog_channels']:
+            return False
+        return bool(getattr(self.pulse_generator_constraints, 'pulse_pattern_upload', False))
 
-        n_max_samples = self.pulsegenerator().get_constraints().waveform_length.max
-        if n_max_samples > 0. and ensemble_info['number_of_samples'] > n_max_samples:
-            self.log.error("Tried to write more samples ({:d}) than device supports ({:d}).".format(
-                ensemble_info['number_of_samples'],
-                n_max_samples))
-            if not self.__sequence_generation_in_progress:
-                self.module_state.unlock()
-            self.sigSampleEnsembleComplete.emit(None)
-            return -1, list(), dict()
+    def _write_pulse_patterns(self, ensemble, waveform_name, waveform_hash, ensemble_info,
+                              offset_bin, start_time):
+        """ Writes a digital-only PulseBlockEnsemble to the device as run-length encoded pulse
+        patterns. The pulse patterns are derived from the element lengths in bins
+        (elements_length_bins) without sampling the ensemble.
 
-        # Allocate the sample arrays that are used for a single write command
-        analog_samples = dict()
-        digital_samples = dict()
-        try:
-            for chnl in ensemble_info['analog_channels']:
-                analog_samples[chnl] = np.empty(array_length, dtype='float32')
-            for chnl in ensemble_info['digital_channels']:
-                digital_samples[chnl] = np.empty(array_length, dtype=bool)
-        except MemoryError:
-            self.log.error('Sampling of PulseBlockEnsemble "{0}" failed due to a MemoryError.\n'
-                           'The sample array needed is too large to allocate in memory.\n'
-                           'Try using the overhead_bytes ConfigOption to limit memory usage.'
-                           ''.format(ensemble.name))
+        @return tuple: (offset_bin, created_waveforms, ensemble_info) as returned by
+                       sample_pulse_block_ensemble
+        """
+        sampler = EnsembleSampler(ensemble=ensemble,
+                                  blocks=self._saved_pulse_blocks,
+                                  elements_length_bins=ensemble_info['elements_length_bins'],
+                                  sample_rate=self.__sample_rate,
+                                  analog_amplitudes=self.__analog_levels[0],
+                                  offset_bin=offset_bin)
+        pulse_patterns = sampler.get_digital_runs(ensemble_info['digital_channels'])
+        written_samples, written_waveforms = self.pulsegenerator().write_pulse_pattern(
+            name=waveform_name,
+            pulse_patterns=pulse_patterns,
+            total_number_of_samples=ensemble_info['number_of_samples'])
+
+        if written_samples != ensemble_info['number_of_samples']:
+            self.log.error('Writing pulse patterns of ensemble "{0}" failed.\nThe number of '
+                           'actually written samples ({1:d}) does not match the number of samples '
+                           'of the ensemble ({2:d}).'.format(ensemble.name, written_samples,
+                                                             ensemble_info['number_of_samples']))
             if not self.__sequence_generation_in_progress:
                 self.module_state.unlock()
+            self.sigAvailableWaveformsUpdated.emit(self.sampled_waveforms)
             self.sigSampleEnsembleComplete.emit(None)
             return -1, list(), dict()
 
-        t_est_upload = self._benchmark_write.estimate_time(ensemble_info['number_of_samples'])
-        if t_est_upload > self._info_on_estimated_upload_time:
-            now = datetime.datetime.now()
-            self.log.info("Estimated finish of writing for long waveform:"
-                          " {0:%Y-%m-%d %H:%M:%S} ({1:d} s)".format(
-                (now + datetime.timedelta(0, t_est_upload)), int(t_est_upload)))
-
-        # integer to keep track of the sampls already processed
-        processed_samples = 0
-        # Index to keep track of the samples written into the preallocated samples array
-        array_write_index = 0
-        # Keep track of the number of elements already written
-        element_count = 0
-        # set of written waveform names on the device
-        written_waveforms = set()
-        # Iterate over all blocks within the PulseBlockEnsemble object
-        for block_name, reps in ensemble.block_list:
-            block = self.get_block(block_name)
-            # Iterate over all repetitions of the current block
-            for rep_no in range(reps + 1):
-                # Iterate over the PulseBlockElement instances inside the current block
-                for element in block.element_list:
-                    digital_high = element.digital_high
-                    pulse_function = element.pulse_function
-                    element_length_bins = ensemble_info['elements_length_bins'][element_count]
-
-                    # Indicator on how many samples of this element have been written already
-                    element_samples_written = 0
-
-                    while element_samples_written != element_length_bins:
-                        samples_to_add = min(array_length - array_write_index,
-                                             element_length_bins - element_samples_written)
-                        # create floating point time array for the current element inside rotating
-                        # frame if analog samples are to be calculated.
-                        if pulse_function:
-                            time_arr = (offset_bin + np.arange(
-                                samples_to_add, dtype='float64')) / self.__sample_rate
-
-                        # Calculate respective part of the sample arrays
-                        for chnl in digital_high:
-                            digital_samples[chnl][array_write_index:array_write_index + samples_to_add] = digital_high[
-                                chnl]
-                        for chnl in pulse_function:
-                            analog_samples[chnl][array_write_index:array_write_index + samples_to_add] = \
-                                pulse_function[chnl].get_samples(time_arr) / (self.__analog_levels[0][chnl] / 2)
-                            # Above is the old version, what is the purpose of diving by analog levels here?
-                            # Dividing completely breaks the output waveforms
-                            # analog_samples[chnl][array_write_index:array_write_index + samples_to_add] = \
-                            #     pulse_function[chnl].get_samples(time_arr)
-
-                        # Free memory
-                        if pulse_function:
-                            del time_arr
-
-                        element_samples_written += samples_to_add
-                        array_write_index += samples_to_add
-                        processed_samples += samples_to_add
-                        # if the rotating frame should be preserved (default) increment the offset
-                        # counter for the time array.
-                        if ensemble.rotating_frame:
-                            offset_bin += samples_to_add
-
-                        # Check if the temporary sample array is full and write to the device if so.
-                        if array_write_index == array_length:
-                            # Set first/last chunk flags
-                            is_first_chunk = array_write_index == processed_samples
-                            is_last_chunk = processed_samples == ensemble_info['number_of_samples']
-                            written_samples, wfm_list = self.pulsegenerator().write_waveform(
-                                name=waveform_name,
-                                analog_samples=analog_samples,
-                                digital_samples=digital_samples,
-                                is_first_chunk=is_first_chunk,
-                                is_last_chunk=is_last_chunk,
-                                total_number_of_samples=ensemble_info['number_of_samples'])
-
-                            # Update written waveforms set
-                            written_waveforms.update(wfm_list)
-
-                            # check if write process was successful
-                            if written_samples != array_length:
-                                self.log.error('Sampling of block "{0}" in ensemble "{1}" failed. '
-                                               'Write to device was unsuccessful.\nThe number of '
-                                               'actually written samples ({2:d}) does not match '
-                                               'the number of samples staged to write ({3:d}).'
-                                               ''.format(block_name, ensemble.name, written_samples,
-                                                         array_length))
-                                if not self.__sequence_generation_in_progress:
-                                    self.module_state.unlock()
-                                self.sigAvailableWaveformsUpdated.emit(self.sampled_waveforms)
-                                self.sigSampleEnsembleComplete.emit(None)
-                                return -1, list(), dict()
-
-                            # Reset array write start pointer
-                            array_write_index = 0
-
-                            # check if the temporary write array needs to be truncated for the next
-                            # part. (because it is the last part of the ensemble to write which can
-                            # be shorter than the previous chunks)
-                            if array_length > ensemble_info['number_of_samples'] - processed_samples:
-                                array_length = ensemble_info['number_of_samples'] - processed_samples
-                                analog_samples = dict()
-                                digital_samples = dict()
-                                for chnl in ensemble_info['analog_channels']:
-                                    analog_samples[chnl] = np.empty(array_length, dtype='float32')
-                                for chnl in ensemble_info['digital_channels']:
-                                    digital_samples[chnl] = np.empty(array_length, dtype=bool)
-
-                    # Increment element index
-                    element_count += 1
-
+        if ensemble.rotating_frame:
+            offset_bin += ensemble_info['number_of_samples']
+        self._written_waveform_hashes[waveform_name] = {'hash': waveform_hash,
+                                                        'waveforms': natural_sort(written_waveforms)}
+        self.log.debug('PulseBlockEnsemble "{0}" written to device as pulse patterns with {1:d} '
+                       'pulses in {2:.3f} s.'.format(ensemble.name,
+                                                     sum(lengths.size for lengths, states in
+                                                         pulse_patterns.values()),
+                                                     time.time() - start_time))
+        return self._finish_ensemble_sampling(ensemble, waveform_name, ensemble_info,
+                                              written_waveforms, offset_bin)
+
+    def _finish_ensemble_sampling(self, ensemble, waveform_name, ensemble_info, written_waveforms,
+                                  offset_bin):
+        """ Stores the sampling information in the ensemble, unlocks the module and emits the
+        update signals after a PulseBlockEnsemble has been written to the device.
+
+        @return tuple: (offset_bin, created_waveforms, ensemble_info) as returned by
+                       sample_pulse_block_ensemble
+        """
         # Save sampling related parameters to the sampling_information container within the
         # PulseBlockEnsemble.
         # This step is only performed if the resulting waveforms are named by the PulseBlockEnsemble
@@ -1931,25 +2237,30 @@ class SequenceGeneratorLogic(GenericLogic):
             ensemble.sampling_information['waveforms'] = natural_sort(written_waveforms)
             self.save_ensemble(ensemble)
 
-        self.log.info('Time needed for sampling and writing PulseBlockEnsemble {0} to device: {1} sec'
-                      ''.format(ensemble.name, int(np.rint(time.time() - start_time))))
-        self.log.debug('Estimated {:.3f} s from current estimated write speed {:.2f} MSa/s'
-                       ' from {} benchmarks'.format(
-            self._benchmark_write.estimate_time(ensemble_info['number_of_samples']),
-            self._benchmark_write.estimate_speed() / 1e6,
-            self._benchmark_write.n_benchmarks))
-
-        self._benchmark_write.add_benchmark(time.time() - start_time, ensemble_info['number_of_samples'])
-
-        if ensemble_info['number_of_samples'] == 0:
-            self.log.warning('Empty waveform (0 samples) created from PulseBlockEnsemble "{0}".'
-                             ''.format(ensemble.name))
         if not self.__sequence_generation_in_progress:
             self.module_state.unlock()
         self.sigAvailableWaveformsUpdated.emit(self.sampled_waveforms)
         self.sigSampleEnsembleComplete.emit(ensemble)
         return offset_bin, natural_sort(written_waveforms), ensemble_info
 
+    def _get_written_waveforms(self, waveform_name, waveform_hash):
+        """ Returns the names of the waveforms on the device that have been written by the very
+        same content (see waveform_cache.get_waveform_hash).
+
+        @param str waveform_name: The waveform name tag
+        @param str waveform_hash: The content hash of the waveform to write
+
+        @return list: waveform names on the device. Empty if the waveforms need to be written.
+        """
+        written = self._written_waveform_hashes.get(waveform_name)
+        if written is None or written['hash'] != waveform_hash or not written['waveforms']:
+            return list()
+        if not set(written['waveforms']).issubset(self.sampled_waveforms):
+            # waveforms have been removed from the device in the meantime
+            del self._written_waveform_hashes[waveform_name]
+            return list()
+        return list(written['waveforms'])
+
     @QtCore.Slot(str)
     def sample_pulse_sequence(self, sequence):
         """ Samples the PulseSequence object, which serves as the construction plan.
@@ -2020,51 +2331,63 @@ class SequenceGeneratorLogic(GenericLogic):
         # of the sampled Pulse_Block_Ensembles one has to introduce a running number as an
         # additional name tag, so keep the sampled files separate.
         offset_bin = 0  # that will be used for phase preservation
-        for step_index, seq_step in enumerate(sequence):
-            if sequence.rotating_frame:
-                # to make something like 001
-                name_tag = seq_step.ensemble + '_' + str(step_index).zfill(3)
-            else:
-                name_tag = seq_step.ensemble
-                offset_bin = 0  # Keep the offset at 0
-
-            # Only sample ensembles if they have not already been sampled
-            if sequence.rotating_frame or \
-                    not self.get_ensemble(name_tag).sampling_information or \
-                    self.get_ensemble(name_tag).sampling_information['pulse_generator_settings'] != self.pulse_generator_settings:
-
-                offset_bin, waveform_list, ensemble_info = self.sample_pulse_block_ensemble(
-                    ensemble=seq_step.ensemble,
-                    offset_bin=offset_bin,
-                    name_tag=name_tag)
-
-                if len(waveform_list) == 0:
-                    self.log.error('Sampling of PulseBlockEnsemble "{0}" failed during sampling of '
-                                   'PulseSequence "{1}".\nFailed to create waveforms on device.'
-                                   ''.format(seq_step.ensemble, sequence.name))
-                    self.module_state.unlock()
-                    self.__sequence_generation_in_progress = False
-                    self.sigSampleSequenceComplete.emit(None)
-                    return
 
-                # Add to generated ensembles
-                ensemble_info['waveforms'] = waveform_list
-                generated_ensembles[name_tag] = ensemble_info
+        # Without rotating frame the ensembles are independent of each other and can be sampled in
+        # worker processes. Otherwise the offset_bin needs to be passed on from one ensemble to the
+        # next and the ensembles are sampled one after another.
+        try:
+            if self._sampling_processes > 1 and not sequence.rotating_frame:
+                self._start_parallel_sampling(sequence)
 
-                # Add created waveform names to the set
-                written_waveforms.update(waveform_list)
-            else:
-                self.log.debug('Waveform already sampled: {0}'.format(name_tag))
-                ensemble_info = self.get_ensemble(name_tag).sampling_information.copy()
-                del(ensemble_info['pulse_generator_settings'])
-                generated_ensembles[name_tag] = ensemble_info
+            for step_index, seq_step in enumerate(sequence):
+                if sequence.rotating_frame:
+                    # to make something like 001
+                    name_tag = seq_step.ensemble + '_' + str(step_index).zfill(3)
+                else:
+                    name_tag = seq_step.ensemble
+                    offset_bin = 0  # Keep the offset at 0
+
+                # Only sample ensembles if they have not already been sampled
+                if sequence.rotating_frame or \
+                        not self.get_ensemble(name_tag).sampling_information or \
+                        self.get_ensemble(name_tag).sampling_information['pulse_generator_settings'] != self.pulse_generator_settings:
+
+                    offset_bin, waveform_list, ensemble_info = self.sample_pulse_block_ensemble(
+                        ensemble=seq_step.ensemble,
+                        offset_bin=offset_bin,
+                        name_tag=name_tag)
+
+                    if len(waveform_list) == 0:
+                        self.log.error('Sampling of PulseBlockEnsemble "{0}" failed during '
+                                       'sampling of PulseSequence "{1}".\nFailed to create '
+                                       'waveforms on device.'.format(seq_step.ensemble,
+                                                                      sequence.name))
+                        self.module_state.unlock()
+                        self.__sequence_generation_in_progress = False
+                        self.sigSampleSequenceComplete.emit(None)
+                        return
+
+                    # Add to generated ensembles
+                    ensemble_info['waveforms'] = waveform_list
+                    generated_ensembles[name_tag] = ensemble_info
+
+                    # Add created waveform names to the set
+                    written_waveforms.update(waveform_list)
+                else:
+                    self.log.debug('Waveform already sampled: {0}'.format(name_tag))
+                    ensemble_info = self.get_ensemble(name_tag).sampling_information.copy()
+                    del(ensemble_info['pulse_generator_settings'])
+                    generated_ensembles[name_tag] = ensemble_info
 
-                # Add created waveform names to the set
-                written_waveforms.update(ensemble_info['waveforms'])
+                    # Add created waveform names to the set
+                    written_waveforms.update(ensemble_info['waveforms'])
 
-            # Append written sequence step to sequence_param_dict_list
-            sequence_param_dict_list.append(
-                (tuple(generated_ensembles[name_tag]['waveforms']), seq_step))
+                # Append written sequence step to sequence_param_dict_list
+                sequence_param_dict_list.append(
+                    (tuple(generated_ensembles[name_tag]['waveforms']), seq_step))
+        finally:
+            # Stop the workers and free the shared memory also if sampling failed
+            self._stop_parallel_sampling()
 
         # pass the whole information to the sequence creation method:
         steps_written = self.pulsegenerator().write_sequence(sequence.name,
@@ -2095,6 +2418,61 @@ class SequenceGeneratorLogic(GenericLogic):
         self.sigSampleSequenceComplete.emit(sequence)
         return
 
+    def _start_parallel_sampling(self, sequence):
+        """ Starts sampling all ensembles of a PulseSequence (without rotating frame) that need to
+        be sampled in worker processes. The samples are picked up by sample_pulse_block_ensemble.
+
+        @param PulseSequence sequence: The sequence to sample
+        """
+        # Get the ensembles that will be sampled by sample_pulse_sequence
+        ensemble_names = list()
+        for seq_step in sequence:
+            ensemble = self.get_ensemble(seq_step.ensemble)
+            if seq_step.ensemble in ensemble_names or (
+                    ensemble.sampling_information and
+                    ensemble.sampling_information['pulse_generator_settings'] == self.pulse_generator_settings):
+                continue
+            ensemble_names.append(seq_step.ensemble)
+        if len(ensemble_names) < 2:
+            return
+
+        try:
+            self._parallel_sampler = ParallelEnsembleSampler(
+                processes=min(self._sampling_processes, len(ensemble_names)),
+                sampling_functions_paths=self._sampling_functions_paths,
+                max_bytes=self._overhead_bytes)
+        except OSError:
+            self.log.exception('Unable to start worker processes for parallel sampling. '
+                               'Sampling PulseSequence "{0}" sequentially.'.format(sequence.name))
+            self._parallel_sampler = None
+            return
+
+        for name in ensemble_names:
+            ensemble = self.get_ensemble(name)
+            ensemble_info = self._analyze_and_extend_ensemble(ensemble)
+            waveform_hash = get_waveform_hash(ensemble=ensemble,
+                                              blocks=self._saved_pulse_blocks,
+                                              pulse_generator_settings=self.pulse_generator_settings)
+            # Skip ensembles already on the device, in the waveform cache or not sampled at all
+            if self._get_written_waveforms(name, waveform_hash) or \
+                    waveform_hash in self._waveform_cache or \
+                    self._use_pulse_pattern_upload(ensemble_info):
+                continue
+            self._parallel_sampler.submit(key=waveform_hash,
+                                          ensemble=ensemble,
+                                          blocks=self._saved_pulse_blocks,
+                                          ensemble_info=ensemble_info,
+                                          sample_rate=self.__sample_rate,
+                                          analog_amplitudes=self.__analog_levels[0])
+        return
+
+    def _stop_parallel_sampling(self):
+        """ Terminates the worker processes started by _start_parallel_sampling. """
+        if self._parallel_sampler is not None:
+            self._parallel_sampler.close()
+            self._parallel_sampler = None
+        return
+
     def _delete_waveform(self, names):
         if isinstance(names, str):
             names = [names]
@@ -2111,6 +2489,7 @@ class SequenceGeneratorLogic(GenericLogic):
         wfm_to_delete = [wfm for wfm in self.sampled_waveforms if
                          wfm.rsplit('_', 1)[0] == nametag]
         self._delete_waveform(wfm_to_delete)
+        self._written_waveform_hashes.pop(nametag, None)
         # Erase sampling information if a PulseBlockEnsemble by the same name can be found in saved
         # ensembles
         if nametag in self.saved_pulse_block_ensembles:
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the Qudi helper classes to cache sampled waveforms on disk.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+
+def get_waveform_hash(ensemble, blocks, pulse_generator_settings, offset_bin=0):
+    """ Calculates a content hash of everything the samples of a PulseBlockEnsemble depend on.
+
+    @param PulseBlockEnsemble ensemble: The ensemble to hash
+    @param dict blocks: Dictionary containing all PulseBlock instances referenced by the ensemble
+    @param dict pulse_generator_settings: Pulse generator settings as returned by
+                                          SequenceGeneratorLogic.pulse_generator_settings
+    @param int offset_bin: Time bin offset of the first sample (rotating frame)
+
+    @return str: hexadecimal hash string
+    """
+    ensemble_dict = ensemble.get_dict_representation()
+    content = dict()
+    content['rotating_frame'] = ensemble_dict['rotating_frame']
+    content['block_list'] = [list(block_tuple) for block_tuple in ensemble_dict['block_list']]
+    content['blocks'] = {name: blocks[name].get_dict_representation()
+                         for name, reps in ensemble.block_list}
+    content['offset_bin'] = int(offset_bin)
+    content['sample_rate'] = pulse_generator_settings['sample_rate']
+    content['activation_config'] = pulse_generator_settings['activation_config']
+    content['analog_levels'] = pulse_generator_settings['analog_levels']
+    content_str = json.dumps(content, sort_keys=True, default=_json_default)
+    return hashlib.sha1(content_str.encode('utf-8')).hexdigest()
+
+
+def _json_default(obj):
+    """ Fallback for objects not serializable by json. Sets are sorted to get a stable hash. """
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    return repr(obj)
+
+
+class WaveformCache:
+    """
+    Content-addressed on-disk cache of sampled waveforms.
+
+    Each entry is a directory named by the waveform hash (see get_waveform_hash) containing one
+    .npy file per channel holding the samples of the entire waveform. An entry is only valid once
+    the marker file "complete" has been written to it (see commit). Entries are opened as
+    memory-mapped arrays, so chunks can be passed to the pulse generator without loading the whole
+    waveform into memory.
+    The total size of the cache is limited to max_bytes. If the limit is exceeded the least
+    recently used entries are removed.
+    """
+    _complete_marker = 'complete'
+
+    def __init__(self, path, max_bytes=0):
+        """
+        @param str path: Directory to store the cache entries in
+        @param int max_bytes: Maximum size of the cache on disk. 0 disables the cache.
+        """
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        if self.enabled and not os.path.exists(self.path):
+            os.makedirs(self.path)
+        return
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def __contains__(self, key):
+        return self.enabled and os.path.isfile(os.path.join(self.path, key, self._complete_marker))
+
+    def load(self, key):
+        """ Opens a cache entry as memory-mapped arrays.
+
+        @param str key: waveform hash
+
+        @return (dict, dict): analog and digital sample arrays (keys are channel descriptors) or
+                              (None, None) if no entry is present for key.
+        """
+        if key not in self:
+            return None, None
+        entry_path = os.path.join(self.path, key)
+        analog_samples = dict()
+        digital_samples = dict()
+        try:
+            for filename in os.listdir(entry_path):
+                if not filename.endswith('.npy'):
+                    continue
+                # Copy-on-write mode protects the cache from modifications of the samples
+                samples = np.load(os.path.join(entry_path, filename), mmap_mode='c')
+                if filename.startswith('a'):
+                    analog_samples[filename[:-4]] = samples
+                else:
+                    digital_samples[filename[:-4]] = samples
+            # Mark entry as recently used
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            self.remove(key)
+            return None, None
+        return analog_samples, digital_samples
+
+    def create(self, key, number_of_samples, analog_channels, digital_channels):
+        """ Creates a new cache entry with writable memory-mapped arrays.
+        The entry becomes available once it is committed with commit().
+
+        @param str key: waveform hash
+        @param int number_of_samples: length of the waveform in samples
+        @param iterable analog_channels: analog channel descriptors
+        @param iterable digital_channels: digital channel descriptors
+
+        @return (dict, dict): analog and digital memory-mapped arrays to write the samples into
+        """
+        if not self.enabled:
+            return None, None
+        bytes_needed = number_of_samples * (4 * len(analog_channels) + len(digital_channels))
+        if bytes_needed > self.max_bytes:
+            return None, None
+        self._free_space(bytes_needed)
+        entry_path = os.path.join(self.path, key)
+        self.remove(key)
+        os.makedirs(entry_path, exist_ok=True)
+        analog_samples = dict()
+        digital_samples = dict()
+        for chnl in analog_channels:
+            analog_samples[chnl] = np.lib.format.open_memmap(
+                os.path.join(entry_path, chnl + '.npy'), mode='w+', dtype='float32',
+                shape=(number_of_samples,))
+        for chnl in digital_channels:
+            digital_samples[chnl] = np.lib.format.open_memmap(
+                os.path.join(entry_path, chnl + '.npy'), mode='w+', dtype=bool,
+                shape=(number_of_samples,))
+        return analog_samples, digital_samples
+
+    def commit(self, key, analog_samples, digital_samples):
+        """ Flushes the memory-mapped arrays of a new entry and makes it available.
+
+        @param str key: waveform hash
+        @param dict analog_samples: memory-mapped arrays returned by create()
+        @param dict digital_samples: memory-mapped arrays returned by create()
+        """
+        for samples in list(analog_samples.values()) + list(digital_samples.values()):
+            samples.flush()
+        with open(os.path.join(self.path, key, self._complete_marker), 'w'):
+            pass
+        return
+
+    def remove(self, key):
+        """ Removes an entry (committed or not). """
+        shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+        return
+
+    def clear(self):
+        """ Removes all entries from the cache. """
+        if os.path.isdir(self.path):
+            for name in os.listdir(self.path):
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        return
+
+    def _free_space(self, bytes_needed):
+        """ Removes least recently used entries until bytes_needed fit into the cache. """
+        entries = list()
+        total_bytes = 0
+        for name in os.listdir(self.path):
+            entry_path = os.path.join(self.path, name)
+            if not os.path.isdir(entry_path):
+                continue
+            entry_bytes = sum(f.stat().st_size for f in os.scandir(entry_path) if f.is_file())
+            entries.append((os.stat(entry_path).st_mtime, name, entry_bytes))
+            total_bytes += entry_bytes
+        for mtime, name, entry_bytes in sorted(entries):
+            if total_bytes + bytes_needed <= self.max_bytes:
+                break
+            self.remove(name)
+            total_bytes -= entry_bytes
+        return
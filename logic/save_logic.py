@@ -39,6 +39,12 @@ from matplotlib.backends.backend_pdf import PdfPages
 from PIL import Image
 from PIL import PngImagePlugin
 
+# h5py is optional and only needed to save data as HDF5 file
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
 
 class DailyLogHandler(logging.FileHandler):
     """
@@ -258,7 +264,8 @@ class SaveLogic(GenericLogic):
         self._daily_loghandler.setLevel(level)
 
     def save_data(self, data, filepath=None, parameters=None, filename=None, filelabel=None,
-                  timestamp=None, filetype='text', fmt='%.15e', delimiter='\t', plotfig=None):
+                  timestamp=None, filetype='text', fmt='%.15e', delimiter='\t', plotfig=None,
+                  append=False):
         """
         General save routine for data.
 
@@ -304,7 +311,12 @@ class SaveLogic(GenericLogic):
                                    filename and a timestamp, because then the timestamp will be
                                    ignored.
         @param string filetype: optional, the file format the data should be saved in. Valid inputs
-                                are 'text', 'xml' and 'npz'. Default is 'text'.
+                                are 'text', 'npz' and 'hdf5'. Default is 'text'.
+                                'hdf5' stores every data array as compressed dataset and the
+                                parameters as attributes in a single .h5 file (needs the package
+                                h5py, falls back to 'npz' if it is not installed).
+                                The binary file types ('npz' and 'hdf5') also accept arrays with
+                                more than 2 dimensions and a mixture of 1D and 2D arrays.
         @param string or list of strings fmt: optional, format specifier for saved data. See python
                                               documentation for
                                               "Format Specification Mini-Language". If you want for
@@ -319,6 +331,10 @@ class SaveLogic(GenericLogic):
                                               behaviour or failure to save right away.
         @param string delimiter: optional, insert here the delimiter, like '\n' for new line, '\t'
                                  for tab, ',' for a comma ect.
+        @param bool append: optional, only for filetype 'hdf5'. Append the data arrays along their
+                            first axis to the datasets of an already existing file (e.g. to save
+                            a growing trace piece by piece). Pass the filename of the first call
+                            to append to the same file.
 
         1D data
         =======
@@ -354,6 +370,15 @@ class SaveLogic(GenericLogic):
         if timestamp is None:
             timestamp = datetime.datetime.now()
 
+        if filetype == 'hdf5' and h5py is None:
+            self.log.warning('Package "h5py" is not installed. Saving data as npz-file instead.')
+            filetype = 'npz'
+        binary_filetype = filetype in ('npz', 'hdf5')
+        if append and filetype != 'hdf5':
+            self.log.warning('Appending data is only supported for filetype "hdf5". Saving data '
+                             'to a new file instead.')
+            append = False
+
         # Try to cast data array into numpy.ndarray if it is not already one
         # Also collect information on arrays in the process and do sanity checks
         found_1d = False
@@ -374,7 +399,9 @@ class SaveLogic(GenericLogic):
                     return -1
 
             # determine dimensions
-            if data[keyname].ndim < 3:
+            if binary_filetype:
+                pass
+            elif data[keyname].ndim < 3:
                 length = data[keyname].shape[0]
                 arr_length.append(length)
                 if length > max_line_num:
@@ -398,7 +425,7 @@ class SaveLogic(GenericLogic):
             arr_dtype.append(data[keyname].dtype)
 
         # Raise error if data contains a mixture of 1D and 2D arrays
-        if found_2d and found_1d:
+        if found_2d and found_1d and not binary_filetype:
             self.log.error('Passed data dictionary contains 1D AND 2D arrays. This is not allowed. '
                            'Either fit all data arrays into a single 2D array or pass multiple 1D '
                            'arrays only. Saving data failed!')
@@ -518,6 +545,22 @@ class SaveLogic(GenericLogic):
             self.save_array_as_text(data=[], filename=filename[:-4]+'_params.dat', filepath=filepath,
                                     fmt=fmt, header=header, delimiter=delimiter, comments='#',
                                     append=False)
+        # write hdf5 file with the parameters as attributes
+        elif filetype == 'hdf5':
+            attributes = OrderedDict()
+            attributes['Saved Data from the class'] = module_name
+            attributes['timestamp'] = timestamp.isoformat()
+            if self.active_poi_name != '':
+                attributes['Measured at POI'] = self.active_poi_name
+            if isinstance(parameters, dict):
+                attributes.update(parameters)
+            elif parameters is not None:
+                attributes['not specified parameters'] = str(parameters)
+            self.save_array_as_hdf5(data=data,
+                                    filename=os.path.splitext(filename)[0] + '.h5',
+                                    filepath=filepath,
+                                    attributes=attributes,
+                                    append=append)
         else:
             self.log.error('Only saving of data as textfile and npz-file is implemented. Filetype "{0}" is not '
                            'supported yet. Saving as textfile.'.format(filetype))
@@ -528,63 +571,82 @@ class SaveLogic(GenericLogic):
         #--------------------------------------------------------------------------------------------
         # Save thumbnail figure of plot
         if plotfig is not None:
-            # create Metadata
-            metadata = dict()
-            metadata['Title'] = 'Image produced by qudi: ' + module_name
-            metadata['Author'] = 'qudi - Software Suite'
-            metadata['Subject'] = 'Find more information on: https://github.com/Ulm-IQO/qudi'
-            metadata['Keywords'] = 'Python 3, Qt, experiment control, automation, measurement, software, framework, modular'
-            metadata['Producer'] = 'qudi - Software Suite'
-            if timestamp is not None:
-                metadata['CreationDate'] = timestamp
-                metadata['ModDate'] = timestamp
-            else:
-                metadata['CreationDate'] = time
-                metadata['ModDate'] = time
-            
-            if self.save_pdf:
-                # determine the PDF-Filename
-                fig_fname_vector = os.path.join(filepath, filename)[:-4] + '_fig.pdf'
-
-                # Create the PdfPages object to which we will save the pages:
-                # The with statement makes sure that the PdfPages object is closed properly at
-                # the end of the block, even if an Exception occurs.
-                with PdfPages(fig_fname_vector) as pdf:
-                    pdf.savefig(plotfig, bbox_inches='tight', pad_inches=0.05)
-
-                    # We can also set the file's metadata via the PdfPages object:
-                    pdf_metadata = pdf.infodict()
-                    for x in metadata:
-                        pdf_metadata[x] = metadata[x]
-
-            if self.save_png:
-                # determine the PNG-Filename and save the plain PNG
-                fig_fname_image = os.path.join(filepath, filename)[:-4] + '_fig.png'
-                plotfig.savefig(fig_fname_image, bbox_inches='tight', pad_inches=0.05)
-
-                # Use Pillow (an fork for PIL) to attach metadata to the PNG
-                png_image = Image.open(fig_fname_image)
-                png_metadata = PngImagePlugin.PngInfo()
-
-                # PIL can only handle Strings, so let's convert our times
-                metadata['CreationDate'] = metadata['CreationDate'].strftime('%Y%m%d-%H%M-%S')
-                metadata['ModDate'] = metadata['ModDate'].strftime('%Y%m%d-%H%M-%S')
+            self.save_figure(plotfig, filepath=filepath, filename=filename, timestamp=timestamp,
+                             module_name=module_name)
+            self.log.debug('Time needed to save data: {0:.2f}s'.format(time.time()-start_time))
+            #----------------------------------------------------------------------------------
 
+    def save_figure(self, plotfig, filepath, filename, timestamp=None, module_name=None):
+        """ Saves a thumbnail figure of a data file as PDF and/or PNG (see config options save_pdf
+        and save_png) with the qudi metadata. The figure is closed afterwards.
+
+        @param matplotlib.figure.Figure plotfig: the figure to save
+        @param str filepath: directory of the data file
+        @param str filename: name of the data file (with a 3 letter extension). The figures are
+                             saved as <filename without extension>_fig.pdf/png.
+        @param datetime timestamp: optional, creation time of the figure. Defaults to now.
+        @param str module_name: optional, name of the module that created the figure
+        """
+        if timestamp is None:
+            timestamp = datetime.datetime.now()
+        if module_name is None:
+            try:
+                module_name = inspect.getmodule(inspect.stack()[1][0]).__name__.split('.')[-1]
+            except:
+                module_name = 'UNSPECIFIED'
+
+        # create Metadata
+        metadata = dict()
+        metadata['Title'] = 'Image produced by qudi: ' + module_name
+        metadata['Author'] = 'qudi - Software Suite'
+        metadata['Subject'] = 'Find more information on: https://github.com/Ulm-IQO/qudi'
+        metadata['Keywords'] = 'Python 3, Qt, experiment control, automation, measurement, software, framework, modular'
+        metadata['Producer'] = 'qudi - Software Suite'
+        metadata['CreationDate'] = timestamp
+        metadata['ModDate'] = timestamp
+
+        if self.save_pdf:
+            # determine the PDF-Filename
+            fig_fname_vector = os.path.join(filepath, filename)[:-4] + '_fig.pdf'
+
+            # Create the PdfPages object to which we will save the pages:
+            # The with statement makes sure that the PdfPages object is closed properly at
+            # the end of the block, even if an Exception occurs.
+            with PdfPages(fig_fname_vector) as pdf:
+                pdf.savefig(plotfig, bbox_inches='tight', pad_inches=0.05)
+
+                # We can also set the file's metadata via the PdfPages object:
+                pdf_metadata = pdf.infodict()
                 for x in metadata:
-                    # make sure every value of the metadata is a string
-                    if not isinstance(metadata[x], str):
-                        metadata[x] = str(metadata[x])
+                    pdf_metadata[x] = metadata[x]
 
-                    # add the metadata to the picture
-                    png_metadata.add_text(x, metadata[x])
+        if self.save_png:
+            # determine the PNG-Filename and save the plain PNG
+            fig_fname_image = os.path.join(filepath, filename)[:-4] + '_fig.png'
+            plotfig.savefig(fig_fname_image, bbox_inches='tight', pad_inches=0.05)
 
-                # save the picture again, this time including the metadata
-                png_image.save(fig_fname_image, "png", pnginfo=png_metadata)
+            # Use Pillow (an fork for PIL) to attach metadata to the PNG
+            png_image = Image.open(fig_fname_image)
+            png_metadata = PngImagePlugin.PngInfo()
 
-            # close matplotlib figure
-            plt.close(plotfig)
-            self.log.debug('Time needed to save data: {0:.2f}s'.format(time.time()-start_time))
-            #----------------------------------------------------------------------------------
+            # PIL can only handle Strings, so let's convert our times
+            metadata['CreationDate'] = metadata['CreationDate'].strftime('%Y%m%d-%H%M-%S')
+            metadata['ModDate'] = metadata['ModDate'].strftime('%Y%m%d-%H%M-%S')
+
+            for x in metadata:
+                # make sure every value of the metadata is a string
+                if not isinstance(metadata[x], str):
+                    metadata[x] = str(metadata[x])
+
+                # add the metadata to the picture
+                png_metadata.add_text(x, metadata[x])
+
+            # save the picture again, this time including the metadata
+            png_image.save(fig_fname_image, "png", pnginfo=png_metadata)
+
+        # close matplotlib figure
+        plt.close(plotfig)
+        return
 
     def save_array_as_text(self, data, filename, filepath='', fmt='%.15e', header='',
                            delimiter='\t', comments='#', append=False):
@@ -603,6 +665,114 @@ class SaveLogic(GenericLogic):
                            comments=comments)
         return
 
+    def save_array_as_hdf5(self, data, filename, filepath='', attributes=None, append=False,
+                           compression='gzip'):
+        """
+        An independent method, which saves a dictionary of numpy.ndarrays as datasets of a HDF5
+        file. The datasets are written in compressed chunks and can be extended along their first
+        axis. Can append to files.
+
+        @param dict data: the arrays to save. The keys are used as dataset names ("/" is replaced
+                          by "_", the original key is saved in the attribute "name" of the
+                          dataset).
+        @param str filename: name of the file
+        @param str filepath: optional, directory of the file
+        @param dict attributes: optional, saved as attributes of the file (e.g. the parameters)
+        @param bool append: optional, append the arrays to the datasets of an existing file
+        @param str compression: optional, compression filter of the datasets
+        """
+        if h5py is None:
+            self.log.error('Package "h5py" is not installed. Unable to save data as HDF5 file.')
+            return
+        with h5py.File(os.path.join(filepath, filename), 'a' if append else 'w') as file:
+            if attributes is not None:
+                for key, value in attributes.items():
+                    file.attrs[key] = self._to_hdf5_attribute(value)
+            for keyname, arr in data.items():
+                arr = np.atleast_1d(np.asarray(arr))
+                dtype = arr.dtype
+                if dtype.kind == 'U':
+                    dtype = h5py.special_dtype(vlen=str)
+                    arr = arr.astype(object)
+                dataset_name = keyname.replace('/', '_')
+                if dataset_name not in file:
+                    dataset = file.create_dataset(dataset_name,
+                                                  data=arr,
+                                                  dtype=dtype,
+                                                  chunks=True,
+                                                  maxshape=(None,) + arr.shape[1:],
+                                                  compression=compression)
+                    dataset.attrs['name'] = keyname
+                    continue
+                dataset = file[dataset_name]
+                if dataset.shape[1:] != arr.shape[1:]:
+                    self.log.error('Unable to append data "{0}" of shape {1} to dataset of shape '
+                                   '{2}.'.format(keyname, arr.shape, dataset.shape))
+                    continue
+                old_length = dataset.shape[0]
+                dataset.resize(old_length + arr.shape[0], axis=0)
+                dataset[old_length:] = arr
+        return
+
+    def load_data(self, filename, filepath=''):
+        """
+        Loads data saved by save_data with filetype 'hdf5' or 'npz'.
+
+        @param str filename: name of the file (.h5 or .npz)
+        @param str filepath: optional, directory of the file
+
+        @return (OrderedDict, OrderedDict): the data arrays and the parameters. The parameters of
+                                            npz-files are read from the header of the parameter
+                                            file as strings.
+        """
+        file_path = os.path.join(filepath, filename)
+        data = OrderedDict()
+        parameters = OrderedDict()
+        if file_path.endswith('.npz'):
+            with np.load(file_path) as npz_file:
+                for keyname in npz_file.files:
+                    data[keyname] = npz_file[keyname]
+            params_path = file_path[:-4] + '_params.dat'
+            if os.path.isfile(params_path):
+                with open(params_path, 'r') as file:
+                    for line in file:
+                        line = line.lstrip('#').strip()
+                        if line.startswith('Data:'):
+                            break
+                        if ': ' in line:
+                            key, value = line.split(': ', 1)
+                            parameters[key] = value
+        elif h5py is None:
+            self.log.error('Package "h5py" is not installed. Unable to load HDF5 file.')
+        else:
+            with h5py.File(file_path, 'r') as file:
+                for key, value in file.attrs.items():
+                    parameters[key] = value.decode() if isinstance(value, bytes) else value
+                for dataset in file.values():
+                    keyname = dataset.attrs.get('name', dataset.name.lstrip('/'))
+                    values = dataset[()]
+                    if h5py.check_dtype(vlen=dataset.dtype) is str:
+                        values = values.astype(str)
+                    data[keyname] = values
+        return data, parameters
+
+    @staticmethod
+    def _to_hdf5_attribute(value):
+        """
+        Converts a parameter into a type that can be saved as HDF5 attribute. Numbers, strings and
+        numeric arrays are kept, everything else is converted into its string representation.
+        """
+        if isinstance(value, (str, bool, int, float, complex, np.number, np.bool_)):
+            return value
+        if isinstance(value, (list, tuple, np.ndarray)):
+            try:
+                arr = np.asarray(value)
+            except ValueError:
+                return str(value)
+            if arr.dtype.kind in 'biufc' and arr.size > 0:
+                return arr
+        return str(value)
+
     def get_daily_directory(self):
         """ Gets or creates daily save directory.
 
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the Qudi helper classes to record a data stream to disk while it is acquired
+and to read the recordings back for analysis.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import json
+import time
+import threading
+import collections
+import numpy as np
+
+
+def _write_metadata(path, metadata):
+    """ Replaces the metadata file atomically, so it is never left half written """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(metadata, file, indent=4)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    return
+
+
+class StreamRecorder:
+    """
+    Records a data stream to a binary file in a background writer thread.
+
+    Blocks of samples (shape (number of channels, number of samples)) are copied on append and
+    written in the order of arrival. The data file holds the raw samples in sample-major order,
+    i.e. it can be read as array of shape (number of samples, number of channels). Its length
+    alone defines the number of recorded samples, the metadata (channels, data type, parameters)
+    is written to a JSON file next to it when the recording starts. Both files are flushed to disk
+    every flush_interval seconds, so a recording stays readable up to the last flush if qudi
+    crashes.
+
+    At most max_queue_bytes of samples are waiting to be written. If the disk can not keep up,
+    append blocks until enough samples have been written.
+    """
+
+    def __init__(self, path, channels, dtype, metadata=None, max_queue_bytes=2 ** 27,
+                 flush_interval=1.0):
+        """
+        @param str path: path of the data file. The metadata is written to <path>.json
+        @param list channels: channel names in the order of the rows of the appended blocks
+        @param dtype: numpy data type of the samples
+        @param dict metadata: additional JSON serializable metadata, e.g. the data rate
+        @param int max_queue_bytes: maximum size of the samples waiting to be written
+        @param float flush_interval: time in seconds between flushes to disk
+        """
+        self.path = path
+        self.metadata_path = path + '.json'
+        self.channels = list(channels)
+        self.dtype = np.dtype(dtype)
+        self.metadata = dict() if metadata is None else dict(metadata)
+        self.max_queue_bytes = int(max_queue_bytes)
+        self.flush_interval = float(flush_interval)
+        # Time in seconds append had to wait for the writer thread
+        self.stall_time = 0
+        self._number_of_samples = 0
+
+        self._queue = collections.deque()
+        self._queue_bytes = 0
+        self._condition = threading.Condition()
+        self._closing = False
+        self._error = None
+
+        self.metadata.update({'channels': self.channels,
+                              'dtype': self.dtype.str,
+                              'layout': 'sample-major'})
+        _write_metadata(self.metadata_path, self.metadata)
+        self._file = open(self.path, 'wb')
+        self._thread = threading.Thread(target=self._write_loop, name='StreamRecorder',
+                                        daemon=True)
+        self._thread.start()
+        return
+
+    @property
+    def number_of_samples(self):
+        """ Number of samples per channel appended so far """
+        return self._number_of_samples
+
+    @property
+    def is_running(self):
+        return self._thread.is_alive()
+
+    def append(self, data):
+        """ Queues a block of samples to be written. Errors of the writer thread are re-raised.
+
+        @param numpy.ndarray data: samples of shape (number of channels, number of samples)
+        """
+        if data.ndim != 2 or data.shape[0] != len(self.channels):
+            raise ValueError('Data block of shape {0} does not match the {1:d} recorded channels.'
+                             ''.format(data.shape, len(self.channels)))
+        # Copy, so the caller is free to reuse its buffer
+        block = np.array(data.transpose(), dtype=self.dtype, order='C')
+        with self._condition:
+            if self._closing:
+                raise RuntimeError('StreamRecorder has already been closed.')
+            start = time.perf_counter()
+            while self._queue and self._queue_bytes + block.nbytes > self.max_queue_bytes and \
+                    self._error is None:
+                self._condition.wait()
+            self.stall_time += time.perf_counter() - start
+            if self._error is not None:
+                raise self._error
+            self._queue.append(block)
+            self._queue_bytes += block.nbytes
+            self._number_of_samples += block.shape[0]
+            self._condition.notify_all()
+        return
+
+    def close(self, metadata=None):
+        """ Writes all queued samples, stops the writer thread and closes the file.
+        Errors of the writer thread are re-raised.
+
+        @param dict metadata: optional, metadata to add to the metadata file (e.g. stop time)
+        """
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        self._thread.join()
+        if metadata:
+            self.metadata.update(metadata)
+        self.metadata['number_of_samples'] = self._number_of_samples
+        _write_metadata(self.metadata_path, self.metadata)
+        if self._error is not None:
+            raise self._error
+        return
+
+    def _write_loop(self):
+        last_flush = time.monotonic()
+        try:
+            while True:
+                with self._condition:
+                    while not self._queue and not self._closing:
+                        timeout = self.flush_interval - (time.monotonic() - last_flush)
+                        if timeout <= 0:
+                            break
+                        self._condition.wait(timeout)
+                    block = self._queue[0] if self._queue else None
+                    if block is None and self._closing:
+                        break
+                if block is not None:
+                    block.tofile(self._file)
+                    with self._condition:
+                        self._queue.popleft()
+                        self._queue_bytes -= block.nbytes
+                        self._condition.notify_all()
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    self._flush()
+                    last_flush = time.monotonic()
+        except Exception as e:
+            with self._condition:
+                self._error = e
+                self._queue.clear()
+                self._queue_bytes = 0
+                self._condition.notify_all()
+        finally:
+            try:
+                self._flush()
+            finally:
+                self._file.close()
+        return
+
+    def _flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return
+
+
+class RecordedStream:
+    """
+    Reads a recording of StreamRecorder. The samples are memory mapped, so recordings larger than
+    the memory can be analyzed. Recordings of a crashed qudi instance are readable up to the last
+    complete sample.
+    """
+
+    def __init__(self, path):
+        """
+        @param str path: path of the data file (or of its metadata file)
+        """
+        if path.endswith('.json'):
+            path = path[:-5]
+        self.path = path
+        with open(path + '.json', 'r') as file:
+            self.metadata = json.load(file)
+        self.channels = list(self.metadata['channels'])
+        self.dtype = np.dtype(self.metadata['dtype'])
+        sample_bytes = self.dtype.itemsize * len(self.channels)
+        self.number_of_samples = os.path.getsize(path) // sample_bytes
+        if self.number_of_samples > 0:
+            self._samples = np.memmap(path, dtype=self.dtype, mode='r',
+                                      shape=(self.number_of_samples, len(self.channels)))
+        else:
+            self._samples = np.empty((0, len(self.channels)), dtype=self.dtype)
+        return
+
+    @property
+    def data(self):
+        """ Memory mapped samples of shape (number of channels, number of samples) """
+        return self._samples.transpose()
+
+    def read(self, start=0, stop=None, channels=None):
+        """ Reads a range of samples into memory.
+
+        @param int start: index of the first sample
+        @param int stop: optional, index after the last sample. Defaults to the end.
+        @param list channels: optional, channel names to read. Defaults to all channels.
+
+        @return numpy.ndarray: samples of shape (number of channels, number of samples)
+        """
+        samples = self._samples[start:stop]
+        if channels is not None:
+            samples = samples[:, [self.channels.index(ch) for ch in channels]]
+        return np.array(samples.transpose())
+
+    def iter_blocks(self, block_samples=2 ** 20, channels=None):
+        """ Iterates over the recording in blocks of samples.
+
+        @param int block_samples: number of samples per block
+        @param list channels: optional, channel names to read. Defaults to all channels.
+
+        @return generator: samples of shape (number of channels, <= block_samples)
+        """
+        for start in range(0, self.number_of_samples, block_samples):
+            yield self.read(start, start + block_samples, channels)
@@ -22,6 +22,7 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 from qtpy import QtCore
 import numpy as np
 import datetime as dt
+import os
 import time
 import matplotlib.pyplot as plt
 
@@ -31,6 +32,7 @@ from core.configoption import ConfigOption
 from logic.generic_logic import GenericLogic
 from core.util.mutex import Mutex
 from core.util.units import ScaledFloat
+from logic.stream_recorder import StreamRecorder, RecordedStream
 from interface.data_instream_interface import StreamChannelType, StreamingMode
 
 
@@ -44,6 +46,8 @@ class TimeSeriesReaderLogic(GenericLogic):
         module.Class: 'time_series_reader_logic.TimeSeriesReaderLogic'
         max_frame_rate: 10  # optional (10Hz by default)
         calc_digital_freq: True  # optional (True by default)
+        record_queue_bytes: 134217728  # optional, max. memory for samples waiting to be recorded
+        record_flush_interval: 1  # optional, seconds between flushes of the recording to disk
         connect:
             _streamer_con: <streamer_name>
             _savelogic_con: <save_logic_name>
@@ -61,6 +65,10 @@ class TimeSeriesReaderLogic(GenericLogic):
     # config options
     _max_frame_rate = ConfigOption('max_frame_rate', default=10, missing='warn')
     _calc_digital_freq = ConfigOption('calc_digital_freq', default=True, missing='warn')
+    # Recorded data is streamed to disk. Maximum size of the samples waiting to be written and
+    # interval between flushes to disk.
+    _record_queue_bytes = ConfigOption('record_queue_bytes', default=2 ** 27, missing='nothing')
+    _record_flush_interval = ConfigOption('record_flush_interval', default=1, missing='nothing')
 
     # status vars
     _trace_window_size = StatusVar('trace_window_size', default=6)
@@ -84,13 +92,14 @@ class TimeSeriesReaderLogic(GenericLogic):
         self._stop_requested = True
 
         # Data arrays
+        self._read_buffer = None
         self._trace_data = None
         self._trace_times = None
         self._trace_data_averaged = None
         self.__moving_filter = None
 
         # for data recording
-        self._recorded_data = None
+        self._recorder = None
         self._data_recording_active = False
         self._record_start_time = None
         return
@@ -167,9 +176,22 @@ class TimeSeriesReaderLogic(GenericLogic):
         self._trace_data_averaged = np.zeros(
             [len(self._averaged_channels), window_size - self._moving_average_width // 2])
         self._trace_times = np.arange(window_size) / self.data_rate
-        self._recorded_data = list()
+        # Buffer the samples are read into. Grows if more samples are available than fit.
+        self._read_buffer = np.empty(
+            self.number_of_active_channels * self._samples_per_frame * self.oversampling_factor * 4,
+            dtype=self._streamer.data_type)
         return
 
+    def _get_read_buffer(self, number_of_samples):
+        """ Returns a view of the read buffer of shape (channels, number_of_samples) """
+        size = self.number_of_active_channels * number_of_samples
+        if self._read_buffer is None or self._read_buffer.size < size:
+            old_size = 0 if self._read_buffer is None else self._read_buffer.size
+            self._read_buffer = np.empty(max(size, 2 * old_size),
+                                         dtype=self._streamer.data_type)
+        return self._read_buffer[:size].reshape((self.number_of_active_channels,
+                                                 number_of_samples))
+
     @property
     def trace_window_size_samples(self):
         return int(round(self._trace_window_size * self.data_rate))
@@ -505,8 +527,7 @@ class TimeSeriesReaderLogic(GenericLogic):
             # self.sigSettingsChanged.emit(settings)
 
             if self._data_recording_active:
-                self._record_start_time = dt.datetime.now()
-                self._recorded_data = list()
+                self._start_recorder()
 
             if self._streamer.start_stream() < 0:
                 self.log.error('Error while starting streaming device data acquisition.')
@@ -546,7 +567,6 @@ class TimeSeriesReaderLogic(GenericLogic):
                             'Error while trying to stop streaming device data acquisition.')
                     if self._data_recording_active:
                         self._save_recorded_data(to_file=True, save_figure=True)
-                        self._recorded_data = list()
                     self._data_recording_active = False
                     self.module_state.unlock()
                     self.sigStatusChanged.emit(False, False)
@@ -560,8 +580,10 @@ class TimeSeriesReaderLogic(GenericLogic):
                     return
 
                 # read the current counter values
-                data = self._streamer.read_data(number_of_samples=samples_to_read)
-                if data.shape[1] != samples_to_read:
+                data = self._get_read_buffer(samples_to_read)
+                read_samples = self._streamer.read_data_into_buffer(
+                    data, number_of_samples=samples_to_read)
+                if read_samples != samples_to_read:
                     self.log.error('Reading data from streamer went wrong; '
                                    'killing the stream with next data frame.')
                     self._stop_requested = True
@@ -599,7 +621,14 @@ class TimeSeriesReaderLogic(GenericLogic):
 
         # Append data to save if necessary
         if self._data_recording_active:
-            self._recorded_data.append(data.copy())
+            try:
+                self._recorder.append(data)
+            except Exception:
+                self.log.exception('Error while recording data to file "{0}". Recording '
+                                   'stopped.'.format(self._recorder.path))
+                self._save_recorded_data(to_file=True, save_figure=False)
+                self._data_recording_active = False
+                self.sigStatusChanged.emit(True, False)
 
         data = data[:, -self._trace_data.shape[1]:]
         new_samples = data.shape[1]
@@ -635,9 +664,8 @@ class TimeSeriesReaderLogic(GenericLogic):
 
             self._data_recording_active = True
             if self.module_state() == 'locked':
-                self._recorded_data = list()
-                self._record_start_time = dt.datetime.now()
-                self.sigStatusChanged.emit(True, True)
+                self._start_recorder()
+                self.sigStatusChanged.emit(True, self._data_recording_active)
             else:
                 self.start_reading()
         return 0
@@ -658,30 +686,60 @@ class TimeSeriesReaderLogic(GenericLogic):
             self._data_recording_active = False
             if self.module_state() == 'locked':
                 self._save_recorded_data(to_file=True, save_figure=True)
-                self._recorded_data = list()
                 self.sigStatusChanged.emit(True, False)
         return 0
 
+    def _start_recorder(self):
+        """ Starts streaming the recorded data to a new file in the module data directory.
+        The recording is written by a background thread, see logic.stream_recorder.StreamRecorder.
+        """
+        self._record_start_time = dt.datetime.now()
+        filepath = self._savelogic.get_path_for_module(module_name='TimeSeriesReader')
+        # Raw binary samples, not the text format of SaveLogic.save_data (see _save_recorded_data)
+        filename = self._record_start_time.strftime('%Y%m%d-%H%M-%S') + '_data_trace.bin'
+        metadata = {
+            'Start recoding time': self._record_start_time.strftime('%d.%m.%Y, %H:%M:%S.%f'),
+            'Data rate (Hz)': self.data_rate,
+            'Oversampling factor (samples)': self.oversampling_factor,
+            'Sampling rate (Hz)': self.sampling_rate,
+            'units': self.active_channel_units}
+        try:
+            self._recorder = StreamRecorder(path=os.path.join(filepath, filename),
+                                            channels=self.active_channel_names,
+                                            dtype=np.float64,
+                                            metadata=metadata,
+                                            max_queue_bytes=self._record_queue_bytes,
+                                            flush_interval=self._record_flush_interval)
+        except OSError:
+            self.log.exception('Unable to create file for data recording. Recording stopped.')
+            self._recorder = None
+            self._data_recording_active = False
+        return
+
     def _save_recorded_data(self, to_file=True, name_tag='', save_figure=True):
-        """ Save the counter trace data and writes it to a file.
+        """ Finishes the recording of the counter trace data.
 
-        @param bool to_file: indicate, whether data have to be saved to file
+        The data has been streamed to disk during the recording. The data file
+        (<timestamp>_data_trace.bin) contains the raw samples without header: float64 values in
+        native byte order, sample by sample with one value per active channel, i.e. it can be read
+        as array of shape (samples, channels). The channel names, data type and parameters are
+        stored in <data file>.json next to it. Use logic.stream_recorder.RecordedStream to load
+        recordings.
+
+        @param bool to_file: indicate, whether the figure should be saved to file
         @param str name_tag: an additional tag, which will be added to the filename upon save
         @param bool save_figure: select whether png and pdf should be saved
 
-        @return dict parameters: Dictionary which contains the saving parameters
+        @return numpy.ndarray, dict: memory mapped recorded data, parameters
         """
-        if not self._recorded_data:
-            self.log.error('No data has been recorded. Save to file failed.')
-            return np.empty(0), dict()
-
-        data_arr = np.concatenate(self._recorded_data, axis=1)
-        if data_arr.size == 0:
+        recorder = self._recorder
+        self._recorder = None
+        if recorder is None:
             self.log.error('No data has been recorded. Save to file failed.')
             return np.empty(0), dict()
 
         saving_stop_time = self._record_start_time + dt.timedelta(
-            seconds=data_arr.shape[1] / self.data_rate)
+            seconds=recorder.number_of_samples / self.data_rate)
 
         # write the parameters:
         parameters = dict()
@@ -692,18 +750,32 @@ class TimeSeriesReaderLogic(GenericLogic):
         parameters['Oversampling factor (samples)'] = self.oversampling_factor
         parameters['Sampling rate (Hz)'] = self.sampling_rate
 
-        if to_file:
-            # If there is a postfix then add separating underscore
-            filelabel = 'data_trace_{0}'.format(name_tag) if name_tag else 'data_trace'
-
-            # prepare the data in a dict:
-            header = ', '.join(
-                '{0} ({1})'.format(ch, unit) for ch, unit in self.active_channel_units.items())
+        try:
+            recorder.close(metadata=parameters)
+        except Exception:
+            self.log.exception('Error while writing recorded data to file "{0}". The recording '
+                               'may be incomplete.'.format(recorder.path))
+        if recorder.stall_time > 0.1:
+            self.log.warning('Data recording had to wait {0:.1f}s for the disk.'
+                             ''.format(recorder.stall_time))
+
+        path = recorder.path
+        if name_tag:
+            root, ext = os.path.splitext(path)
+            tagged_path = '{0}_{1}{2}'.format(root, name_tag, ext)
+            os.replace(path + '.json', tagged_path + '.json')
+            os.replace(path, tagged_path)
+            path = tagged_path
+
+        recording = RecordedStream(path)
+        if recording.number_of_samples == 0:
+            self.log.error('No data has been recorded. Save to file failed.')
+            return np.empty(0), dict()
+        data_arr = recording.data
 
-            data = {header: data_arr.transpose()}
-            filepath = self._savelogic.get_path_for_module(module_name='TimeSeriesReader')
+        if to_file and save_figure:
             set_of_units = set(self.active_channel_units.values())
-            unit_list = tuple(self.active_channel_units)
+            unit_list = tuple(self.active_channel_units.values())
             y_unit = 'arb.u.'
             occurrences = 0
             for unit in set_of_units:
@@ -711,17 +783,14 @@ class TimeSeriesReaderLogic(GenericLogic):
                 if count > occurrences:
                     occurrences = count
                     y_unit = unit
-
-            fig = self._draw_figure(data_arr, self.data_rate, y_unit) if save_figure else None
-
-            self._savelogic.save_data(data=data,
-                                      filepath=filepath,
-                                      parameters=parameters,
-                                      filelabel=filelabel,
-                                      plotfig=fig,
-                                      delimiter='\t',
-                                      timestamp=saving_stop_time)
-            self.log.info('Time series saved to: {0}'.format(filepath))
+            # Plot at most about 100000 samples per channel
+            step = max(1, data_arr.shape[1] // 100000)
+            fig = self._draw_figure(data_arr[:, ::step], self.data_rate / step, y_unit)
+            self._savelogic.save_figure(fig,
+                                        filepath=os.path.dirname(path),
+                                        filename=os.path.basename(path),
+                                        timestamp=saving_stop_time)
+        self.log.info('Time series saved to: {0}'.format(path))
         return data_arr, parameters
 
     def _draw_figure(self, data, timebase, y_unit):
@@ -807,7 +876,6 @@ class TimeSeriesReaderLogic(GenericLogic):
                     'Error while trying to stop streaming device data acquisition.')
             if self._data_recording_active:
                 self._save_recorded_data(to_file=True, save_figure=True)
-                self._recorded_data = list()
             self._data_recording_active = False
             self.module_state.unlock()
             self.sigStatusChanged.emit(False, False)
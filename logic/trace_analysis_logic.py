@@ -166,28 +166,20 @@ class TraceAnalysisLogic(GenericLogic):
 
         hist_data = self.calculate_histogram(trace=trace, num_bins=num_bins)
         threshold_fit, fidelity, fit_param = self.calculate_threshold(hist_data)
+        # True = dark state (below or equal threshold), False = bright state
         bin_trace = self.calculate_binary_trace(trace, threshold_fit)
 
-        # here the index_arr contain all indices where the state is above
-        # threshold, indicating the bright state.
-        index_arr, filtered_arr = self.extract_filtered_values(trace, threshold_fit, below=False)
+        # calculate how many dark and bright states are present in the array
+        num_dark_state = int(np.count_nonzero(bin_trace))
+        num_bright_state = len(trace) - num_dark_state
 
-        # by shifting the index_arr one value further, one will investigate
-        # basically the next state, where a change has happened.
-        next_index_arr = index_arr + 1
-
-        # Just for safety neglect the last value in the index_arr so that one
-        # will not go beyond the array.
-        next_filtered_bin_arr = bin_trace[next_index_arr[:-1]]
-
-        # calculate how many darkstates are present in the array, remember
-        # filtered_arr contains all the bright states.
-        num_dark_state = len(trace) - len(filtered_arr)
-        num_bright_state = len(filtered_arr)
+        # Compare every state with the next one. next_filtered_bin_arr contains the states following
+        # a bright state.
+        next_filtered_bin_arr = bin_trace[1:][~bin_trace[:-1]]
 
         # extract the number of state, which has been flipped to dark state
         # (True) started in the bright state (=False)
-        num_flip_to_dark = len(np.where(next_filtered_bin_arr == True)[0])
+        num_flip_to_dark = int(np.count_nonzero(next_filtered_bin_arr))
 
         # flip probability:
         # In the array filtered_bin_arr all states are in bright state meaning
@@ -232,36 +224,25 @@ class TraceAnalysisLogic(GenericLogic):
                       float lifetime_dark: the lifetime in the dark state in s
                       float lifetime_bright: lifetime in the bright state in s
         """
-        no_flip = 0.0
+        trace = np.asarray(trace)
+        is_high = trace > threshold
+        is_low = trace < threshold
 
         if analyze_mode == 'full':
-            for ii in range(len(trace) - 1):
-                if trace[ii] > threshold and trace[ii + 1] > threshold:
-                    no_flip = no_flip + 1
-
-                elif trace[ii] < threshold and trace[ii + 1] < threshold:
-                    no_flip = no_flip + 1
-
+            no_flip = np.count_nonzero(is_high[:-1] & is_high[1:]) + np.count_nonzero(
+                is_low[:-1] & is_low[1:])
             probability = 1.0 - (no_flip / len(trace))
             lost_events = 0.0
 
         if analyze_mode == 'dark':
-            dark_counter = 0.0
-            for ii in range(len(trace) - 1):
-                if trace[ii] < threshold:
-                    dark_counter = dark_counter + 1
-                    if trace[ii + 1] < threshold:
-                        no_flip = no_flip + 1
+            dark_counter = int(np.count_nonzero(is_low[:-1]))
+            no_flip = np.count_nonzero(is_low[:-1] & is_low[1:])
             probability = 1.0 - (no_flip / dark_counter)
             lost_events = (1.0 - (dark_counter / len(trace))) * 100
 
         if analyze_mode == 'bright':
-            bright_counter = 0.0
-            for ii in range(len(trace) - 1):
-                if trace[ii] > threshold:
-                    bright_counter = bright_counter + 1
-                    if trace[ii + 1] > threshold:
-                        no_flip = no_flip + 1
+            bright_counter = int(np.count_nonzero(is_high[:-1]))
+            no_flip = np.count_nonzero(is_high[:-1] & is_high[1:])
             probability = 1.0 - (no_flip / bright_counter)
             lost_events = (1.0 - (bright_counter / len(trace))) * 100
 
@@ -284,39 +265,13 @@ class TraceAnalysisLogic(GenericLogic):
         """
         init_threshold = init_threshold if init_threshold is not None else [1, 1]
         ana_threshold = ana_threshold if ana_threshold is not None else [1, 1]
-        no_flip = 0.0
-        flip = 0.0
-
-        # find all indices in the trace-array, where the value is above init_threshold[1]
-        init_high = np.where(trace[:-1] > init_threshold[1])[0]
-        # find all indices in the trace-array, where the value is below init_threshold[0]
-        init_low = np.where(trace[:-1] < init_threshold[0])[0]
-        # find all indices in the trace-array, where the value is above ana_threshold[1]
-        ana_high = np.where(trace > ana_threshold[1])[0]
-        # find all indices in the trace-array, where the value is below ana_threshold[0]
-        ana_low = np.where(trace < ana_threshold[0])[0]
 
-        if analyze_mode == 'bright' or analyze_mode == 'full':
-            # analyze the trace where the data were the nuclear was initalized into one direction
-            for index in init_high:
-                # check if the following data point is in the analysis array
-                if index + 1 in ana_high:
-                    no_flip = no_flip + 1
-                elif index + 1 in ana_low:
-                    flip = flip + 1
-
-        if analyze_mode == 'dark' or analyze_mode == 'full':
-            # repeat the same if the nucleus was initalized into the other array
-            for index in init_low:
-                # check if the following data point is in the analysis array
-                if index + 1 in ana_high:
-                    flip = flip + 1
-                elif index + 1 in ana_low:
-                    no_flip = no_flip + 1
+        flip, no_flip = self._count_flips(trace, init_threshold, ana_threshold, analyze_mode)
 
         # the flip probability is given by the number of flips divided by the total number of analyzed data points
         if (flip + no_flip) == 0:
             self.log.error('There is not enough data to anaylsis SSR!')
+            probability = np.nan
         else:
             probability = flip / (flip + no_flip)
         # the number of lost events is given by the length of the time_trace minus the number of analyzed data points
@@ -366,33 +321,7 @@ class TraceAnalysisLogic(GenericLogic):
             self.log.warning('Not enough data points yet!')
 
         # calculate the flip probability
-        no_flip = 0.0
-        flip = 0.0
-        # find all indices in the trace-array, where the value is above init_threshold[1]
-        init_high = np.where(trace[:-1] > init_threshold[1])[0]
-        # find all indices in the trace-array, where the value is below init_threshold[0]
-        init_low = np.where(trace[:-1] < init_threshold[0])[0]
-        # find all indices in the trace-array, where the value is above ana_threshold[1]
-        ana_high = np.where(trace > ana_threshold[1])[0]
-        # find all indices in the trace-array, where the value is below ana_threshold[0]
-        ana_low = np.where(trace < ana_threshold[0])[0]
-
-        if analyze_mode == 'bright' or analyze_mode == 'full':
-            # analyze the trace where the data were the nuclear was initalized into one direction
-            for index in init_high:
-                # check if the following data point is in the analysis array
-                if index + 1 in ana_high:
-                    no_flip = no_flip + 1
-                elif index + 1 in ana_low:
-                    flip = flip + 1
-        if analyze_mode == 'dark' or analyze_mode == 'full':
-            # repeat the same if the nucleus was initalized into the other array
-            for index in init_low:
-                # check if the following data point is in the analysis array
-                if index + 1 in ana_high:
-                    flip = flip + 1
-                elif index + 1 in ana_low:
-                    no_flip = no_flip + 1
+        flip, no_flip = self._count_flips(trace, init_threshold, ana_threshold, analyze_mode)
 
         # the flip probability is given by the number of flips divided by the total number of analyzed data points
         if (flip + no_flip) == 0:
@@ -411,6 +340,104 @@ class TraceAnalysisLogic(GenericLogic):
 
         return self.spin_flip_prob, lost_events, hist_fit_x, hist_fit_y, fit_result
 
+    @staticmethod
+    def _count_flips(trace, init_threshold, ana_threshold, analyze_mode='full'):
+        """ Counts the flips and non-flips between consecutive data points of a trace.
+        A data point initializes the state if it is above init_threshold[1] (bright) or below
+        init_threshold[0] (dark). The following data point is analyzed as bright if it is above
+        ana_threshold[1] or else as dark if it is below ana_threshold[0].
+
+        @param np.array trace: 1D trace of data
+        @param list init_threshold: [lower, upper] threshold for the initialization
+        @param list ana_threshold: [lower, upper] threshold for the analysis
+        @param str analyze_mode: 'full', 'bright' (only bright initialization) or 'dark'
+
+        @return tuple(int, int): number of flips, number of non-flips
+        """
+        trace = np.asarray(trace)
+        ana_high = trace[1:] > ana_threshold[1]
+        ana_low = (trace[1:] < ana_threshold[0]) & ~ana_high
+        flip = 0
+        no_flip = 0
+        if analyze_mode == 'bright' or analyze_mode == 'full':
+            init_high = trace[:-1] > init_threshold[1]
+            no_flip += np.count_nonzero(init_high & ana_high)
+            flip += np.count_nonzero(init_high & ana_low)
+        if analyze_mode == 'dark' or analyze_mode == 'full':
+            init_low = trace[:-1] < init_threshold[0]
+            flip += np.count_nonzero(init_low & ana_high)
+            no_flip += np.count_nonzero(init_low & ana_low)
+        return int(flip), int(no_flip)
+
+    def analyze_flip_prob_grid(self, trace, init_thresholds, ana_thresholds, analyze_mode='full'):
+        """ Calculates the flip probability (as in analyze_flip_prob3) for all combinations of the
+        given initialization and analysis thresholds in a single pass over the trace.
+
+        Every data point is assigned to an interval of the sorted threshold values. Since all
+        threshold conditions translate to ranges of these intervals, the number of flips and
+        non-flips of all threshold combinations are sums over rectangles of the 2D histogram of
+        consecutive data point pairs.
+
+        @param np.array trace: 1D trace of data
+        @param np.array init_thresholds: [lower, upper] initialization thresholds, shape (K, 2)
+        @param np.array ana_thresholds: [lower, upper] analysis thresholds, shape (M, 2)
+        @param str analyze_mode: 'full', 'bright' (only bright initialization) or 'dark'
+
+        @return tuple(probability, lost_events):
+                      np.array probability: flip probabilities of shape (K, M). NaN if no data
+                                            point pair could be analyzed.
+                      np.array lost_events: number of data points not analyzed of shape (K, M)
+        """
+        trace = np.asarray(trace)
+        init_thresholds = np.asarray(init_thresholds, dtype=float).reshape(-1, 2)
+        ana_thresholds = np.asarray(ana_thresholds, dtype=float).reshape(-1, 2)
+        thresholds = np.unique(np.concatenate((init_thresholds.ravel(), ana_thresholds.ravel())))
+
+        # Interval index of each data point. Even indices 2k are the open intervals between
+        # thresholds[k-1] and thresholds[k], odd indices 2k+1 data points equal to thresholds[k].
+        # value > thresholds[j]  <=>  index >= 2j + 2
+        # value < thresholds[j]  <=>  index <= 2j
+        interval = np.searchsorted(thresholds, trace, side='left') + np.searchsorted(
+            thresholds, trace, side='right')
+        n_intervals = 2 * thresholds.size + 1
+
+        # Histogram of consecutive pairs and its 2D cumulative sum (with leading zero row/column)
+        pair_hist = np.bincount(interval[:-1] * n_intervals + interval[1:],
+                                minlength=n_intervals ** 2).reshape(n_intervals, n_intervals)
+        cum_hist = np.zeros((n_intervals + 1, n_intervals + 1), dtype='int64')
+        cum_hist[1:, 1:] = pair_hist.cumsum(axis=0).cumsum(axis=1)
+
+        def count(first_start, first_stop, second_start, second_stop):
+            """ number of pairs with first index in [first_start, first_stop) and second index in
+            [second_start, second_stop). Arguments are broadcast against each other. """
+            first_stop = np.maximum(first_stop, first_start)
+            second_stop = np.maximum(second_stop, second_start)
+            return (cum_hist[first_stop, second_stop] - cum_hist[first_start, second_stop]
+                    - cum_hist[first_stop, second_start] + cum_hist[first_start, second_start])
+
+        index = lambda values: np.searchsorted(thresholds, values)
+        init_low = 2 * index(init_thresholds[:, 0])[:, np.newaxis]
+        init_high = 2 * index(init_thresholds[:, 1])[:, np.newaxis]
+        ana_low = 2 * index(ana_thresholds[:, 0])[np.newaxis, :]
+        ana_high = 2 * index(ana_thresholds[:, 1])[np.newaxis, :]
+        # Analyzed as dark if below the lower and not above the upper analysis threshold
+        ana_dark_stop = np.minimum(ana_low, ana_high + 1) + 1
+
+        flip = np.zeros((init_thresholds.shape[0], ana_thresholds.shape[0]), dtype='int64')
+        no_flip = np.zeros_like(flip)
+        if analyze_mode == 'bright' or analyze_mode == 'full':
+            no_flip += count(init_high + 2, n_intervals, ana_high + 2, n_intervals)
+            flip += count(init_high + 2, n_intervals, 0, ana_dark_stop)
+        if analyze_mode == 'dark' or analyze_mode == 'full':
+            flip += count(0, init_low + 1, ana_high + 2, n_intervals)
+            no_flip += count(0, init_low + 1, 0, ana_dark_stop)
+
+        analyzed = flip + no_flip
+        with np.errstate(invalid='ignore', divide='ignore'):
+            probability = np.where(analyzed > 0, flip / analyzed, np.nan)
+        lost_events = len(trace) - analyzed
+        return probability, lost_events
+
     def analyze_flip_prob_postselect(self):
         """ Post select the data trace so that the flip probability is only
             calculated from a jump from below a threshold value to an value
@@ -506,50 +533,9 @@ class TraceAnalysisLogic(GenericLogic):
                                                                                distr='gaussian_normalized')
                 threshold = threshold_fit
 
-            # helper functions to get and analyze the timetrace
-            def analog_digitial_converter(cut_off, data):
-                new_digital_trace = []
-                for data_point in data:
-                    if data_point >= cut_off:
-                        new_digital_trace.append(1)
-                    else:
-                        new_digital_trace.append(0)
-                return new_digital_trace
-
-            def time_in_high_low(raw_digital_trace, local_dt):
-                """
-                What I need this function to do is to get all consecutive {1, ... , n} 1s or 0s and add
-                them up and put into a list to later make a histogram from them.
-                """
-                occurances = []
-                index = 0
-                index2 = 0
-
-                while index < len(raw_digital_trace):
-                    occurances.append(0)
-                    # start following the consecutive 1s
-                    while raw_digital_trace[index] == 1:
-                        occurances[index2] += 1
-                        if index == (len(raw_digital_trace) - 1):
-                            occurances = np.array(occurances)
-                            return occurances * local_dt
-                        else:
-                            index += 1
-                    if raw_digital_trace[index - 1] == 1:
-                        index2 += 1
-                        occurances.append(0)
-                    # start following the consecutive 0s
-                    while raw_digital_trace[index] == 0:
-                        occurances[index2] -= 1
-                        if index == (len(raw_digital_trace) - 1):
-                            occurances = np.array(occurances)
-                            return occurances * local_dt
-                        else:
-                            index += 1
-                    index2 += 1
-
-            digital_trace = analog_digitial_converter(threshold, trace)
-            time_array = time_in_high_low(digital_trace, dt)
+            # Durations of all consecutive runs of data points above/equal (positive) and below
+            # (negative) the threshold
+            time_array = self.calculate_state_durations(trace, threshold, dt)
 
             # now we need to make a histogram as well as a fit
             # what would be a good estimate for the number of bins
@@ -558,15 +544,12 @@ class TraceAnalysisLogic(GenericLogic):
             # number of steps in between, rather not use that for now
             # est_bins = np.int(longest/dt)
 
-            time_array_high = np.array([ii for ii in filter(lambda x: x > 0, time_array)])
-            time_array_low = np.array([ii for ii in filter(lambda x: x < 0, time_array)])
+            time_array_high = time_array[time_array > 0]
+            time_array_low = time_array[time_array < 0]
 
             # get lifetime of bright state
             time_hist_high = np.histogram(time_array_high, bins=num_bins)
-            vals = [i for i in filter(lambda x: x[1] > 0, enumerate(time_hist_high[0][0:num_bins]))]
-
-            indices = np.array([val[0] for val in vals])
-            indices = np.array([np.int(indice) for indice in indices])
+            indices = np.flatnonzero(time_hist_high[0][0:num_bins] > 0)
             self.log.debug('threshold {0}'.format(threshold))
             self.log.debug('time_array:{0}'.format(time_array))
             self.log.debug('time_array_high:{0}'.format(time_array_high))
@@ -588,10 +571,8 @@ class TraceAnalysisLogic(GenericLogic):
 
             # get lifetime of dark state
             time_hist_low = np.histogram(time_array_low, bins=num_bins)
-            vals = [i for i in filter(lambda x: x[1] > 0, enumerate(time_hist_low[0][0:num_bins]))]
-            indices = np.array([val[0] for val in vals])
-            indices = np.array([np.int(indice) for indice in indices])
-            values = np.array([val[1] for val in vals])
+            indices = np.flatnonzero(time_hist_low[0][0:num_bins] > 0)
+            values = time_hist_low[0][indices]
             # positive axis
             mirror_axis = -time_hist_low[1][indices]
             result = self._fit_logic.make_decayexponential_fit(mirror_axis,
@@ -1057,6 +1038,25 @@ class TraceAnalysisLogic(GenericLogic):
         """
         return trace <= threshold
 
+    def calculate_state_durations(self, trace, threshold, dt):
+        """ Calculates the durations of all consecutive runs of data points above/equal and below
+            a certain threshold.
+        @param np.array trace: 1D trace of data
+        @param float threshold: data points above or equal are in the high state, all others in
+                                the low state
+        @param float dt: time between two data points
+        @return np.array: durations of the runs in chronological order. Runs in the high state are
+                          positive and runs in the low state negative.
+        """
+        digital_trace = np.asarray(trace) >= threshold
+        if digital_trace.size == 0:
+            return np.empty(0)
+        # indices where a new run starts
+        run_starts = np.concatenate(
+            ([0], np.flatnonzero(digital_trace[1:] != digital_trace[:-1]) + 1))
+        run_lengths = np.diff(np.append(run_starts, digital_trace.size))
+        return np.where(digital_trace[run_starts], run_lengths, -run_lengths) * dt
+
     def extract_filtered_values(self, trace, threshold, below=True):
         """ Extract only those values, which are below or equal a certain Threshold.
         @param np.array trace:
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the batch fitting of stacks of traces (FitLogic.batch_fit).
+
+Compares fitting each trace with the make_*_fit methods of FitLogic against FitLogic.batch_fit
+with one and with several worker processes. The traces are synthetic ODMR spectra (lorentzian
+dips), Rabi oscillations (sine) and exponential decays with random parameters and noise.
+This script is standalone and does not need a running qudi instance.
+
+Usage (from the qudi main directory):
+    python tools/benchmark_batch_fit.py [number of traces]
+    e.g. python tools/benchmark_batch_fit.py 100 1000
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+path_of_qudi = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if path_of_qudi not in sys.path:
+    sys.path.insert(0, path_of_qudi)
+
+from qtpy import QtCore
+from logic.fit_logic import FitLogic
+
+
+class BenchmarkManager:
+    """ Minimal stand-in for the qudi manager needed by FitLogic """
+    tm = None
+
+
+def synthetic_traces(fit_function, number_of_traces, seed=0):
+    """ Random traces and x-axis for a fit function """
+    rng = np.random.RandomState(seed)
+    if fit_function == 'lorentzian':
+        x_axis = np.linspace(2.8e9, 2.94e9, 101)
+        center = rng.uniform(2.85e9, 2.89e9, (number_of_traces, 1))
+        sigma = rng.uniform(3e6, 8e6, (number_of_traces, 1))
+        data = 5e4 * (1 - 0.2 * sigma ** 2 / ((x_axis - center) ** 2 + sigma ** 2))
+        return x_axis, data + rng.normal(0, 300, data.shape)
+    x_axis = np.linspace(0, 2e-6, 100)
+    if fit_function == 'sine':
+        frequency = rng.uniform(1e6, 5e6, (number_of_traces, 1))
+        phase = rng.uniform(-3, 3, (number_of_traces, 1))
+        data = 0.3 * np.sin(2 * np.pi * frequency * x_axis + phase) + 1
+        return x_axis, data + rng.normal(0, 0.03, data.shape)
+    lifetime = rng.uniform(1e-7, 1e-6, (number_of_traces, 1))
+    data = np.exp(-x_axis / lifetime) + 1
+    return x_axis, data + rng.normal(0, 0.02, data.shape)
+
+
+def run_benchmark(sizes, processes=None):
+    app = QtCore.QCoreApplication.instance()
+    if app is None:
+        app = QtCore.QCoreApplication(sys.argv)
+    fit_logic = FitLogic(manager=BenchmarkManager(), name='fitlogic', config=dict())
+    if processes is None:
+        processes = os.cpu_count()
+
+    print('{0:>18s} {1:>8s} {2:>12s} {3:>12s} {4:>14s} {5:>8s} {6:>10s}'.format(
+        'fit', 'traces', 'single [s]', 'batch [s]', 'batch x{0:d} [s]'.format(processes),
+        'speedup', 'max dev'))
+    for fit_function, estimator in (('lorentzian', 'dip'), ('sine', 'generic'),
+                                    ('decayexponential', 'generic')):
+        for number_of_traces in sizes:
+            x_axis, data = synthetic_traces(fit_function, number_of_traces)
+            fit_method = fit_logic.fit_list['1d'][fit_function]['make_fit']
+            estimator_method = fit_logic.fit_list['1d'][fit_function][estimator]
+
+            start = time.perf_counter()
+            reference = [fit_method(x_axis, trace, estimator_method) for trace in data]
+            t_single = time.perf_counter() - start
+
+            start = time.perf_counter()
+            fit_logic.batch_fit(x_axis, data, fit_function, estimator, processes=1)
+            t_batch = time.perf_counter() - start
+
+            start = time.perf_counter()
+            result = fit_logic.batch_fit(x_axis, data, fit_function, estimator,
+                                         processes=processes)
+            t_parallel = time.perf_counter() - start
+
+            # Largest relative deviation of the best values from the single fits
+            deviation = 0
+            for name, values in result['best_values'].items():
+                reference_values = np.array([res.params[name].value for res in reference])
+                deviation = max(deviation, np.nanmax(
+                    np.abs(values - reference_values) / np.abs(reference_values)))
+            print('{0:>18s} {1:>8d} {2:>12.3f} {3:>12.3f} {4:>14.3f} {5:>8.1f} {6:>10.1e}'.format(
+                fit_function, number_of_traces, t_single, t_batch, t_parallel,
+                t_single / t_parallel, deviation))
+    return
+
+
+if __name__ == '__main__':
+    trace_numbers = [int(arg) for arg in sys.argv[1:]] if len(sys.argv) > 1 else [100, 1000]
+    run_benchmark(trace_numbers)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the PulseBlockEnsemble sampling used in SequenceGeneratorLogic.
+
+Compares the compiled sampling plan (logic.pulsed.ensemble_sampler.EnsembleSampler) against the
+previous implementation iterating over every block repetition and PulseBlockElement in python.
+The ensembles are created with the generate methods in
+logic/pulsed/predefined_generate_methods/basic_predefined_methods.py.
+This script is standalone and does not need a running qudi instance.
+
+Usage (from the qudi main directory):
+    python tools/benchmark_ensemble_sampling.py
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import sys
+import time
+import logging
+import numpy as np
+
+path_of_qudi = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if path_of_qudi not in sys.path:
+    sys.path.insert(0, path_of_qudi)
+
+from logic.pulsed.pulse_objects import PulseObjectGenerator
+from logic.pulsed.sampling_functions import SamplingFunctions
+from logic.pulsed.ensemble_sampler import EnsembleSampler
+
+# generate methods and keyword arguments to benchmark
+BENCHMARK_METHODS = [
+    ('rabi', {'num_of_points': 100}),
+    ('pulsedodmr', {'num_of_points': 100}),
+    ('ramsey', {'num_of_points': 50}),
+    ('hahnecho', {'num_of_points': 50}),
+    ('t1', {'num_of_points': 50}),
+    ('xy8_tau', {'num_of_points': 20, 'xy8_order': 16}),
+    ('xy8_freq', {'num_of_points': 20, 'xy8_order': 16}),
+    ('chirpedodmr', {}),
+]
+
+
+class BenchmarkSequenceGenerator:
+    """
+    Minimal stand-in for SequenceGeneratorLogic providing everything the predefined generate
+    methods need.
+    """
+    def __init__(self, sample_rate=1.25e9):
+        self.log = logging.getLogger('benchmark')
+        self.predefined_methods_import_path = [
+            os.path.join(path_of_qudi, 'logic', 'pulsed', 'predefined_generate_methods')]
+        self.generation_parameters = {'laser_channel': 'd_ch1',
+                                      'sync_channel': 'd_ch2',
+                                      'gate_channel': '',
+                                      'microwave_channel': 'a_ch1',
+                                      'microwave_frequency': 2.87e9,
+                                      'microwave_amplitude': 0.25,
+                                      'rabi_period': 100e-9,
+                                      'laser_length': 3e-6,
+                                      'laser_delay': 500e-9,
+                                      'wait_time': 1e-6,
+                                      'analog_trigger_voltage': 0.0,
+                                      'i_channel': 'a_ch1',
+                                      'q_channel': 'a_ch2',
+                                      'iq_amplitude': 0.0}
+        channels = {'a_ch1', 'a_ch2', 'd_ch1', 'd_ch2', 'd_ch3'}
+        self.pulse_generator_settings = {
+            'activation_config': ('benchmark', channels),
+            'sample_rate': sample_rate,
+            'analog_levels': ({'a_ch1': 1.0, 'a_ch2': 1.0}, {'a_ch1': 0.0, 'a_ch2': 0.0})}
+        self.pulse_generator_constraints = None
+        self.blocks = dict()
+
+    def save_block(self, block):
+        self.blocks[block.name] = block
+
+    def save_ensemble(self, ensemble):
+        pass
+
+    def save_sequence(self, sequence):
+        pass
+
+    def analyze_block_ensemble(self, ensemble):
+        return {'elements_length_bins': get_elements_length_bins(
+            ensemble, self.blocks, self.pulse_generator_settings['sample_rate'])}
+
+    def analyze_sequence(self, sequence):
+        return dict()
+
+
+def get_elements_length_bins(ensemble, blocks, sample_rate):
+    """ Element discretization as done in SequenceGeneratorLogic.analyze_block_ensemble """
+    elements_length_bins = list()
+    current_end_time = 0.0
+    current_start_bin = 0
+    for block_name, reps in ensemble.block_list:
+        for rep_no in range(reps + 1):
+            for element in blocks[block_name].element_list:
+                current_end_time += element.init_length_s + rep_no * element.increment_s
+                current_end_bin = int(np.rint(current_end_time * sample_rate))
+                elements_length_bins.append(current_end_bin - current_start_bin)
+                current_start_bin = current_end_bin
+    return np.array(elements_length_bins, dtype='int64')
+
+
+def sample_reference(ensemble, blocks, elements_length_bins, sample_rate, analog_amplitudes,
+                     analog_samples, digital_samples, offset_bin=0):
+    """ Previous sampling loop of SequenceGeneratorLogic.sample_pulse_block_ensemble (single chunk)
+    """
+    array_write_index = 0
+    element_count = 0
+    for block_name, reps in ensemble.block_list:
+        block = blocks[block_name]
+        for rep_no in range(reps + 1):
+            for element in block.element_list:
+                digital_high = element.digital_high
+                pulse_function = element.pulse_function
+                samples_to_add = elements_length_bins[element_count]
+                if pulse_function:
+                    time_arr = (offset_bin + np.arange(
+                        samples_to_add, dtype='float64')) / sample_rate
+                for chnl in digital_high:
+                    digital_samples[chnl][array_write_index:array_write_index + samples_to_add] = \
+                        digital_high[chnl]
+                for chnl in pulse_function:
+                    analog_samples[chnl][array_write_index:array_write_index + samples_to_add] = \
+                        pulse_function[chnl].get_samples(time_arr) / (analog_amplitudes[chnl] / 2)
+                if pulse_function:
+                    del time_arr
+                array_write_index += samples_to_add
+                if ensemble.rotating_frame:
+                    offset_bin += samples_to_add
+                element_count += 1
+    return offset_bin
+
+
+def sample_compiled(ensemble, blocks, elements_length_bins, sample_rate, analog_amplitudes,
+                    analog_samples, digital_samples, offset_bin=0):
+    """ Sampling with the compiled sampling plan (single chunk) """
+    sampler = EnsembleSampler(ensemble=ensemble,
+                              blocks=blocks,
+                              elements_length_bins=elements_length_bins,
+                              sample_rate=sample_rate,
+                              analog_amplitudes=analog_amplitudes,
+                              offset_bin=offset_bin)
+    sampler.fill_chunk(0, analog_samples, digital_samples)
+    return sampler.final_offset_bin
+
+
+def allocate_samples(ensemble, blocks, number_of_samples):
+    element = blocks[ensemble.block_list[0][0]].element_list[0]
+    analog_samples = {chnl: np.empty(number_of_samples, dtype='float32')
+                      for chnl in element.pulse_function}
+    digital_samples = {chnl: np.empty(number_of_samples, dtype=bool)
+                       for chnl in element.digital_high}
+    return analog_samples, digital_samples
+
+
+def run_benchmark(repetitions=3):
+    SamplingFunctions.import_sampling_functions(
+        [os.path.join(path_of_qudi, 'logic', 'pulsed', 'sampling_function_defs')])
+    logic = BenchmarkSequenceGenerator()
+    generator = PulseObjectGenerator(sequencegeneratorlogic=logic)
+    sample_rate = logic.pulse_generator_settings['sample_rate']
+    amplitudes = logic.pulse_generator_settings['analog_levels'][0]
+
+    print('{0:>14s} {1:>10s} {2:>12s} {3:>12s} {4:>12s} {5:>8s} {6:>6s}'.format(
+        'method', 'elements', 'samples', 'loop [s]', 'compiled [s]', 'speedup', 'equal'))
+    for method_name, kwargs in BENCHMARK_METHODS:
+        if method_name not in generator.predefined_generate_methods:
+            print('{0:>14s} not found, skipped'.format(method_name))
+            continue
+        blocks, ensembles, _ = generator.predefined_generate_methods[method_name](**kwargs)
+        for block in blocks:
+            logic.save_block(block)
+        ensemble = ensembles[0]
+        lengths = get_elements_length_bins(ensemble, logic.blocks, sample_rate)
+        number_of_samples = int(np.sum(lengths))
+
+        results = list()
+        for sample_func in (sample_reference, sample_compiled):
+            analog, digital = allocate_samples(ensemble, logic.blocks, number_of_samples)
+            timings = list()
+            for ii in range(repetitions):
+                start = time.perf_counter()
+                sample_func(ensemble, logic.blocks, lengths, sample_rate, amplitudes, analog,
+                            digital)
+                timings.append(time.perf_counter() - start)
+            results.append((min(timings), analog, digital))
+
+        (t_loop, ref_analog, ref_digital), (t_compiled, new_analog, new_digital) = results
+        equal = all(np.array_equal(ref_analog[ch], new_analog[ch]) for ch in ref_analog) and \
+            all(np.array_equal(ref_digital[ch], new_digital[ch]) for ch in ref_digital)
+        print('{0:>14s} {1:>10d} {2:>12d} {3:>12.4f} {4:>12.4f} {5:>8.1f} {6:>6s}'.format(
+            method_name, lengths.size, number_of_samples, t_loop, t_compiled,
+            t_loop / t_compiled, str(equal)))
+    return
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Startup time benchmark of the FitLogic for the module set of a qudi config file.
+
+Compares the instantiation of all FitLogic modules defined in the config file using the process
+wide registry of fit methods (logic.fit_logic.FitMethodRegistry, methods are imported on first
+use) against the previous discovery importing all fit method files and attaching all their
+functions to FitLogic on every instantiation. Each variant runs in a fresh python process, so
+the import times are included. The FitLogic modules are instantiated once per logic module
+connecting to them, which is the worst case of the previous implementation.
+This script is standalone and does not need a running qudi instance.
+
+Usage (from the qudi main directory):
+    python tools/benchmark_fit_logic_startup.py [config file]
+    e.g. python tools/benchmark_fit_logic_startup.py config/default.cfg
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import sys
+import time
+import json
+import inspect
+import importlib
+import subprocess
+
+path_of_qudi = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if path_of_qudi not in sys.path:
+    sys.path.insert(0, path_of_qudi)
+
+
+class BenchmarkManager:
+    """ Minimal stand-in for the qudi manager needed by FitLogic """
+    tm = None
+
+
+def fit_logic_modules(config_file):
+    """ Configurations of the FitLogic modules in a config file and the number of logic modules
+    connecting to each of them.
+
+    @return list: (module name, module config, number of connected modules) tuples
+    """
+    from core.config import load
+    logic_config = load(config_file).get('logic', dict())
+    modules = list()
+    for name, module_config in logic_config.items():
+        if module_config.get('module.Class') != 'fit_logic.FitLogic':
+            continue
+        connected = sum(1 for other in logic_config.values()
+                        if name in (other.get('connect') or dict()).values())
+        options = {key: value for key, value in module_config.items()
+                   if key not in ('module.Class', 'connect')}
+        modules.append((name, options, connected))
+    return modules
+
+
+def eager_discovery(fit_logic_class, paths):
+    """ Previous discovery done in FitLogic.__init__: imports all fit method files and attaches
+    all functions to FitLogic.
+    """
+    for path in paths:
+        for filename in os.listdir(path):
+            if os.path.isfile(os.path.join(path, filename)) and filename.endswith('.py'):
+                if path not in sys.path:
+                    sys.path.append(path)
+                module = importlib.import_module(filename[:-3])
+                for method in dir(module):
+                    ref = getattr(module, method)
+                    if callable(ref) and (inspect.ismethod(ref) or inspect.isfunction(ref)):
+                        setattr(fit_logic_class, method, ref)
+    return
+
+
+def run_child(mode, modules):
+    """ Instantiates the FitLogic modules in this (fresh) process and prints the timings """
+    start = time.perf_counter()
+    from qtpy import QtCore
+    from logic.fit_logic import FitLogic
+    app = QtCore.QCoreApplication.instance()
+    if app is None:
+        app = QtCore.QCoreApplication(sys.argv)
+    t_import = time.perf_counter() - start
+
+    timings = list()
+    for name, options, connected in modules:
+        paths = [os.path.join(path_of_qudi, 'logic', 'fitmethods')]
+        additional = options.get('additional_fit_methods_path') or list()
+        paths.extend([additional] if isinstance(additional, str) else additional)
+        for ii in range(max(1, connected)):
+            start = time.perf_counter()
+            if mode == 'eager':
+                eager_discovery(FitLogic, paths)
+            fit_logic = FitLogic(manager=BenchmarkManager(), name=name, config=dict(options))
+            timings.append(time.perf_counter() - start)
+    imported = sum(1 for module in sys.modules if module.endswith('methods'))
+    print(json.dumps({'import': t_import, 'first': timings[0], 'rest': sum(timings[1:]),
+                      'instances': len(timings), 'imported': imported,
+                      'fits': len(fit_logic.fit_list['1d'])}))
+    return
+
+
+def run_benchmark(config_file):
+    modules = fit_logic_modules(config_file)
+    if not modules:
+        print('No FitLogic module found in {0}.'.format(config_file))
+        return
+    print('{0:>10s} {1:>10s} {2:>12s} {3:>10s} {4:>10s} {5:>10s} {6:>8s}'.format(
+        'discovery', 'instances', 'import [s]', 'first [s]', 'rest [s]', 'modules', '1d fits'))
+    for mode in ('eager', 'registry'):
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), '--child', mode, json.dumps(modules)],
+            cwd=path_of_qudi)
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        print('{0:>10s} {1:>10d} {2:>12.3f} {3:>10.4f} {4:>10.4f} {5:>10d} {6:>8d}'.format(
+            mode, result['instances'], result['import'], result['first'], result['rest'],
+            result['imported'], result['fits']))
+    return
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3 and sys.argv[1] == '--child':
+        run_child(sys.argv[2], json.loads(sys.argv[3]))
+    else:
+        run_benchmark(sys.argv[1] if len(sys.argv) > 1 else
+                      os.path.join(path_of_qudi, 'config', 'default.cfg'))
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the automatic POI detection (PoiManagerLogic.auto_catch_poi).
+
+Compares the vectorized spot detection (logic.poi_manager_logic.find_spots) against the previous
+implementation sliding the window over every pixel in python. The scan images are synthetic NV
+images generated the same way as by the dummy confocal scanner (hardware/confocal_scanner_dummy.py).
+This script is standalone and does not need a running qudi instance.
+
+Usage (from the qudi main directory):
+    python tools/benchmark_poi_detection.py [image sizes in pixels]
+    e.g. python tools/benchmark_poi_detection.py 50 100 200 500
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+path_of_qudi = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if path_of_qudi not in sys.path:
+    sys.path.insert(0, path_of_qudi)
+
+from logic.poi_manager_logic import find_spots
+
+# Default parameters of the PoiManagerLogic and the dummy scanner
+POI_THRESHOLD = 5
+POI_DIAMETER = 1.5e-6
+SCAN_RANGE = 100e-6
+NUMBER_OF_NVS = 500
+
+
+def synthetic_nv_image(pixels, seed=0):
+    """ Scan image with randomly distributed gaussian spots as created by the dummy scanner """
+    rng = np.random.RandomState(seed)
+    axis = np.linspace(0, SCAN_RANGE, pixels)
+    x, y = np.meshgrid(axis, axis, indexing='ij')
+    image = rng.uniform(0, 2e4, (pixels, pixels))
+    amplitudes = rng.normal(4e5, 1e5, NUMBER_OF_NVS)
+    x_zero = rng.uniform(0, SCAN_RANGE, NUMBER_OF_NVS)
+    y_zero = rng.uniform(0, SCAN_RANGE, NUMBER_OF_NVS)
+    sigma_x = rng.normal(0.7e-6, 0.1e-6, NUMBER_OF_NVS)
+    sigma_y = rng.normal(0.7e-6, 0.1e-6, NUMBER_OF_NVS)
+    theta = 10
+    for amp, x0, y0, sx, sy in zip(amplitudes, x_zero, y_zero, sigma_x, sigma_y):
+        a = np.cos(theta) ** 2 / (2 * sx ** 2) + np.sin(theta) ** 2 / (2 * sy ** 2)
+        b = -np.sin(2 * theta) / (4 * sx ** 2) + np.sin(2 * theta) / (4 * sy ** 2)
+        c = np.sin(theta) ** 2 / (2 * sx ** 2) + np.cos(theta) ** 2 / (2 * sy ** 2)
+        image += amp * np.exp(-(a * (x - x0) ** 2 + 2 * b * (x - x0) * (y - y0) +
+                                c * (y - y0) ** 2))
+    return np.trunc(image)
+
+
+def filter_size(pixels):
+    """ Window size as calculated by PoiManagerLogic._spot_filter """
+    return int(POI_DIAMETER / (SCAN_RANGE / pixels))
+
+
+def is_spot_shape_reference(local_arr):
+    """ Previous PoiManagerLogic._is_spot_shape """
+    unspot_e = 0
+    ensem_e = 0
+    len_arr = len(local_arr)
+    mid_f = int(0.5 * len_arr)
+    hm_local_arr = local_arr[mid_f].mean()
+    vm_local_arr = local_arr[:, mid_f].mean()
+    for i in range(0, len_arr):
+        if local_arr[i].mean() > hm_local_arr:
+            ensem_e += 1
+        if local_arr[:, i].mean() > vm_local_arr:
+            ensem_e += 1
+        if hm_local_arr > vm_local_arr * 1.2:
+            unspot_e += 1
+        if vm_local_arr > hm_local_arr * 1.2:
+            unspot_e += 1
+    if ensem_e > 4:
+        return False
+    elif unspot_e > 1:
+        return False
+    else:
+        return True
+
+
+def detect_reference(scan):
+    """ Previous PoiManagerLogic._local_max and threshold in auto_catch_poi """
+    size = filter_size(len(scan))
+    scan_m = scan.mean()
+    mid_f = int(size / 2)
+    xc = []
+    yc = []
+    for i in range(0, len(scan) - size):
+        for j in range(0, len(scan[i]) - size):
+            local_arr = scan[i:i + size, j:j + size]
+            arr_threshold = scan_m * POI_THRESHOLD * 0.5
+            if scan[i + mid_f][j + mid_f] == local_arr.max() and \
+                    is_spot_shape_reference(local_arr) and local_arr.mean() > arr_threshold:
+                xc.append(i + mid_f)
+                yc.append(j + mid_f)
+    threshold = scan_m * POI_THRESHOLD
+    return [(x, y) for x, y in zip(xc, yc) if scan[x, y] > threshold]
+
+
+def detect_vectorized(scan):
+    """ Vectorized detection as done in PoiManagerLogic.auto_catch_poi """
+    xc, yc = find_spots(scan,
+                        filter_size=filter_size(len(scan)),
+                        window_threshold=scan.mean() * POI_THRESHOLD * 0.5)
+    threshold = scan.mean() * POI_THRESHOLD
+    return [(x, y) for x, y in zip(xc, yc) if scan[x, y] > threshold]
+
+
+def run_benchmark(sizes):
+    print('{0:>8s} {1:>8s} {2:>8s} {3:>12s} {4:>14s} {5:>10s} {6:>6s}'.format(
+        'pixels', 'window', 'pois', 'loop [s]', 'vectorized [s]', 'speedup', 'equal'))
+    for pixels in sizes:
+        scan = synthetic_nv_image(pixels)
+
+        start = time.perf_counter()
+        reference = detect_reference(scan)
+        t_loop = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = detect_vectorized(scan)
+        t_vectorized = time.perf_counter() - start
+
+        print('{0:>8d} {1:>8d} {2:>8d} {3:>12.4f} {4:>14.4f} {5:>10.1f} {6:>6s}'.format(
+            pixels, filter_size(pixels), len(result), t_loop, t_vectorized,
+            t_loop / t_vectorized, str(reference == result)))
+    return
+
+
+if __name__ == '__main__':
+    image_sizes = [int(arg) for arg in sys.argv[1:]] if len(sys.argv) > 1 else [100, 200, 300]
+    run_benchmark(image_sizes)
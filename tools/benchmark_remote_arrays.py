@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput benchmark of the transfer of numpy arrays from remote qudi modules (core.remote).
+
+Starts the module server of core.remote.RemoteObjectManager in a separate process on this host
+sharing a module that returns arrays of a given size. The arrays are then transferred with
+  - rpyc.utils.classic.obtain (pickling, the previous implementation of netobtain)
+  - the binary framing used by netobtain for connections to other hosts
+  - shared memory as used by netobtain for connections on the same host
+This script is standalone and does not need a running qudi instance.
+
+Usage (from the qudi main directory):
+    python tools/benchmark_remote_arrays.py [array sizes in MB]
+    e.g. python tools/benchmark_remote_arrays.py 0.1 1 10 100
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import sys
+import time
+import socket
+import multiprocessing
+import numpy as np
+
+path_of_qudi = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if path_of_qudi not in sys.path:
+    sys.path.insert(0, path_of_qudi)
+
+import rpyc
+import rpyc.utils.classic
+from rpyc.utils.server import ThreadedServer
+
+from core.util.network import netobtain, import_object, _get_transport
+
+MODULE_NAME = 'benchmark_module'
+
+
+class BenchmarkModule:
+    """ Stand-in for a hardware module returning data arrays (e.g. a fast counter) """
+    def __init__(self):
+        self._data = dict()
+
+    def get_data_trace(self, number_of_bytes):
+        number_of_bytes = int(number_of_bytes)
+        if number_of_bytes not in self._data:
+            self._data[number_of_bytes] = np.random.randint(
+                0, 1000, number_of_bytes // 8, dtype='int64')
+        return self._data[number_of_bytes]
+
+
+class BenchmarkManager:
+    """ Minimal stand-in for the qudi manager needed by RemoteObjectManager """
+    tm = None
+    tree = {'defined': {'hardware': dict(), 'logic': dict(), 'gui': dict()}}
+
+
+def serve(port):
+    from core.remote import RemoteObjectManager
+    remote_manager = RemoteObjectManager(BenchmarkManager())
+    remote_manager.shareModule(MODULE_NAME, BenchmarkModule())
+    server = ThreadedServer(remote_manager.makeRemoteService(),
+                            hostname='localhost',
+                            port=port,
+                            protocol_config={'allow_all_attrs': True})
+    server.start()
+
+
+def get_free_port():
+    sock = socket.socket()
+    sock.bind(('localhost', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def connect(port, timeout=10):
+    start = time.time()
+    while True:
+        try:
+            return rpyc.connect('localhost', port, config={'allow_all_attrs': True})
+        except ConnectionRefusedError:
+            if time.time() - start > timeout:
+                raise
+            time.sleep(0.1)
+
+
+def best_time(func, repetitions):
+    timings = list()
+    result = None
+    for ii in range(repetitions):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def run_benchmark(sizes_mb, repetitions=5):
+    port = get_free_port()
+    server = multiprocessing.Process(target=serve, args=(port,), daemon=True)
+    server.start()
+    try:
+        connection = connect(port)
+        module = connection.root.getModule(MODULE_NAME)
+        export_function, shared_memory = _get_transport(module)
+        if not shared_memory:
+            print('Shared memory not available, the shared memory column uses netobtain anyway.')
+
+        print('{0:>10s} {1:>14s} {2:>14s} {3:>14s} {4:>8s} {5:>6s}'.format(
+            'size [MB]', 'pickle [MB/s]', 'binary [MB/s]', 'shm [MB/s]', 'speedup', 'equal'))
+        for size_mb in sizes_mb:
+            number_of_bytes = int(size_mb * 1024 ** 2)
+            t_pickle, reference = best_time(lambda: rpyc.utils.classic.obtain(
+                module.get_data_trace(number_of_bytes)), repetitions)
+            t_binary, binary = best_time(lambda: import_object(export_function(
+                module.get_data_trace(number_of_bytes), False)), repetitions)
+            t_shared, shared = best_time(lambda: netobtain(
+                module.get_data_trace(number_of_bytes)), repetitions)
+            equal = np.array_equal(reference, binary) and np.array_equal(reference, shared)
+            print('{0:>10.2f} {1:>14.1f} {2:>14.1f} {3:>14.1f} {4:>8.1f} {5:>6s}'.format(
+                size_mb, size_mb / t_pickle, size_mb / t_binary, size_mb / t_shared,
+                t_pickle / t_shared, str(equal)))
+        connection.close()
+    finally:
+        server.terminate()
+        server.join()
+    return
+
+
+if __name__ == '__main__':
+    array_sizes = [float(arg) for arg in sys.argv[1:]] if len(sys.argv) > 1 else [0.1, 1, 10, 100]
+    run_benchmark(array_sizes)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark of the sampling functions used by the pulsed sequence generation.
+
+Compares the evaluation into the float32 sample chunk via SamplingBase.get_samples_into against
+the previous evaluation via get_samples followed by the division by the analog amplitude and the
+cast to float32, for all registered sampling functions. In addition the I/Q case (two channels
+sampled with the same frequency) is benchmarked with and without a shared SamplingWorkspace.
+This script is standalone and does not need a running qudi instance.
+
+Usage (from the qudi main directory):
+    python tools/benchmark_sampling_functions.py [number of samples]
+    e.g. python tools/benchmark_sampling_functions.py 10000 1000000
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+path_of_qudi = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if path_of_qudi not in sys.path:
+    sys.path.insert(0, path_of_qudi)
+
+from logic.pulsed.sampling_functions import SamplingFunctions, SamplingWorkspace
+
+SAMPLE_RATE = 1.25e9
+# Analog channel amplitude (Vpp) the samples are normalized to
+AMPLITUDE = 1.0
+# Parameter values used instead of the defaults (amplitudes default to 0 V)
+PARAMETERS = {'amplitude': 0.25, 'amplitude_1': 0.25, 'amplitude_2': 0.1, 'amplitude_3': 0.05,
+              'voltage': 0.1, 'frequency_2': 2.9e9, 'frequency_3': 100e6, 'phase_2': 30.0,
+              'stop_freq': 2.97e9}
+
+
+def create_sampling_function(name, **kwargs):
+    params = {param: PARAMETERS.get(param, definition['init'])
+              for param, definition in SamplingFunctions.parameters[name].items()}
+    params.update(kwargs)
+    return getattr(SamplingFunctions, name)(**params)
+
+
+def best_time(func, repetitions):
+    timings = list()
+    for ii in range(repetitions):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run_benchmark(sizes, repetitions=5):
+    SamplingFunctions.import_sampling_functions(
+        [os.path.join(path_of_qudi, 'logic', 'pulsed', 'sampling_function_defs')])
+    scale = AMPLITUDE / 2
+
+    print('{0:>18s} {1:>10s} {2:>14s} {3:>12s} {4:>8s} {5:>6s}'.format(
+        'function', 'samples', 'get_samples [s]', 'into [s]', 'speedup', 'equal'))
+    for number_of_samples in sizes:
+        time_array = (100 + np.arange(number_of_samples, dtype='float64')) / SAMPLE_RATE
+        reference = np.empty(number_of_samples, dtype='float32')
+        result = np.empty(number_of_samples, dtype='float32')
+        workspace = SamplingWorkspace()
+        for name in sorted(SamplingFunctions.parameters):
+            if name == 'AllenEberlyChirp':
+                # Truncation ratio of 0.1 independent of the pulse length
+                func = create_sampling_function(
+                    name, tau_pulse=0.1 * number_of_samples / SAMPLE_RATE)
+            else:
+                func = create_sampling_function(name)
+
+            def sample_reference():
+                np.divide(func.get_samples(time_array), scale, out=reference, casting='unsafe')
+
+            def sample_into():
+                workspace.reset(time_array)
+                func.get_samples_into(time_array, out=result, scale=scale, workspace=workspace)
+
+            t_reference = best_time(sample_reference, repetitions)
+            t_into = best_time(sample_into, repetitions)
+            print('{0:>18s} {1:>10d} {2:>14.5f} {3:>12.5f} {4:>8.1f} {5:>6s}'.format(
+                name, number_of_samples, t_reference, t_into, t_reference / t_into,
+                str(np.array_equal(reference, result))))
+
+        # I/Q channels with the same frequency sharing the phase computation
+        if 'Sin' not in SamplingFunctions.parameters:
+            continue
+        i_func = create_sampling_function('Sin', phase=0.0)
+        q_func = create_sampling_function('Sin', phase=90.0)
+        i_reference = np.empty(number_of_samples, dtype='float32')
+        q_reference = np.empty(number_of_samples, dtype='float32')
+        i_result = np.empty(number_of_samples, dtype='float32')
+        q_result = np.empty(number_of_samples, dtype='float32')
+
+        def sample_iq_reference():
+            np.divide(i_func.get_samples(time_array), scale, out=i_reference, casting='unsafe')
+            np.divide(q_func.get_samples(time_array), scale, out=q_reference, casting='unsafe')
+
+        def sample_iq_shared():
+            workspace.reset(time_array)
+            i_func.get_samples_into(time_array, out=i_result, scale=scale, workspace=workspace)
+            q_func.get_samples_into(time_array, out=q_result, scale=scale, workspace=workspace)
+
+        t_reference = best_time(sample_iq_reference, repetitions)
+        t_into = best_time(sample_iq_shared, repetitions)
+        equal = np.array_equal(i_reference, i_result) and np.array_equal(q_reference, q_result)
+        print('{0:>18s} {1:>10d} {2:>14.5f} {3:>12.5f} {4:>8.1f} {5:>6s}'.format(
+            'Sin I/Q (shared)', number_of_samples, t_reference, t_into, t_reference / t_into,
+            str(equal)))
+    return
+
+
+if __name__ == '__main__':
+    sample_numbers = [int(arg) for arg in sys.argv[1:]] if len(sys.argv) > 1 else [10000, 1000000]
+    run_benchmark(sample_numbers)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark and check of the PicoHarp300 TTTR record decoder and histogrammer
+(hardware.picoquant.tttr_decoder).
+
+Synthetic T2 and T3 record streams (photons on several channels, sync pulses, external markers
+and time tag overflows) are decoded and histogrammed in buffers of the size of the PicoHarp300
+FiFo reads (TTREADMAX records). The results are compared to a record by record decoding as done
+in the PicoQuant demo code, which also serves as speed reference.
+This script is standalone and does not need a device or a running qudi instance.
+
+Usage (from the qudi main directory):
+    python tools/benchmark_tttr_decoder.py [number of records]
+    e.g. python tools/benchmark_tttr_decoder.py 100000 1000000
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+path_of_qudi = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if path_of_qudi not in sys.path:
+    sys.path.insert(0, path_of_qudi)
+
+from hardware.picoquant.tttr_decoder import TTTRHistogrammer, MODE_T2, MODE_T3, T2_WRAPAROUND
+from hardware.picoquant.tttr_decoder import T3_WRAPAROUND, T2_RESOLUTION
+
+TTREADMAX = 131072
+T3_RESOLUTION = 16e-12
+SYNC_PERIOD = 2e-6
+
+
+def synthetic_records(mode, number_of_records, seed=0):
+    """ Random record stream with photons on channels 1 to 3, markers and overflows.
+    In T2 mode every fourth event is a sync pulse on channel 0.
+
+    @return numpy.ndarray: 1D array of records (dtype uint32)
+    """
+    rng = np.random.RandomState(seed)
+    n = number_of_records
+    channel = rng.randint(1, 4, n).astype(np.uint32)
+    if mode == MODE_T2:
+        wraparound = T2_WRAPAROUND
+        # Sync pulses every SYNC_PERIOD, photons at random times in between
+        syncs = n // 4
+        sync_times = np.arange(syncs, dtype=np.int64) * int(SYNC_PERIOD / T2_RESOLUTION)
+        photon_times = rng.randint(0, int(syncs * SYNC_PERIOD / T2_RESOLUTION), n - syncs)
+        times = np.concatenate((sync_times, photon_times))
+        channel = np.concatenate((np.zeros(syncs, dtype=np.uint32), channel[syncs:]))
+        order = np.argsort(times, kind='mergesort')
+        times, channel = times[order], channel[order]
+        low_bits = times % wraparound
+    else:
+        wraparound = T3_WRAPAROUND
+        # Several photons per sync pulse on average, some sync periods without photons
+        times = np.cumsum(rng.poisson(0.7, n)).astype(np.int64)
+        low_bits = (rng.randint(0, 4096, n).astype(np.int64) << 16) | (times % wraparound)
+    # About 2% of the events are external markers
+    marker = rng.rand(n) < 0.02
+    channel[marker] = 15
+    marker_bits = rng.randint(1, 16, n)
+    if mode == MODE_T2:
+        low_bits[marker] = (low_bits[marker] & ~0xF) | marker_bits[marker]
+    else:
+        low_bits[marker] = (low_bits[marker] & 0xFFFF) | (marker_bits[marker] << 16)
+    records = (channel.astype(np.int64) << 28) | low_bits
+
+    # Insert an overflow record before the first event after each wraparound
+    overflows = np.diff(np.concatenate(([0], times // wraparound)))
+    positions = np.repeat(np.arange(n), overflows)
+    records = np.insert(records, positions, 15 << 28)
+    return records.astype(np.uint32)
+
+
+def reference_histogram(mode, records, resolution, bin_width, number_of_bins, number_of_gates):
+    """ Record by record decoding and histogramming (as in the PicoQuant demo code) """
+    wraparound = T2_WRAPAROUND if mode == MODE_T2 else T3_WRAPAROUND
+    histogram = np.zeros((max(1, number_of_gates), number_of_bins), dtype=np.int64)
+    overflow_time = 0
+    last_sync = -1
+    syncs = 0
+    for record in records.tolist():
+        channel = record >> 28
+        if mode == MODE_T2:
+            timetag = record & 0x0FFFFFFF
+            low_bits = record & 0xF
+        else:
+            timetag = record & 0xFFFF
+            dtime = (record >> 16) & 0x0FFF
+            low_bits = dtime & 0xF
+        if channel == 15:
+            if low_bits == 0:
+                overflow_time += wraparound
+            continue
+        true_time = overflow_time + timetag
+        if mode == MODE_T2:
+            if channel == 0:
+                last_sync = true_time
+                syncs += 1
+                continue
+            if last_sync < 0:
+                continue
+            delay = true_time - last_sync
+            sync_number = syncs - 1
+        else:
+            delay = dtime
+            sync_number = true_time
+        time_bin = int(np.floor(delay * (resolution / bin_width)))
+        if 0 <= time_bin < number_of_bins:
+            gate = sync_number % number_of_gates if number_of_gates else 0
+            histogram[gate, time_bin] += 1
+    return histogram if number_of_gates else histogram[0]
+
+
+def run_benchmark(sizes):
+    print('{0:>5s} {1:>6s} {2:>10s} {3:>14s} {4:>16s} {5:>8s} {6:>6s}'.format(
+        'mode', 'gates', 'records', 'loop [rec/s]', 'vector [rec/s]', 'speedup', 'equal'))
+    for mode in (MODE_T2, MODE_T3):
+        resolution = T2_RESOLUTION if mode == MODE_T2 else T3_RESOLUTION
+        for number_of_gates in (0, 10):
+            for number_of_records in sizes:
+                records = synthetic_records(mode, number_of_records)
+                settings = {'mode': mode,
+                            'resolution': resolution,
+                            'bin_width': 1e-9,
+                            'number_of_bins': 2000 if mode == MODE_T2 else 60,
+                            'number_of_gates': number_of_gates}
+
+                histogrammer = TTTRHistogrammer(**settings)
+                start = time.perf_counter()
+                for offset in range(0, records.size, TTREADMAX):
+                    histogrammer.add_records(records[offset:offset + TTREADMAX])
+                data, info_dict = histogrammer.get_data_trace()
+                t_vector = time.perf_counter() - start
+
+                start = time.perf_counter()
+                reference = reference_histogram(records=records, **settings)
+                t_loop = time.perf_counter() - start
+
+                print('{0:>5s} {1:>6d} {2:>10d} {3:>14.3g} {4:>16.3g} {5:>8.1f} {6:>6s}'.format(
+                    'T{0:d}'.format(mode), number_of_gates, records.size, records.size / t_loop,
+                    records.size / t_vector, t_loop / t_vector,
+                    str(np.array_equal(data, reference))))
+    return
+
+
+if __name__ == '__main__':
+    record_numbers = [int(arg) for arg in sys.argv[1:]] if len(sys.argv) > 1 else [100000, 1000000]
+    run_benchmark(record_numbers)